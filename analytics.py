@@ -0,0 +1,156 @@
+# analytics.py
+import heapq
+from collections import Counter
+from datetime import date, timedelta
+from ranking import tokenize, entry_term_counts, STOP_WORDS
+
+
+# Entry dates are "YYYY-MM-DD"; anything else is counted but left out of weeks, months and streaks
+def parse_date(date_key):
+    try:
+        return date.fromisoformat(date_key)
+    except (TypeError, ValueError):
+        return None
+
+
+class EntryFigures:
+    """What one entry adds to the statistics, kept so an edit or delete can take it back out"""
+
+    __slots__ = ("date", "week", "month", "hour", "words", "word_counts")
+
+    def __init__(self, entry, word_counts=None):
+        self.date = entry["date"]
+        day = parse_date(self.date)
+        self.week = self.month = None
+        if day is not None:
+            year, week, _ = day.isocalendar()
+            self.week = f"{year}-W{week:02d}"
+            self.month = self.date[:7]
+        time = entry.get("time") or ""
+        self.hour = int(time[:2]) if time[:2].isdigit() else None
+        if word_counts is None:
+            word_counts = Counter(tokenize(entry["content"]))
+        self.words = sum(word_counts.values())
+        self.word_counts = word_counts
+
+
+class WritingStats:
+    """Running writing statistics of one user.
+
+    Built in one pass over the entries and then updated entry by entry on
+    every save and delete, so opening the statistics only formats totals
+    that already exist.
+    """
+
+    def __init__(self):
+        self.figures = {}  # entry id -> EntryFigures
+        self.total_words = 0
+        self.word_counts = Counter()
+        self.entries_by_day = Counter()
+        self.words_by_day = Counter()
+        self.words_by_week = Counter()
+        self.words_by_month = Counter()
+        self.entries_by_hour = [0] * 24
+
+    @classmethod
+    def from_entries(cls, entries):
+        stats = cls()
+        for entry, _, content_tf in entry_term_counts(entries):
+            stats.add(entry, content_tf)
+        return stats
+
+    @property
+    def total_entries(self):
+        return len(self.figures)
+
+    # Count an entry, replacing what it counted for before an edit
+    def add(self, entry, word_counts=None):
+        self.remove(entry["id"])
+        figures = EntryFigures(entry, word_counts)
+        self.figures[entry["id"]] = figures
+        self._apply(figures, 1)
+
+    def remove(self, entry_id):
+        figures = self.figures.pop(entry_id, None)
+        if figures is not None:
+            self._apply(figures, -1)
+
+    def _apply(self, figures, sign):
+        self.total_words += sign * figures.words
+        self.entries_by_day[figures.date] += sign
+        self.words_by_day[figures.date] += sign * figures.words
+        if figures.week is not None:
+            self.words_by_week[figures.week] += sign * figures.words
+            self.words_by_month[figures.month] += sign * figures.words
+        if figures.hour is not None:
+            self.entries_by_hour[figures.hour] += sign
+        if sign > 0:
+            self.word_counts.update(figures.word_counts)
+            return
+
+        # Drop days, periods and words that no longer count for anything
+        self.word_counts.subtract(figures.word_counts)
+        for word in figures.word_counts:
+            if self.word_counts[word] <= 0:
+                del self.word_counts[word]
+        if self.entries_by_day[figures.date] <= 0:
+            del self.entries_by_day[figures.date]
+            del self.words_by_day[figures.date]
+        for counter, key in ((self.words_by_week, figures.week), (self.words_by_month, figures.month)):
+            if key is not None and counter[key] <= 0:
+                del counter[key]
+
+    def top_words(self, n=20, skip_common=True):
+        """The n most used words as (word, count), optionally leaving out very common words"""
+        items = self.word_counts.items()
+        if skip_common:
+            items = ((word, count) for word, count in items if word not in STOP_WORDS and not word.isdigit())
+        return heapq.nsmallest(n, items, key=lambda item: (-item[1], item[0]))
+
+    def streaks(self, today=None):
+        """Current and longest runs of consecutive days with at least one entry.
+
+        Returns {"current": days, "longest": days, "longest_start": date key,
+        "longest_end": date key}. The current streak still counts if the last
+        entry was yesterday.
+        """
+        today = today or date.today()
+        days = sorted(day for day in map(parse_date, self.entries_by_day) if day is not None)
+        longest, longest_start, longest_end = 0, None, None
+        run, run_start = 0, None
+        previous = None
+        for day in days:
+            if previous is not None and day - previous == timedelta(days=1):
+                run += 1
+            else:
+                run, run_start = 1, day
+            if run > longest:
+                longest, longest_start, longest_end = run, run_start, day
+            previous = day
+
+        current = run if previous is not None and today - previous <= timedelta(days=1) else 0
+        return {
+            "current": current,
+            "longest": longest,
+            "longest_start": longest_start.isoformat() if longest_start else None,
+            "longest_end": longest_end.isoformat() if longest_end else None
+        }
+
+    # Most recent periods first, e.g. the last 12 months
+    def recent(self, counter, n):
+        return sorted(counter.items(), reverse=True)[:n]
+
+    def summary(self, today=None):
+        """All statistics in one dictionary, for the statistics view"""
+        return {
+            "total_entries": self.total_entries,
+            "total_words": self.total_words,
+            "average_words": self.total_words // max(self.total_entries, 1),
+            "days_with_entries": len(self.entries_by_day),
+            "streaks": self.streaks(today),
+            "top_words": self.top_words(),
+            "words_by_day": self.recent(self.words_by_day, 14),
+            "words_by_week": self.recent(self.words_by_week, 12),
+            "words_by_month": self.recent(self.words_by_month, 12),
+            "entries_by_hour": list(self.entries_by_hour)
+        }
@@ -0,0 +1,279 @@
+# archive.py
+import gzip
+import json
+import os
+import re
+from collections import Counter, OrderedDict
+from collections.abc import Mapping, MutableMapping
+from datetime import date
+from entry import Entry, EntrySummary, encode_entry
+from metrics import METRICS
+from ranking import tokenize, entry_term_counts
+
+
+def entry_year(entry):
+    """Year of an entry, or None for entries without an ISO date (they are never archived)"""
+    date_ord = getattr(entry, "date_ord", None)
+    return None if date_ord is None else date.fromordinal(date_ord).year
+
+
+def words_of(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def count_terms(entries):
+    return {key: [Counter(tokenize(entry["title"])), Counter(tokenize(entry["content"]))]
+            for key, entry in entries.items()}
+
+
+class ArchiveShelf:
+    """A user's archived years: one read-only, gzip-compressed segment file per year.
+
+    Next to each segment, <year>.idx.json.gz holds the summaries of its
+    entries (for the calendar, lists and date/tag indexes) and
+    <year>.words.json.gz maps each word to the entries using it (for
+    keyword search) and <year>.terms.json.gz holds each entry's word counts
+    (for building the search, statistics and related-entries indexes). The
+    summaries are read on first use; a segment's bodies only when one of
+    its entries is read, and the last max_loaded segments read stay in
+    memory.
+    """
+
+    def __init__(self, folder, max_loaded=4):
+        self.folder = folder
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()  # year -> {key: Entry}, least recently used first
+        self.words = {}  # year -> {word: [keys]}, read on the first keyword search
+        self._summaries = None  # year -> {key: EntrySummary}, read on first use
+        self._years_by_key = None
+        self.thawed = set()  # years moved back into the hot entries, whose files go once that is saved
+
+    def _path(self, year, kind):
+        return os.path.join(self.folder, f"{year}.{kind}.json.gz")
+
+    def _read(self, year, kind):
+        with gzip.open(self._path(year, kind), "rb") as f:
+            data = f.read()
+        METRICS.count("storage.archive.bytes_read", len(data))
+        return json.loads(data)
+
+    # Written under a temporary name and renamed, so a crash never leaves half a segment
+    def _write(self, year, kind, data):
+        path = self._path(year, kind)
+        with gzip.open(path + ".tmp", "wb") as f:
+            f.write(json.dumps(data, default=encode_entry).encode("utf-8"))
+        os.replace(path + ".tmp", path)
+
+    def years(self):
+        return sorted(self._index())
+
+    def _index(self):
+        if self._summaries is None:
+            self._summaries = {}
+            self._years_by_key = {}
+            names = os.listdir(self.folder) if os.path.isdir(self.folder) else ()
+            for name in names:
+                if name.endswith(".idx.json.gz"):
+                    year = int(name.split(".")[0])
+                    if year not in self.thawed:
+                        self._add_summaries(year, self._read(year, "idx"))
+        return self._summaries
+
+    def _add_summaries(self, year, summaries):
+        self._summaries[year] = {key: EntrySummary.from_dict(data) for key, data in summaries.items()}
+        for key in summaries:
+            self._years_by_key[key] = year
+
+    def keys(self):
+        self._index()
+        return self._years_by_key.keys()
+
+    def year_of(self, key):
+        self._index()
+        return self._years_by_key.get(key)
+
+    def summary(self, key):
+        year = self.year_of(key)
+        return None if year is None else self._summaries[year][key]
+
+    def entries_of(self, year):
+        """All entries of an archived year, from memory or read from its segment"""
+        entries = self.loaded.get(year)
+        if entries is None:
+            METRICS.count("storage.archive.segment_loads")
+            entries = {key: Entry.from_dict(data) for key, data in self._read(year, "entries").items()}
+            self.loaded[year] = entries
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+        else:
+            self.loaded.move_to_end(year)
+        return entries
+
+    def get(self, key):
+        year = self.year_of(key)
+        return None if year is None else self.entries_of(year).get(key)
+
+    def term_counts(self, year):
+        """{key: [title word counts, content word counts]} of an archived year's entries. Segments
+        archived before these files were written get theirs from their entries, once"""
+        if not os.path.exists(self._path(year, "terms")):
+            self._write(year, "terms", count_terms(self.entries_of(year)))
+        return self._read(year, "terms")
+
+    def write(self, year, entries):
+        """Write (or rewrite) the segment of a year and its indexes"""
+        os.makedirs(self.folder, exist_ok=True)
+        words = {}
+        for key, entry in entries.items():
+            for word in set(words_of(entry["title"]) + words_of(entry["content"])):
+                words.setdefault(word, []).append(key)
+        summaries = {key: EntrySummary.from_entry(entry).to_dict() for key, entry in entries.items()}
+        self._write(year, "entries", entries)
+        self._write(year, "words", words)
+        self._write(year, "terms", count_terms(entries))
+        self._write(year, "idx", summaries)  # last: a segment without its summaries is not listed
+        self._index()
+        self.thawed.discard(year)
+        self._add_summaries(year, summaries)
+        self.words[year] = words
+        self.loaded.pop(year, None)
+
+    def thaw(self, year):
+        """Take a year out of the archive (its entries are returned to be kept hot); the files are
+        removed by commit(), once the hot entries holding them have been saved"""
+        entries = self.entries_of(year)
+        for key in self._index().pop(year):
+            del self._years_by_key[key]
+        self.loaded.pop(year, None)
+        self.words.pop(year, None)
+        self.thawed.add(year)
+        return entries
+
+    def commit(self):
+        for year in self.thawed:
+            for kind in ("idx", "words", "terms", "entries"):
+                if os.path.exists(self._path(year, kind)):
+                    os.remove(self._path(year, kind))
+        self.thawed.clear()
+
+    def candidates(self, year, keyword):
+        """Keys of a year's entries that can contain keyword: every whole word of the keyword
+        has to be part of some word of the entry"""
+        terms = words_of(keyword)
+        if not terms:
+            return list(self._index()[year])
+        words = self.words.get(year)
+        if words is None:
+            words = self.words[year] = self._read(year, "words")
+        keys = None
+        for term in terms:
+            matching = {key for word, word_keys in words.items() if term in word for key in word_keys}
+            keys = matching if keys is None else keys & matching
+            if not keys:
+                return []
+        return sorted(keys, key=int)
+
+
+class TieredEntries(MutableMapping):
+    """A user's entries: the hot ones in the diary file plus the archived years on demand.
+
+    Reads of an archived entry load its year's segment; saving or deleting
+    one first moves its whole year back to the hot entries (segments are
+    read-only), and the tiering pass archives it again later.
+    """
+
+    def __init__(self, hot, shelf):
+        self.hot = hot
+        self.shelf = shelf
+
+    def __getitem__(self, key):
+        entry = self.hot.get(key)
+        if entry is None:
+            entry = self.shelf.get(key)
+            if entry is None:
+                raise KeyError(key)
+        return entry
+
+    def __contains__(self, key):
+        return key in self.hot or self.shelf.year_of(key) is not None
+
+    def _thaw_key(self, key):
+        year = self.shelf.year_of(key)
+        if year is not None:
+            for archived_key, entry in self.shelf.thaw(year).items():
+                self.hot.setdefault(archived_key, entry)
+
+    def __setitem__(self, key, entry):
+        if key not in self.hot:
+            self._thaw_key(key)
+        self.hot[key] = entry
+
+    def __delitem__(self, key):
+        if key not in self.hot:
+            self._thaw_key(key)
+        del self.hot[key]
+
+    def __iter__(self):
+        yield from self.hot
+        for key in list(self.shelf.keys()):
+            if key not in self.hot:
+                yield key
+
+    def __len__(self):
+        return len(self.hot) + sum(1 for key in self.shelf.keys() if key not in self.hot)
+
+    def archive_year(self, year):
+        """Move the hot entries of a year into its segment (merged with what is archived already);
+        returns how many moved. The caller saves the hot entries afterwards."""
+        keys = [key for key, entry in self.hot.items() if entry_year(entry) == year]
+        if not keys:
+            return 0
+        entries = dict(self.shelf.entries_of(year)) if year in self.shelf.years() else {}
+        entries.update((key, self.hot[key]) for key in keys)
+        self.shelf.write(year, entries)
+        for key in keys:
+            del self.hot[key]
+        return len(keys)
+
+    def term_counts(self):
+        """(entry, title word counts, content word counts) of every entry for building the search,
+        statistics and related-entries indexes: archived entries come as summaries with the counts
+        from their year's terms file, so no segment is decompressed"""
+        yield from entry_term_counts(self.hot)
+        for year in self.shelf.years():
+            for key, (title_tf, content_tf) in self.shelf.term_counts(year).items():
+                if key not in self.hot:
+                    yield self.shelf.summary(key), Counter(title_tf), Counter(content_tf)
+
+    def keyword_items(self, keyword):
+        """(key, entry) of the hot entries and of the archived ones that can contain keyword,
+        found with each archived year's word index instead of reading the whole year"""
+        yield from self.hot.items()
+        for year in self.shelf.years():
+            keys = [key for key in self.shelf.candidates(year, keyword) if key not in self.hot]
+            if keys:
+                entries = self.shelf.entries_of(year)
+                for key in keys:
+                    yield key, entries[key]
+
+
+class TieredSummaries(Mapping):
+    """Summaries of a user's entries: the hot entries serve as their own, archived ones come from
+    the segment indexes, so nothing archived is decompressed to list or index it"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __getitem__(self, key):
+        entry = self.entries.hot.get(key)
+        if entry is None:
+            entry = self.entries.shelf.summary(key)
+            if entry is None:
+                raise KeyError(key)
+        return entry
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
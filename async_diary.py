@@ -0,0 +1,109 @@
+# async_diary.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from diary import Diary
+from locks import ReadWriteLock
+
+
+class AsyncDiary:
+    """Awaitable facade over Diary for asyncio applications.
+
+    Every Diary call runs on a thread pool, so file I/O never blocks the
+    event loop. Identical reads of one user's data that overlap share one
+    call, and writes go through a per-user asyncio.Lock, so one user's
+    saves stay in order without holding up other users. Underneath, a
+    reader/writer lock keeps pool threads from reading while a save
+    rewrites the shared data, and a user's indexes are built under the
+    write lock before the first read, so shared reads only look them up.
+    """
+
+    def __init__(self, diary=None, executor=None, max_workers=4):
+        self.diary = diary if diary is not None else Diary()
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-diary")
+        self.lock = ReadWriteLock()
+        self._user_locks = {}  # username -> asyncio.Lock for that user's writes
+        self._inflight = {}  # (username, operation, args) -> future of the read being run
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Waiting for the pool's threads to finish would block the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+
+    def _locked_read(self, username, action, *args):
+        while True:
+            with self.lock.reading():
+                if username not in self.diary.store.users or self.diary.indexes_built(username):
+                    return action(*args)
+            # Building indexes changes the Diary, so it is done alone
+            with self.lock.writing():
+                self.diary.build_indexes(username)
+
+    def _locked_write(self, action, *args):
+        with self.lock.writing():
+            return action(*args)
+
+    # Run a read on the pool, or join the identical read that is already running
+    async def _read(self, username, operation, action, *args):
+        key = (username, operation, args)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self._locked_read, username, action, *args)
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
+        # shield: one caller being cancelled must not cancel the read for the others
+        return await asyncio.shield(future)
+
+    async def _write(self, username, action, *args):
+        lock = self._user_locks.setdefault(username, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self.executor, self._locked_write, action, *args)
+            finally:
+                # Reads started before this write must not be shared with reads that come after it
+                for key in [key for key in self._inflight if key[0] == username]:
+                    del self._inflight[key]
+
+    async def add_user(self, username, password):
+        await self._write(username, self.diary.store.add_user, username, password)
+
+    async def validate_user(self, username, password):
+        return await self._read(username, "validate_user", self.diary.store.validate_user, username, password)
+
+    async def create_entry(self, entry, username):
+        """Add or update an entry and return its id"""
+        return await self._write(username, self.diary.create_entry, entry, username)
+
+    async def delete_entry(self, entry_id, username):
+        return await self._write(username, self.diary.delete_entry, entry_id, username)
+
+    async def get_entry(self, entry_id, username):
+        return await self._read(username, "get_entry", self.diary.get_entry, entry_id, username)
+
+    async def list_entries(self, username):
+        """All entries of a user, in date order"""
+        return await self._read(username, "list_entries", self._sorted_entries, username)
+
+    def _sorted_entries(self, username):
+        return sorted(self.diary.store.list_entries(username).values(), key=lambda e: (e["date"], e["id"]))
+
+    async def entries_on(self, date_key, username):
+        return await self._read(username, "entries_on", self.diary.entries_on, date_key, username)
+
+    async def search(self, username, keyword=None, tag_query=None, date=None, date_type=None):
+        return await self._read(username, "search", self.diary.search, username, keyword, tag_query, date, date_type)
+
+    async def search_ranked(self, query, username, limit=None):
+        return await self._read(username, "search_ranked", self.diary.search_ranked, query, username, limit)
+
+    async def stats(self, username):
+        """Summary of the user's writing statistics"""
+        return await self._read(username, "stats", lambda: self.diary.stats(username).summary())
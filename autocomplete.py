@@ -0,0 +1,86 @@
+# autocomplete.py
+import bisect
+import re
+
+WORD_START_PATTERN = re.compile(r"\w+")
+
+
+# The parts of a title a prefix can match: the whole title and the rest of it from every word on
+def title_keys(title):
+    lowered = (title or "").strip().lower()
+    keys = []
+    for match in WORD_START_PATTERN.finditer(lowered):
+        key = lowered[match.start():]
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+class TitleIndex:
+    """Sorted (key, entry id) array over one user's entry titles, for autocomplete.
+
+    Every title is filed under itself and under the rest of the title from
+    each of its words, so "tast" completes "Coffee tasting" as well as
+    "Tasting notes". A lookup is a bisect to the first key with the prefix
+    and a short scan from there.
+    """
+
+    def __init__(self):
+        self.keys = []  # sorted (key, entry id) pairs
+        self.titles = {}  # entry id -> title as written
+
+    @classmethod
+    def from_entries(cls, entries):
+        index = cls()
+        pairs = []
+        for entry in entries.values():
+            keys = title_keys(entry["title"])
+            if keys:
+                index.titles[entry["id"]] = entry["title"]
+                pairs.extend((key, entry["id"]) for key in keys)
+        index.keys = sorted(pairs)
+        return index
+
+    # Index an entry's title, replacing its previous title
+    def add(self, entry_id, title):
+        self.remove(entry_id)
+        if not title_keys(title):
+            return
+        self.titles[entry_id] = title
+        for key in title_keys(title):
+            bisect.insort(self.keys, (key, entry_id))
+
+    def remove(self, entry_id):
+        title = self.titles.pop(entry_id, None)
+        if title is None:
+            return
+        for key in title_keys(title):
+            position = bisect.bisect_left(self.keys, (key, entry_id))
+            if position < len(self.keys) and self.keys[position] == (key, entry_id):
+                del self.keys[position]
+
+    def complete(self, prefix, limit=10):
+        """Ids of up to `limit` entries whose title (or a word in it) starts with prefix.
+
+        Titles that start with the prefix come first, then alphabetical order.
+        """
+        prefix = (prefix or "").strip().lower()
+        if not prefix:
+            return []
+
+        position = bisect.bisect_left(self.keys, (prefix,))
+        found = []
+        seen = set()
+        # Look a little further than `limit`, so whole-title matches can be put first
+        while position < len(self.keys) and len(found) < limit * 4:
+            key, entry_id = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            if entry_id not in seen:
+                seen.add(entry_id)
+                found.append(entry_id)
+            position += 1
+
+        found.sort(key=lambda entry_id: (not self.titles[entry_id].lower().startswith(prefix),
+                                         self.titles[entry_id].lower(), entry_id))
+        return found[:limit]
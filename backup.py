@@ -0,0 +1,229 @@
+# backup.py
+import argparse
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+from entry import Entry
+from metrics import METRICS, timed
+
+
+def canonical_bytes(data):
+    """The same JSON bytes for equal data, whatever the key order"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def entry_data(entry):
+    return entry.to_dict() if isinstance(entry, Entry) else dict(entry)
+
+
+class BackupStore:
+    """Incremental, deduplicated backups of a diary.
+
+    Every entry (and every user's revision history) is stored once as a
+    zlib-compressed object named by the SHA-256 of its JSON, under
+    objects/ab/cdef.... A snapshot is a small manifest in snapshots/ that
+    maps each user's entry keys to object hashes, so an entry that did not
+    change since the last snapshot costs only its hash in the new manifest.
+    index.json keeps one summary line per snapshot for listing without
+    opening the manifests. prune() drops old snapshots and then deletes the
+    objects no remaining snapshot refers to.
+    """
+
+    def __init__(self, folder="diary_backups"):
+        self.folder = folder
+        self._index = None
+
+    def _object_path(self, digest):
+        return os.path.join(self.folder, "objects", digest[:2], digest[2:])
+
+    def _manifest_path(self, snapshot_id):
+        return os.path.join(self.folder, "snapshots", f"{snapshot_id}.json")
+
+    @property
+    def index_filename(self):
+        return os.path.join(self.folder, "index.json")
+
+    # Files are written to a temporary name and renamed, so a crash never leaves half an object
+    def _write_file(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def put_object(self, data):
+        """Store data (JSON-able) unless an identical object exists; returns (hash, bytes written)"""
+        raw = canonical_bytes(data)
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        packed = zlib.compress(raw, 6)
+        self._write_file(path, packed)
+        METRICS.count("backup.bytes_written", len(packed))
+        return digest, len(packed)
+
+    def get_object(self, digest):
+        with open(self._object_path(digest), "rb") as f:
+            return json.loads(zlib.decompress(f.read()))
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_filename, "r") as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = []
+        return self._index
+
+    def _save_index(self):
+        self._write_file(self.index_filename, json.dumps(self._index, indent=4).encode("utf-8"))
+
+    @timed("backup.snapshot")
+    def snapshot(self, store, label=""):
+        """Back up every user of a storage, writing only objects not stored yet; returns the snapshot summary"""
+        created = datetime.now()
+        snapshot_id = created.strftime("%Y%m%d-%H%M%S-%f")
+        users = {}
+        new_objects = new_bytes = entry_count = 0
+        for username in list(store.users):
+            record = store.users[username]
+            entries = {}
+            for key, entry in store.list_entries(username).items():
+                digest, written = self.put_object(entry_data(entry))
+                entries[key] = digest
+                new_objects += written > 0
+                new_bytes += written
+            revisions_digest, written = self.put_object(record.get("revisions", {}))
+            new_objects += written > 0
+            new_bytes += written
+            entry_count += len(entries)
+            users[username] = {
+                "password": record.get("password"),
+                "next_id": record.get("next_id", 1),
+                "revisions": revisions_digest,
+                "entries": entries
+            }
+
+        manifest = {"id": snapshot_id, "created": created.isoformat(timespec="seconds"), "label": label,
+                    "source": getattr(store, "filename", ""), "users": users}
+        self._write_file(self._manifest_path(snapshot_id), json.dumps(manifest).encode("utf-8"))
+        summary = {"id": snapshot_id, "created": manifest["created"], "label": label, "users": len(users),
+                   "entries": entry_count, "new_objects": new_objects, "new_bytes": new_bytes}
+        self._load_index().append(summary)
+        self._save_index()
+        return summary
+
+    def list_snapshots(self):
+        """Summaries of all snapshots, oldest first, read from the index alone"""
+        return list(self._load_index())
+
+    def manifest(self, snapshot_id):
+        with open(self._manifest_path(snapshot_id), "r") as f:
+            return json.load(f)
+
+    def read_entries(self, snapshot_id, username, date=None):
+        """key -> entry of one user in a snapshot, optionally only those written on one date"""
+        user = self.manifest(snapshot_id)["users"].get(username)
+        if user is None:
+            raise KeyError(f"No user {username!r} in snapshot {snapshot_id}")
+        entries = {key: self.get_object(digest) for key, digest in user["entries"].items()}
+        if date is not None:
+            entries = {key: entry for key, entry in entries.items() if entry.get("date") == date}
+        return entries
+
+    @timed("backup.restore")
+    def restore(self, snapshot_id, diary, username, date=None):
+        """Put a user's entries (or only those of one date) back as they were in a snapshot.
+
+        Entries written since then on the restored user or date are removed;
+        everything replaced or removed stays in the revision history.
+        Returns the number of entries restored.
+        """
+        user = self.manifest(snapshot_id)["users"].get(username)
+        if user is None:
+            raise KeyError(f"No user {username!r} in snapshot {snapshot_id}")
+        if username not in diary.store.users:
+            diary.store.add_user(username, user["password"])
+        restored = self.read_entries(snapshot_id, username, date)
+        if date is None:
+            current = list(diary.store.list_entries(username))
+        else:
+            current = [str(summary["id"]) for summary in diary.summaries_on(date, username)]
+        removals = [key for key in current if key not in restored]
+        diary.replace_entries(username, restored, removals)
+        return len(restored)
+
+    @timed("backup.prune")
+    def prune(self, keep_last=None, snapshot_ids=()):
+        """Drop the given snapshots (and all but the newest keep_last), then delete unreferenced objects.
+
+        Returns (snapshots removed, objects removed, bytes freed).
+        """
+        index = self._load_index()
+        drop = set(snapshot_ids)
+        if keep_last is not None:
+            drop.update(s["id"] for s in index[:max(0, len(index) - keep_last)])
+        dropped = [s["id"] for s in index if s["id"] in drop]
+        self._index = [s for s in index if s["id"] not in drop]
+        self._save_index()
+        for snapshot_id in dropped:
+            os.remove(self._manifest_path(snapshot_id))
+
+        # Mark: every object a remaining manifest refers to; sweep: every other object
+        live = set()
+        for summary in self._index:
+            for user in self.manifest(summary["id"])["users"].values():
+                live.update(user["entries"].values())
+                live.add(user["revisions"])
+        removed = freed = 0
+        objects_folder = os.path.join(self.folder, "objects")
+        for prefix in os.listdir(objects_folder) if os.path.isdir(objects_folder) else ():
+            for name in os.listdir(os.path.join(objects_folder, prefix)):
+                if prefix + name not in live:
+                    path = os.path.join(objects_folder, prefix, name)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+        return len(dropped), removed, freed
+
+
+def main():
+    from diary import Diary
+    from mmap_storage import open_storage
+
+    parser = argparse.ArgumentParser(description="Incremental backups of the diary")
+    parser.add_argument("--folder", default="diary_backups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot = commands.add_parser("snapshot", help="back up all users")
+    snapshot.add_argument("--label", default="")
+    commands.add_parser("list", help="list snapshots")
+    restore = commands.add_parser("restore", help="restore one user, or one date of a user")
+    restore.add_argument("snapshot_id")
+    restore.add_argument("username")
+    restore.add_argument("--date", help="YYYY-MM-DD; only restore the entries of this date")
+    prune = commands.add_parser("prune", help="drop old snapshots and unreferenced objects")
+    prune.add_argument("--keep-last", type=int, default=None)
+    prune.add_argument("snapshot_ids", nargs="*")
+    args = parser.parse_args()
+
+    backups = BackupStore(args.folder)
+    if args.command == "snapshot":
+        summary = backups.snapshot(open_storage(), args.label)
+        print(f"Snapshot {summary['id']}: {summary['entries']} entries, "
+              f"{summary['new_objects']} new objects ({summary['new_bytes']} bytes)")
+    elif args.command == "list":
+        for s in backups.list_snapshots():
+            print(f"{s['id']}  {s['created']}  {s['users']:>4} users {s['entries']:>7} entries "
+                  f"{s['new_bytes']:>10} new bytes  {s['label']}")
+    elif args.command == "restore":
+        count = backups.restore(args.snapshot_id, Diary(open_storage()), args.username, args.date)
+        print(f"Restored {count} entries of {args.username}")
+    elif args.command == "prune":
+        snapshots, objects, freed = backups.prune(args.keep_last, args.snapshot_ids)
+        print(f"Removed {snapshots} snapshots and {objects} objects ({freed} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# entry_memory_bench.py
+"""Memory and sort-time comparison of dict entries against entry.Entry records.
+
+Builds N synthetic entries both ways and reports the resident size
+(tracemalloc) and the time to sort them by date the way EntriesViewer
+does: strptime on the date string for dicts, the day ordinal for records.
+
+    python benchmarks/entry_memory_bench.py --entries 100000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entry import Entry
+
+
+def make_dicts(count, seed=1):
+    rng = random.Random(seed)
+    return [{
+        "id": i,
+        "title": f"Entry {i}",
+        "content": "",
+        "date": f"{rng.randint(2015, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        "tags": [],
+        "hashtags": []
+    } for i in range(1, count + 1)]
+
+
+# Bytes held by what build() returns, counting only allocations made while building it
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = make_dicts(args.entries)
+    dicts, dict_bytes = measure(lambda: [dict(e) for e in source])
+    records, record_bytes = measure(lambda: [Entry.from_dict(e) for e in source])
+    del source
+
+    dict_sort = best_of(args.repeat, lambda: sorted(
+        dicts, key=lambda e: (datetime.strptime(e["date"], "%Y-%m-%d"), e["id"])))
+    record_sort = best_of(args.repeat, lambda: sorted(records, key=lambda e: (e.date_ord or 0, e.id)))
+
+    per = 100000 / args.entries
+    print(f"{args.entries} entries (figures scaled to 100k)")
+    print(f"{'':>8}{'memory MB':>12}{'sort ms':>10}")
+    print(f"{'dict':>8}{dict_bytes * per / 1e6:>12.1f}{dict_sort * per * 1000:>10.1f}")
+    print(f"{'Entry':>8}{record_bytes * per / 1e6:>12.1f}{record_sort * per * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# load_test.py
+"""Load test for the diary HTTP API (server.py).
+
+Starts a server on a temporary diary (or targets --url), fills it with
+entries, then runs client threads over keep-alive connections for a
+fixed time with a mix of reads, writes and searches. Prints requests/s
+and p50/p99 latency per kind of request.
+
+    python benchmarks/load_test.py --clients 8 --seconds 10
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ("morning walk coffee rain work meeting family dinner book garden music run "
+         "tired happy travel train beach friend call lunch code bug review weekend").split()
+
+
+class Client:
+    def __init__(self, host, port, token=None):
+        self.conn = http.client.HTTPConnection(host, port, timeout=30)
+        self.token = token
+
+    def call(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = self.conn.getresponse()
+        payload = json.loads(response.read())
+        if response.status >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status}: {payload}")
+        return payload
+
+
+def random_entry(rng):
+    return {
+        "title": " ".join(rng.choice(WORDS) for _ in range(3)).capitalize(),
+        "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 120))),
+        "date": f"{rng.randint(2020, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_client(host, port, token, seconds, mix, ids, results, seed):
+    rng = random.Random(seed)
+    client = Client(host, port, token)
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        kind = rng.choice(kinds)
+        start = time.perf_counter()
+        if kind == "read":
+            client.call("GET", f"/entries/{rng.choice(ids)}")
+        elif kind == "write":
+            client.call("PUT", f"/entries/{rng.choice(ids)}", random_entry(rng))
+        else:
+            client.call("GET", f"/search?q={rng.choice(WORDS)}+{rng.choice(WORDS)[:3]}&limit=20")
+        results[kind].append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="existing server, e.g. http://127.0.0.1:8765 (default: start one)")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--mix", default="read=6,write=1,search=3", help="weights of read, write and search requests")
+    args = parser.parse_args()
+
+    mix = {kind: int(weight) for kind, weight in (part.split("=") for part in args.mix.split(","))}
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port
+    else:
+        from diary import Diary
+        from storage import DiaryStorage
+        from server import make_server
+        folder = tempfile.mkdtemp(prefix="diary-load-")
+        server = make_server(Diary(DiaryStorage(os.path.join(folder, "diary.json"))), port=0, max_workers=args.workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = "127.0.0.1", server.server_address[1]
+
+    # A fresh user with some entries to read, edit and search
+    rng = random.Random(1)
+    setup = Client(host, port)
+    username = f"load{rng.randrange(10 ** 6)}"
+    setup.call("POST", "/register", {"username": username, "password": "load"})
+    setup.token = setup.call("POST", "/login", {"username": username, "password": "load"})["token"]
+    print(f"Creating {args.entries} entries...")
+    ids = [setup.call("POST", "/entries", random_entry(rng))["id"] for _ in range(args.entries)]
+
+    results = {kind: [] for kind in mix}
+    threads = [
+        threading.Thread(target=run_client, args=(host, port, setup.token, args.seconds, mix, ids, results, n))
+        for n in range(args.clients)
+    ]
+    print(f"Running {args.clients} clients for {args.seconds:g}s (mix {args.mix})...")
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(latencies) for latencies in results.values())
+    print(f"\n{'kind':<8}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for kind, latencies in results.items():
+        latencies.sort()
+        print(f"{kind:<8}{len(latencies):>10}{len(latencies) / elapsed:>10.1f}"
+              f"{percentile(latencies, 0.50) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}")
+    print(f"{'all':<8}{total:>10}{total / elapsed:>10.1f}")
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
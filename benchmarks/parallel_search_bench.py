@@ -0,0 +1,80 @@
+# parallel_search_bench.py
+"""Scaling benchmark for parallel_search.ParallelSearcher.
+
+Builds a synthetic diary (users x years of entries) in a temporary
+folder, then times the same cross-user keyword search with 1, 2, ... N
+worker processes and prints the speed-up over one worker.
+
+    python benchmarks/parallel_search_bench.py --users 20 --entries 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import DiaryStorage
+from parallel_search import ParallelSearcher
+
+WORDS = ("morning walk coffee rain work meeting family dinner book garden music run "
+         "tired happy travel train beach friend call lunch code bug review weekend audit").split()
+
+
+def build_diary(path, users, entries_per_user, years, seed=1):
+    """Write a diary file with random entries spread over the given years"""
+    rng = random.Random(seed)
+    data = {}
+    for u in range(users):
+        entries = {}
+        for i in range(1, entries_per_user + 1):
+            entries[str(i)] = {
+                "id": i,
+                "title": " ".join(rng.choice(WORDS) for _ in range(3)),
+                "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(50, 300))),
+                "date": f"{rng.choice(years)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "time": "12:00:00", "tags": [], "hashtags": []
+            }
+        data[f"user{u}"] = {"password": "pw", "entries": entries, "next_id": entries_per_user + 1}
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--entries", type=int, default=2000, help="entries per user")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keyword", default="audit")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="diary-bench-")
+    path = os.path.join(folder, "diary.json")
+    years = [str(2025 - i) for i in range(args.years)]
+    print(f"Building {args.users} users x {args.entries} entries over {args.years} years...")
+    build_diary(path, args.users, args.entries, years)
+    store = DiaryStorage(path)
+
+    counts = sorted({1, 2, 4, 8, args.max_workers} & set(range(1, args.max_workers + 1)))
+    print(f"\n{'workers':>8}{'best s':>10}{'speed-up':>10}{'results':>10}")
+    baseline = None
+    for workers in counts:
+        with ParallelSearcher(store, workers=workers) as searcher:
+            list(searcher.search(args.keyword))  # warm up: workers open the file
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                found = sum(1 for _ in searcher.search(args.keyword))
+                times.append(time.perf_counter() - start)
+        best = min(times)
+        baseline = baseline or best
+        print(f"{workers:>8}{best:>10.3f}{baseline / best:>10.2f}{found:>10}")
+
+
+if __name__ == "__main__":
+    main()
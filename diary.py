@@ -1,43 +1,277 @@
 # diary.py
 from datetime import datetime
 from storage import DiaryStorage
+from entry import Entry, EntrySummary
+from events import ChangeEvent, EventBus, CREATED, UPDATED, DELETED
+from revisions import RevisionHistory, RetentionPolicy, diff_entries
+from indexes import DateIndex
+from tags import TagIndex, normalize_tags, parse_hashtags, entry_tags
+from ranking import SearchIndex, make_snippet
+from live_search import QueryCache
+from autocomplete import TitleIndex
+from analytics import WritingStats
+from metrics import METRICS, timed
+from sync import SyncState
+import hashlib
+import os
 import re
 
+try:
+    from similar import RelatedIndex
+except ImportError:  # numpy is not installed: related entries are not offered
+    RelatedIndex = None
+
 class Diary:
-    def __init__(self):
-        self.store = DiaryStorage()
+    def __init__(self, store=None, retention=None, events=None):
+        self.store = store if store is not None else DiaryStorage()
+        self.events = events if events is not None else EventBus()  # change events, published after every save
         self.users_list = self.store.load_users()
-        self.entries_list = self.store.load_users()
+        self.retention = retention or RetentionPolicy()
+        self.date_indexes = {}  # username -> DateIndex, built on first use
+        self.tag_indexes = {}  # username -> TagIndex, built on first use
+        self.search_indexes = {}  # username -> SearchIndex (BM25 term statistics), built on first use
+        self.title_indexes = {}  # username -> TitleIndex for title autocomplete, built on first use
+        self.related_indexes = {}  # username -> RelatedIndex (TF-IDF rows), loaded from its cache file on first use
+        self.writing_stats = {}  # username -> WritingStats, built on first use
+        self.query_cache = QueryCache()  # recent search results, dropped for a user whenever their entries change
+        self.generations = {}  # username -> number of changes made to the user's entries
+        # Storages that drop users from memory (user_cache.py) take the user's indexes with them
+        add_evict_listener = getattr(self.store, "add_evict_listener", None)
+        if add_evict_listener is not None:
+            add_evict_listener(self._evicted)
+
+    # Revision history of a user's entries, kept in the user's data next to the entries
+    def _history(self, username):
+        revisions = self.users_list[username].setdefault("revisions", {})
+        return RevisionHistory(revisions, self.retention)
+
+    # Change stamps of a user's entries for syncing with another copy of the diary, once syncing is set up
+    def _sync_state(self, username):
+        data = self.users_list[username].get("sync")
+        return None if data is None else SyncState(data)
+
+    # Entry summaries of a user (no bodies), for storages that keep them; otherwise the entries themselves
+    def _summaries(self, username):
+        list_summaries = getattr(self.store, "list_summaries", None)
+        if list_summaries is None:
+            return self.store.list_entries(username)
+        return list_summaries(username)
+
+    # Date -> entry ids index of a user, built once from the entries and then kept up to date
+    def _date_index(self, username):
+        index = self.date_indexes.get(username)
+        if index is None:
+            index = DateIndex.from_entries(self._summaries(username))
+            self.date_indexes[username] = index
+        return index
+
+    # Tag -> entry ids index of a user, built once and then updated on every save and delete
+    def _tag_index(self, username):
+        index = self.tag_indexes.get(username)
+        if index is None:
+            index = TagIndex.from_entries(self._summaries(username))
+            self.tag_indexes[username] = index
+        return index
+
+    # BM25 term statistics of a user's entries, built once and then updated on every save and delete
+    def _search_index(self, username):
+        index = self.search_indexes.get(username)
+        if index is None:
+            index = SearchIndex.from_entries(self.store.list_entries(username))
+            self.search_indexes[username] = index
+        return index
+
+    # Sorted title keys of a user, built once and then updated on every save and delete
+    def _title_index(self, username):
+        index = self.title_indexes.get(username)
+        if index is None:
+            index = TitleIndex.from_entries(self._summaries(username))
+            self.title_indexes[username] = index
+        return index
+
+    # Cache file of a user's TF-IDF rows, next to the diary file. A username that had characters replaced
+    # to make a file name also gets a hash of the exact name, so ann.lee and ann_lee never share a file
+    def _related_cache_path(self, username):
+        base = os.path.splitext(getattr(self.store, "filename", "diary.json"))[0]
+        safe_name = re.sub(r"[^\w-]", "_", username)
+        if safe_name != username:
+            safe_name += "." + hashlib.sha1(username.encode("utf-8")).hexdigest()[:8]
+        return f"{base}.related.{safe_name}.npz"
+
+    # Stamp of the state of a user's entries, for telling whether a cache file still describes them.
+    # Made from counters in the user's record, so checking it reads no entries
+    def _entries_stamp(self, username):
+        user = self.users_list[username]
+        return f"{user.get('next_id')}:{user.get('change_count', 0)}:{len(self.store.list_entries(username))}"
+
+    # TF-IDF rows of a user from memory or the cache file, or None when they would have to be rebuilt
+    def _loaded_related_index(self, username):
+        index = self.related_indexes.get(username)
+        if index is None:
+            index = RelatedIndex.load(self._related_cache_path(username), self._entries_stamp(username))
+            if index is not None:
+                self.related_indexes[username] = index
+        return index
+
+    # TF-IDF rows of a user: read from the cache file unless it is stale, otherwise rebuilt
+    def _related_index(self, username):
+        index = self._loaded_related_index(username)
+        if index is None:
+            index = RelatedIndex.from_entries(self.store.list_entries(username))
+            index.stamp = self._entries_stamp(username)
+            self.related_indexes[username] = index
+        return index
+
+    def related_ready(self, username):
+        """Whether related_entries() can answer without reading every entry: the TF-IDF rows are
+        in memory or in a current cache file"""
+        return RelatedIndex is None or self._loaded_related_index(username) is not None
+
+    def stats(self, username):
+        """Running writing statistics of a user (built once, then updated on every save and delete)"""
+        stats = self.writing_stats.get(username)
+        if stats is None:
+            stats = WritingStats.from_entries(self.store.list_entries(username))
+            self.writing_stats[username] = stats
+        return stats
+
+    def build_indexes(self, username):
+        """Build whichever of a user's indexes are not built yet. Callers running reads concurrently do
+        this first, alone, so the reads only look the indexes up"""
+        self.stats(username)
+        self._date_index(username)
+        self._tag_index(username)
+        self._search_index(username)
+        self._title_index(username)
+
+    def indexes_built(self, username):
+        return all(username in indexes for indexes in (self.writing_stats, self.date_indexes, self.tag_indexes,
+                                                      self.search_indexes, self.title_indexes))
+
+    def generation(self, username):
+        """Counter that goes up on every change to a user's entries (for cached search results)"""
+        return self.generations.get(username, 0)
+
+    # Called after every save or delete, so cached search results of the user are not reused. The
+    # count kept in the user's record marks cache files written before the change as stale
+    def _changed(self, username):
+        self.generations[username] = self.generation(username) + 1
+        self.query_cache.invalidate(username)
+        user = self.users_list[username]
+        user["change_count"] = user.get("change_count", 0) + 1
+
+    # Tell the subscribers of the event bus about a saved change to one entry
+    def _publish(self, kind, username, entry, previous_date=None):
+        self.events.publish(ChangeEvent(kind, username, entry["id"], entry["date"],
+                                        EntrySummary.from_entry(entry), previous_date))
 
-# This function creates and edits entries using the date assigned to the entry as a key and passing in the username to update the entries list of the particular user
+    # Write a user's changes; storages with save_user() only write that user
+    def _save(self, username):
+        save_user = getattr(self.store, "save_user", None)
+        if save_user is None:
+            self.store.save_entries(self.users_list)
+        else:
+            save_user(username)
+
+    def close(self):
+        """Write the caches only kept in memory during the session (the TF-IDF rows of related
+        entries, so the next start does not rebuild them) and close the storage"""
+        for username, index in self.related_indexes.items():
+            if index.changed and username in self.users_list:
+                index.stamp = self._entries_stamp(username)
+                index.save(self._related_cache_path(username))
+        close = getattr(self.store, "close", None)
+        if close is not None:
+            close()
+
+    # Hand out the next entry id of a user; ids are never reused, even after a delete
+    def _allocate_id(self, username):
+        user = self.users_list[username]
+        entry_id = user.get("next_id") or 1
+        user["next_id"] = entry_id + 1
+        return entry_id
+
+    def get_entry(self, entry_id, username):
+        """Get one entry by id, or None"""
+        return self.store.list_entries(username).get(str(entry_id))
+
+    def entries_on(self, date_key, username):
+        """All entries written on one date, oldest first"""
+        user_entries = self.store.list_entries(username)
+        return [user_entries[str(entry_id)] for entry_id in self._date_index(username).ids_on(date_key)]
+
+    def summaries_on(self, date_key, username):
+        """Title, time and preview of the entries written on one date, oldest first, without their bodies"""
+        summaries = self._summaries(username)
+        return [summaries[str(entry_id)] for entry_id in self._date_index(username).ids_on(date_key)]
+
+    def entry_counts(self, start, end, username):
+        """Number of entries per date between two date keys (inclusive)"""
+        return self._date_index(username).counts_between(start, end)
+
+# This function creates and edits entries. An entry without an "id" is added as a new entry (several are allowed per day), an entry with an "id" replaces that entry
+    @timed("diary.create_entry")
     def create_entry(self, entry, username):
-        """Add a new entry keyed by date (dd-mm-yyyy)"""
+        """Add a new entry or update an existing one, and return its id"""
+        # Store a copy, so later changes to the caller's dict don't leak into the diary
+        entry = dict(entry)
         date_key = entry["date"]
-        
 
-        # Assign ID based on number of existing entries
-        # entry["id"] = len(self.entries_list) + 1
+        # Stable ids come from a per-user counter, not from the number of entries
+        if entry.get("id") is None:
+            entry["id"] = self._allocate_id(username)
+        entry_id = entry["id"]
         entry["time"] = datetime.now().strftime("%H:%M:%S")
 
+        # Explicit tags, plus the #hashtags written in the title and content
+        entry["tags"] = normalize_tags(entry.get("tags"))
+        entry["hashtags"] = parse_hashtags(entry.get("title", ""), entry.get("content", ""))
+
         # Create a copy of the users_list(basically the json file). 
         users_list = self.users_list
 
         # Create a copy of the entries of the user with the 'username'
         user_entries = self.store.list_entries(username)
+        previous = user_entries.get(str(entry_id))
 
-        # Update the entries list of the user with the new entry or edited entry
-        user_entries[date_key] = entry
+        # Keep the version being replaced as a delta in the entry's revision history
+        self._history(username).record(str(entry_id), previous, entry)
+
+        # Update the entries list of the user with the new entry or edited entry, as a compact record
+        user_entries[str(entry_id)] = Entry.from_dict(entry)
+        sync_state = self._sync_state(username)
+        if sync_state is not None:
+            sync_state.saved(str(entry_id), entry)
+
+        # Keep the date and tag indexes in step (an edit may move the entry to another date or change its tags).
+        # The indexes built from the entry bodies are only updated once built: building them reads every body
+        self._date_index(username).add(entry_id, date_key)
+        self._tag_index(username).add(entry_id, entry_tags(entry))
+        self._title_index(username).add(entry_id, entry["title"])
+        if username in self.search_indexes:
+            self.search_indexes[username].add(entry_id, entry["title"], entry["content"])
+        if username in self.writing_stats:
+            self.writing_stats[username].add(entry)
+        if username in self.related_indexes:
+            self.related_indexes[username].add(entry_id, entry["title"], entry["content"])
+        self._changed(username)
 
         # Update the entire entries list of the user with the updated entries list above
         users_list[username]['entries'] = user_entries 
 
         # Save the new and updated user_list to the json file (kind of like replacing it)
-        self.store.save_entries(users_list)
+        self._save(username)
+        if previous is None:
+            self._publish(CREATED, username, entry)
+        else:
+            self._publish(UPDATED, username, entry, previous["date"])
+        return entry_id
       
 
-# This function deletes an entry using the date assigned to the entry as a key and passing in the username to get the list of entries of the user
-    def delete_entry(self, date_key, username):
-        """Delete entry by date"""
+# This function deletes an entry using its id and passing in the username to get the list of entries of the user
+    @timed("diary.delete_entry")
+    def delete_entry(self, entry_id, username):
+        """Delete entry by id"""
 
         # Create a copy of the users_list(basically the json file). 
         users_list = self.users_list
@@ -45,68 +279,275 @@ class Diary:
         # Create a copy of the entries of the user with the 'username'
         user_entries = self.store.list_entries(username)
 
-        if date_key in user_entries:
-            del user_entries[date_key]
+        key = str(entry_id)
+        if key in user_entries:
+            entry = user_entries[key]
+            # The deleted entry stays in the revision history so it can be restored
+            self._history(username).record(key, entry)
+            del user_entries[key]
+            sync_state = self._sync_state(username)
+            if sync_state is not None:
+                sync_state.deleted(key)
+            self._date_index(username).remove(entry["id"])
+            self._tag_index(username).remove(entry["id"])
+            self._title_index(username).remove(entry["id"])
+            if username in self.search_indexes:
+                self.search_indexes[username].remove(entry["id"])
+            if username in self.writing_stats:
+                self.writing_stats[username].remove(entry["id"])
+            if username in self.related_indexes:
+                self.related_indexes[username].remove(entry["id"])
+            self._changed(username)
             # Update the entire entries list of the users, with the entries of one user deleted
             users_list[username]['entries'] = user_entries 
-            self.store.save_entries(users_list)
+            self._save(username)
+            self._publish(DELETED, username, entry)
             return True
         return False
 
+    @timed("diary.replace_entries")
+    def replace_entries(self, username, updates, removals=(), track_changes=True):
+        """Put whole entries in place as they are (ids and times kept) and remove others, then save once.
+
+        For entries that come from elsewhere, such as a backup or another copy of the diary.
+        Replaced and removed versions go into the revision history, like edits and deletes.
+        track_changes=False leaves the sync stamps alone (the sync sets them itself).
+        """
+        user_entries = self.store.list_entries(username)
+        history = self._history(username)
+        sync_state = self._sync_state(username) if track_changes else None
+        events = []
+        for key in removals:
+            if key in user_entries:
+                history.record(key, user_entries[key])
+                events.append((DELETED, user_entries[key], None))
+                del user_entries[key]
+                if sync_state is not None:
+                    sync_state.deleted(key)
+        for key, entry in updates.items():
+            entry = Entry.from_dict(dict(entry))
+            previous = user_entries.get(key)
+            history.record(key, previous, entry)
+            events.append((CREATED, entry, None) if previous is None else (UPDATED, entry, previous["date"]))
+            user_entries[key] = entry
+            if sync_state is not None:
+                sync_state.saved(key, entry)
+
+        # Ids handed out later must not collide with the ones put in place
+        user = self.users_list[username]
+        user["next_id"] = max([user.get("next_id") or 1] + [entry["id"] + 1 for entry in updates.values()])
+        self._forget_indexes(username)
+        self._changed(username)
+        self._save(username)
+        for kind, entry, previous_date in events:
+            self._publish(kind, username, entry, previous_date)
+
+    # A user's record left the storage's memory: so do the indexes and cached results built from it.
+    # Unsaved related-entries rows are dropped too; their cache file is rebuilt when next needed
+    def _evicted(self, username):
+        self._forget_indexes(username)
+        self.query_cache.invalidate(username)
+
+    # Drop the indexes built for a user, so they are rebuilt from the stored entries on next use
+    def _forget_indexes(self, username):
+        for indexes in (self.date_indexes, self.tag_indexes, self.search_indexes, self.title_indexes,
+                        self.related_indexes, self.writing_stats):
+            indexes.pop(username, None)
+
+    def delete_entries_on(self, date_key, username):
+        """Delete every entry written on one date, and return how many were deleted"""
+        deleted = 0
+        for entry_id in self._date_index(username).ids_on(date_key):
+            if self.delete_entry(entry_id, username):
+                deleted += 1
+        return deleted
+
+# These functions give access to the older versions of an entry kept by create_entry and delete_entry
+    def list_revisions(self, entry_id, username):
+        """List the stored revisions of an entry, oldest first"""
+        return self._history(username).list(str(entry_id))
+
+    def get_revision(self, entry_id, username, rev):
+        """Rebuild the title and content of an entry at revision `rev`"""
+        current = self.get_entry(entry_id, username)
+        return self._history(username).get(str(entry_id), rev, current)
+
+    def diff_revisions(self, entry_id, username, old_rev, new_rev=None):
+        """Unified diff between two revisions (new_rev=None means the current entry)"""
+        current = self.get_entry(entry_id, username) or {}
+        old_entry = self.get_revision(entry_id, username, old_rev)
+        if new_rev is None:
+            new_entry, new_label = current, "current"
+        else:
+            new_entry, new_label = self.get_revision(entry_id, username, new_rev), f"rev{new_rev}"
+        return diff_entries(old_entry, new_entry, f"rev{old_rev}", new_label)
+
+    def restore_revision(self, entry_id, username, rev):
+        """Make revision `rev` the current entry again (the replaced version is kept as a revision)"""
+        current = self.get_entry(entry_id, username)
+        restored = self.get_revision(entry_id, username, rev)
+        if current is not None:
+            restored["date"] = current["date"]
+            restored["tags"] = current.get("tags", [])
+        elif "date" not in restored:
+            raise KeyError(f"Revision {rev} of entry {entry_id} has no date to restore it to")
+        restored["id"] = entry_id
+        self.create_entry(restored, username)
+        return restored
+
 # This function searches for keywords in the content or title of all entries by looping through them, if the content/title contains the pattern, it adds it to the results dictionary
+    @timed("diary.search_by_keyword")
     def search_by_keyword(self, keyword, username):
         """Search for keyword in titles and content using regex (case-insensitive)"""
         results = []
         # Compile regex pattern (matches partial words too)
         pattern = re.compile(re.escape(keyword), re.IGNORECASE)
 
-         # Create a copy of the users_list(basically the json file). 
-        users_list = self.users_list
-
         # Create a copy of the entries of the user with the 'username'
         user_entries = self.store.list_entries(username)
-        for date_key, entry in user_entries.items():
+
+        # Archived years are narrowed down to the entries that can match with their word indexes
+        keyword_items = getattr(user_entries, "keyword_items", None)
+        items = user_entries.items() if keyword_items is None else keyword_items(keyword)
+        scanned = 0
+        for entry_id, entry in items:
+            scanned += 1
             if pattern.search(entry["title"]) or pattern.search(entry["content"]):
                 results.append(entry)
 
+        METRICS.observe("diary.search_by_keyword.scanned_entries", scanned)
         return results
 
-# This function searches the json list of entries for a particular entry using the date assigned to that entry
+# This function searches for entries by date using the date index, so only the matching dates are looked at
+    @timed("diary.search_by_date")
     def search_by_date(self, search_param, username, type=None):
-        """Search by exact date key"""
-
-        # Create a copy of the users_list(basically the json file). 
-        users_list = self.users_list
+        """Summaries of the entries on an exact date key, or by day, month or year (no bodies;
+        get_entry reads one when it is opened)"""
+        summaries = self._summaries(username)
+        return [summaries[str(entry_id)] for entry_id in self._date_ids(search_param, username, type)]
 
-        # Create a copy of the entries of the user with the 'username'
-        user_entries = self.store.list_entries(username)
-
-        results = []
+    # Ids of the entries matching a date search, in date order
+    def _date_ids(self, search_param, username, type=None):
+        index = self._date_index(username)
 
         day_pattern = re.compile(rf"\d\d\d\d-\d\d-{re.escape(search_param)}")      # search by day
         month_pattern = re.compile(rf"\d\d\d\d-{re.escape(search_param)}-\d\d")    # search by month
-        year_pattern = re.compile(rf"{re.escape(search_param)}-\d\d-\d\d")     #search by year
 
-        for date_key, entry in user_entries.items():
-            # print(date_key)
-            # If searching by an exact date, i.e "07-04-2005"
-            if(search_param == date_key):
-                return [user_entries[date_key]]
+        # If searching by an exact date, i.e "2005-04-07"
+        if search_param in index.ids_by_date:
+            ids = index.ids_on(search_param)
 
-            # If searching by a particular day, i.e 24, 29, 31
-            if(day_pattern.match(date_key) and type=="day"):
-                results.append(entry)
-                
-           
-            # If searching by a particular month, i.e 05(May), 01(Jan), 03(March)
-            if(month_pattern.match(date_key) and type == 'month'):
-                results.append(entry)
-                
-           
-            # If searching by a particular day, i.e 2024, 2022, 2020
-            if(year_pattern.match(date_key) and type == 'year'):
-                results.append(entry)
-                
+        # If searching by a particular year, i.e 2024, 2022, 2020 (a range over the sorted dates)
+        elif type == "year":
+            ids = index.ids_between(f"{search_param}-00-00", f"{search_param}-99-99")
+
+        # If searching by a particular day, i.e 24, 29, 31
+        elif type == "day":
+            ids = [i for d in index.dates if day_pattern.fullmatch(d) for i in index.ids_by_date[d]]
+
+        # If searching by a particular month, i.e 05(May), 01(Jan), 03(March)
+        elif type == "month":
+            ids = [i for d in index.dates if month_pattern.fullmatch(d) for i in index.ids_by_date[d]]
+
+        else:
+            ids = []
+
+        return ids
+
+# This function combines tag queries with the keyword and date filters. Tags and dates are answered from the indexes by set intersection, the keyword is only checked on the entries left after that
+    @timed("diary.search")
+    def search(self, username, keyword=None, tag_query=None, date=None, date_type=None):
+        """Search with any mix of a keyword, a tag query (AND/OR/NOT) and a date filter.
+
+        Only a keyword needs the bodies; tag and date searches return summaries.
+        """
+        candidates = self.filter_ids(username, tag_query, date, date_type)
+        user_entries = self.store.list_entries(username) if keyword else self._summaries(username)
+
+        if candidates is None:
+            entries = user_entries.values()
+        else:
+            entries = [user_entries[str(entry_id)] for entry_id in candidates]
+
+        if keyword:
+            METRICS.observe("diary.search.scanned_entries", len(entries))
+            pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+            entries = [e for e in entries if pattern.search(e["title"]) or pattern.search(e["content"])]
+
+        return sorted(entries, key=lambda e: (e["date"], e["id"]))
+
+    def filter_ids(self, username, tag_query=None, date=None, date_type=None):
+        """Ids allowed by a tag query and a date filter, or None when neither is given"""
+        candidates = None
+        if tag_query:
+            candidates = self._tag_index(username).query(tag_query)
+        if date:
+            date_ids = set(self._date_ids(date, username, date_type))
+            candidates = date_ids if candidates is None else candidates & date_ids
+        return candidates
+
+# These functions rank keyword matches with BM25 (title words weigh more) and cut a snippet around the best match
+    @timed("diary.rank")
+    def rank(self, query, username, candidates=None, cancel=None, fuzzy=False):
+        """(score, entry id) pairs of the entries matching every query word, best first.
+
+        With fuzzy=True, query words also match words a few typos away.
+        """
+        index = self._search_index(username)
+        METRICS.observe("diary.rank.scanned_entries", len(index.stats) if candidates is None else len(candidates))
+        if fuzzy:
+            return index.score_fuzzy(query, candidates, cancel)
+        return index.score(query, candidates, cancel)
+
+    def ranked_results(self, ranking, query, username, start=0, count=None, fuzzy=False):
+        """Build result rows with snippets for one page of a ranking"""
+        index = self._search_index(username)
+        groups = index.fuzzy_terms(query)[0] if fuzzy else index.query_terms(query)
+        terms = {term for group in groups for term in group}
+        page = ranking[start:] if count is None else ranking[start:start + count]
+        results = []
+        for score, entry_id in page:
+            entry = self.get_entry(entry_id, username)
+            snippet, highlights = make_snippet(entry["content"], terms)
+            results.append({
+                "id": entry_id,
+                "date": entry["date"],
+                "title": entry["title"],
+                "score": score,
+                "snippet": snippet,
+                "highlights": highlights
+            })
         return results
 
+    @timed("diary.search_ranked")
+    def search_ranked(self, query, username, limit=None, candidates=None):
+        """Ranked keyword search returning result rows with snippets"""
+        return self.ranked_results(self.rank(query, username, candidates), query, username, 0, limit)
+
+    @timed("diary.search_fuzzy")
+    def search_fuzzy(self, query, username, limit=None, candidates=None):
+        """Typo-tolerant ranked search, e.g. "cofee" finds entries about coffee"""
+        ranking = self.rank(query, username, candidates, fuzzy=True)
+        return self.ranked_results(ranking, query, username, 0, limit, fuzzy=True)
+
+    def complete_titles(self, prefix, username, limit=10):
+        """Summaries of the entries whose title starts with prefix (or has a word that does), for autocomplete"""
+        summaries = self._summaries(username)
+        return [summaries[str(entry_id)] for entry_id in self._title_index(username).complete(prefix, limit)]
+
+    def related_entries(self, entry_id, username, k=5):
+        """Summaries of the k entries most similar to an entry (TF-IDF cosine), best first, with a "score"
+        added; like the day's entry list, they carry no bodies"""
+        if RelatedIndex is None:
+            return []
+        summaries = self._summaries(username)
+        results = []
+        for score, other_id in self._related_index(username).similar(entry_id, k):
+            summary = summaries.get(str(other_id))
+            if summary is not None:
+                results.append(dict(summary, score=score))
+        return results
 
+    def tag_counts(self, username):
+        """All tags of a user with the number of entries filed under each"""
+        return self._tag_index(username).counts()
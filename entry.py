@@ -0,0 +1,244 @@
+# entry.py
+from datetime import date
+from functools import lru_cache
+
+# Keys of the JSON shape of an entry, in the order they are written
+FIELDS = ("id", "title", "content", "date", "time", "tags", "hashtags")
+
+# Characters of an entry kept as its preview in the entry summaries
+PREVIEW_LENGTH = 40
+
+
+# Date keys repeat across entries, so the strings are shared instead of rebuilt
+@lru_cache(maxsize=65536)
+def date_key(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+def date_ordinal(date_text):
+    """Day number of a "YYYY-MM-DD" date, or None for anything else"""
+    try:
+        return date.fromisoformat(date_text).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def time_seconds(time_text):
+    """Seconds since midnight of an "HH:MM:SS" time, or None"""
+    try:
+        hours, minutes, seconds = (int(part) for part in time_text.split(":"))
+    except (AttributeError, ValueError):
+        return None
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def make_preview(content, limit=PREVIEW_LENGTH):
+    """Start of an entry's text on one line, for lists that don't show the whole body"""
+    text = " ".join(content[:limit * 2].split())
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+class DatedRecord:
+    """Date, time and dict-style read access shared by Entry and EntrySummary"""
+
+    __slots__ = ()
+    FIELDS = ()
+    LIST_FIELDS = ("tags", "hashtags")
+
+    @property
+    def date(self):
+        if self.date_ord is None:
+            return self.raw_date
+        return date_key(self.date_ord)
+
+    @property
+    def time(self):
+        if self.time_secs is None:
+            return None
+        hours, rest = divmod(self.time_secs, 3600)
+        return f"{hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+    # Sort key that puts entries in date, then time, then id order
+    def sort_key(self):
+        return (self.date_ord if self.date_ord is not None else -1, self.time_secs or 0, self.id or 0)
+
+    # Read access like the JSON dict, so code written against dicts keeps working
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is None and key in ("time", "date"):
+                raise KeyError(key)
+            return list(value) if key in self.LIST_FIELDS else value
+        extra = getattr(self, "extra", None)
+        if extra and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # A key is there when the JSON dict would hold it: a field that is set, or an extra key
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key) is not None
+        extra = getattr(self, "extra", None)
+        return bool(extra) and key in extra
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __eq__(self, other):
+        if isinstance(other, DatedRecord):
+            return type(self) is type(other) and self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    # Unhashable on purpose: records compare by their contents, and an Entry changes through __setitem__
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id!r}, date={self.date!r}, title={self.title!r})"
+
+
+class Entry(DatedRecord):
+    """One diary entry, kept in memory as a compact record.
+
+    The date is a day ordinal and the time is seconds since midnight, so
+    entries sort and compare by number. Reading entry["date"] or
+    entry.get("tags") still works like the JSON dict it is stored as;
+    storage converts with from_dict() on load and to_dict() on save. Dates
+    that are not YYYY-MM-DD are kept as written in raw_date, and keys this
+    class doesn't know about are kept in extra.
+    """
+
+    __slots__ = ("id", "title", "content", "date_ord", "time_secs", "tags", "hashtags", "raw_date", "extra")
+    FIELDS = FIELDS
+
+    def __init__(self, id, title="", content="", date_ord=None, time_secs=None,
+                 tags=(), hashtags=(), raw_date=None, extra=None):
+        self.id = id
+        self.title = title
+        self.content = content
+        self.date_ord = date_ord
+        self.time_secs = time_secs
+        self.tags = tuple(tags)
+        self.hashtags = tuple(hashtags)
+        self.raw_date = raw_date
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, Entry):
+            return data
+        date_text = data.get("date")
+        date_ord = date_ordinal(date_text)
+        extra = {key: value for key, value in data.items() if key not in FIELDS} or None
+        return cls(data.get("id"), data.get("title", ""), data.get("content", ""),
+                   date_ord, time_seconds(data.get("time")),
+                   data.get("tags") or (), data.get("hashtags") or (),
+                   date_text if date_ord is None else None, extra)
+
+    def to_dict(self):
+        data = {
+            "id": self.id,
+            "title": self.title,
+            "content": self.content,
+            "date": self.date,
+            "tags": list(self.tags),
+            "hashtags": list(self.hashtags)
+        }
+        if self.time_secs is not None:
+            data["time"] = self.time
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # length, words and preview match EntrySummary, so an Entry can stand in for its summary
+    @property
+    def length(self):
+        return len(self.content or "")
+
+    @property
+    def words(self):
+        return len((self.content or "").split())
+
+    @property
+    def preview(self):
+        return make_preview(self.content or "")
+
+    def summary(self):
+        return EntrySummary.from_entry(self)
+
+    def __setitem__(self, key, value):
+        if key == "date":
+            self.date_ord = date_ordinal(value)
+            self.raw_date = value if self.date_ord is None else None
+        elif key == "time":
+            self.time_secs = time_seconds(value)
+        elif key in ("tags", "hashtags"):
+            setattr(self, key, tuple(value or ()))
+        elif key in FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra = dict(self.extra or {}, **{key: value})
+
+
+class EntrySummary(DatedRecord):
+    """What lists, the calendar and date searches need of an entry, without its body.
+
+    Holds the title, date, time and tags plus the body's length, word count
+    and a short preview, so a storage can keep these resident for every
+    entry and read a body only when the entry is opened.
+    """
+
+    __slots__ = ("id", "title", "date_ord", "time_secs", "tags", "hashtags", "raw_date",
+                 "length", "words", "preview")
+    FIELDS = ("id", "title", "date", "time", "tags", "hashtags", "length", "words", "preview")
+
+    def __init__(self, id, title="", date_ord=None, time_secs=None, tags=(), hashtags=(),
+                 raw_date=None, length=0, words=0, preview=""):
+        self.id = id
+        self.title = title
+        self.date_ord = date_ord
+        self.time_secs = time_secs
+        self.tags = tuple(tags)
+        self.hashtags = tuple(hashtags)
+        self.raw_date = raw_date
+        self.length = length
+        self.words = words
+        self.preview = preview
+
+    @classmethod
+    def from_entry(cls, entry):
+        entry = Entry.from_dict(entry)
+        content = entry.content or ""
+        return cls(entry.id, entry.title, entry.date_ord, entry.time_secs, entry.tags, entry.hashtags,
+                   entry.raw_date, len(content), len(content.split()), make_preview(content))
+
+    @classmethod
+    def from_dict(cls, data):
+        date_text = data.get("date")
+        date_ord = date_ordinal(date_text)
+        return cls(data.get("id"), data.get("title", ""), date_ord, time_seconds(data.get("time")),
+                   data.get("tags") or (), data.get("hashtags") or (), date_text if date_ord is None else None,
+                   data.get("length", 0), data.get("words", 0), data.get("preview", ""))
+
+    def to_dict(self):
+        data = {key: self.get(key) for key in self.FIELDS}
+        if data["time"] is None:
+            del data["time"]
+        return data
+
+
+def encode_entry(obj):
+    """json.dump default hook: write Entry records in their JSON shape"""
+    if isinstance(obj, Entry):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,169 @@
+# events.py
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from entry import EntrySummary
+
+log = logging.getLogger("diary.events")
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+
+class ChangeEvent:
+    """One change to a user's entries: what happened, to which entry, on which date.
+
+    summary is the EntrySummary of the entry after the change (before it, for a
+    delete), so a view can update its row or cell without reading storage.
+    previous_date is the date the entry had before an update that moved it.
+    """
+
+    __slots__ = ("kind", "username", "entry_id", "date", "previous_date", "summary", "seq", "time")
+
+    def __init__(self, kind, username, entry_id, date, summary=None, previous_date=None, seq=None, time=None):
+        self.kind = kind
+        self.username = username
+        self.entry_id = entry_id
+        self.date = date
+        self.summary = summary
+        self.previous_date = previous_date
+        self.seq = seq
+        self.time = time
+
+    # Dates whose entry counts changed: one, or two when an update moved the entry to another day
+    def dates(self):
+        if self.previous_date and self.previous_date != self.date:
+            return [self.previous_date, self.date]
+        return [self.date]
+
+    def to_dict(self):
+        return {
+            "seq": self.seq,
+            "time": self.time,
+            "kind": self.kind,
+            "username": self.username,
+            "entry_id": self.entry_id,
+            "date": self.date,
+            "previous_date": self.previous_date,
+            "summary": self.summary.to_dict() if self.summary is not None else None
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = data.get("summary")
+        return cls(data["kind"], data["username"], data["entry_id"], data.get("date"),
+                   EntrySummary.from_dict(summary) if summary else None,
+                   data.get("previous_date"), data.get("seq"), data.get("time"))
+
+    def __repr__(self):
+        return f"ChangeEvent({self.kind!r}, {self.username!r}, {self.entry_id!r}, {self.date!r})"
+
+
+class EventLog:
+    """Append-only file of change events, one JSON line each, for other processes to tail()"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+
+    def append(self, event):
+        line = json.dumps(event.to_dict(), ensure_ascii=False) + "\n"
+        with self._lock, open(self.filename, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class EventBus:
+    """In-process publish/subscribe of ChangeEvents.
+
+    Subscribers are called synchronously, in the order they subscribed, on
+    the thread that made the change; one that raises is logged and the rest
+    still run. A subscriber can ask for one user's events only, or only some
+    kinds. With a log, every event is also appended to it before delivery.
+    """
+
+    def __init__(self, event_log=None):
+        self.event_log = event_log
+        self.seq = 0
+        self._subscribers = []  # (callback, username or None, kinds or None)
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, username=None, kinds=None):
+        """Call callback(event) for every matching event; returns a function that unsubscribes"""
+        subscriber = (callback, username, frozenset(kinds) if kinds else None)
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+        def unsubscribe():
+            with self._lock:
+                if subscriber in self._subscribers:
+                    self._subscribers.remove(subscriber)
+        return unsubscribe
+
+    def publish(self, event):
+        with self._lock:
+            self.seq += 1
+            event.seq = self.seq
+            subscribers = list(self._subscribers)
+        event.time = event.time or time.time()
+        if self.event_log is not None:
+            self.event_log.append(event)
+        for callback, username, kinds in subscribers:
+            if (username is None or username == event.username) and (kinds is None or event.kind in kinds):
+                try:
+                    callback(event)
+                except Exception:
+                    log.exception("Change event subscriber %r failed on %r", callback, event)
+
+
+def open_event_bus():
+    """An EventBus, logging to the file in DIARY_EVENT_LOG if that is set"""
+    filename = os.environ.get("DIARY_EVENT_LOG")
+    return EventBus(EventLog(filename) if filename else None)
+
+
+def tail(filename, offset=0, follow=False, poll_interval=0.5, stop=None):
+    """Yield (event, offset after it) for the events of a log from a byte offset on.
+
+    With follow=True, keeps waiting for new events (like tail -f) until stop,
+    a threading.Event, is set. A line still being written is only read once
+    it is complete, and the offsets let a reader pick up where it left off.
+    """
+    while True:
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    yield ChangeEvent.from_dict(json.loads(line)), offset
+        if not follow or (stop is not None and stop.is_set()):
+            return
+        if stop is not None:
+            stop.wait(poll_interval)
+        else:
+            time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the change events of a diary event log")
+    parser.add_argument("filename", nargs="?", default=os.environ.get("DIARY_EVENT_LOG", "diary.events.jsonl"))
+    parser.add_argument("--follow", "-f", action="store_true", help="keep printing new events")
+    parser.add_argument("--offset", type=int, default=0, help="byte offset to start from")
+    args = parser.parse_args()
+
+    try:
+        for event, offset in tail(args.filename, args.offset, args.follow):
+            title = event.summary.title if event.summary is not None else ""
+            print(f"{offset:>10}  #{event.seq:<6} {event.kind:<8} {event.username} "
+                  f"entry {event.entry_id} on {event.date}  {title}", flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
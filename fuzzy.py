@@ -0,0 +1,107 @@
+# fuzzy.py
+
+
+def levenshtein(a, b, max_distance=None):
+    """Edit distance between two words, or max_distance + 1 once it is known to be larger"""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,                       # delete
+                               current[j - 1] + 1,                    # insert
+                               previous[j - 1] + (char_a != char_b)))  # replace
+        # Every later row is at least the smallest value of this one
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def deletes(word, max_distance):
+    """The word and every string made by deleting up to max_distance of its characters"""
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+
+# Short words get fewer typos, otherwise almost every short word would match
+def allowed_distance(word, max_distance=2):
+    if len(word) <= 2:
+        return 0
+    if len(word) <= 5:
+        return min(1, max_distance)
+    return max_distance
+
+
+class FuzzyIndex:
+    """Symmetric-delete dictionary over a vocabulary, for typo-tolerant lookups.
+
+    Every term is stored under all the strings made by deleting up to
+    `max_distance` characters of its first `prefix_length` characters. A query
+    word within that distance of a term shares one of those strings with it,
+    so a lookup only checks the terms found under the query's own deletes,
+    instead of comparing the query with the whole vocabulary.
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.terms_by_delete = {}  # deleted variant -> set of terms
+        self.terms = set()
+
+    @classmethod
+    def from_terms(cls, terms, **options):
+        index = cls(**options)
+        for term in terms:
+            index.add(term)
+        return index
+
+    def _variants(self, word, max_distance):
+        return deletes(word[:self.prefix_length], max_distance)
+
+    def add(self, term):
+        if term in self.terms:
+            return
+        self.terms.add(term)
+        for variant in self._variants(term, self.max_distance):
+            self.terms_by_delete.setdefault(variant, set()).add(term)
+
+    def remove(self, term):
+        if term not in self.terms:
+            return
+        self.terms.discard(term)
+        for variant in self._variants(term, self.max_distance):
+            terms = self.terms_by_delete.get(variant)
+            if terms is None:
+                continue
+            terms.discard(term)
+            if not terms:
+                del self.terms_by_delete[variant]
+
+    def lookup(self, word, max_distance=None):
+        """Terms within max_distance edits of a word, as (term, distance) pairs, closest first"""
+        if max_distance is None:
+            max_distance = allowed_distance(word, self.max_distance)
+        max_distance = min(max_distance, self.max_distance)
+
+        candidates = set()
+        for variant in self._variants(word, max_distance):
+            candidates |= self.terms_by_delete.get(variant, set())
+
+        matches = []
+        for term in candidates:
+            distance = levenshtein(word, term, max_distance)
+            if distance <= max_distance:
+                matches.append((term, distance))
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches
@@ -0,0 +1,65 @@
+# indexes.py
+import bisect
+
+
+class DateIndex:
+    """Secondary index of one user's entries: date key -> ids of the entries on that date.
+
+    The distinct dates are also kept sorted, so year and range lookups use
+    bisect instead of looking at every entry.
+    """
+
+    def __init__(self):
+        self.ids_by_date = {}
+        self.date_by_id = {}  # reverse map, so a remove does not depend on the caller's copy of the entry
+        self.dates = []  # sorted distinct date keys
+
+    # Build the index from an id -> entry mapping
+    @classmethod
+    def from_entries(cls, entries):
+        index = cls()
+        for entry in entries.values():
+            index.add(entry["id"], entry["date"])
+        return index
+
+    # Add an entry, or move it if it was indexed under another date
+    def add(self, entry_id, date_key):
+        if self.date_by_id.get(entry_id) not in (None, date_key):
+            self.remove(entry_id)
+        self.date_by_id[entry_id] = date_key
+        ids = self.ids_by_date.get(date_key)
+        if ids is None:
+            ids = self.ids_by_date[date_key] = []
+            bisect.insort(self.dates, date_key)
+        if entry_id not in ids:
+            bisect.insort(ids, entry_id)
+
+    def remove(self, entry_id):
+        date_key = self.date_by_id.pop(entry_id, None)
+        ids = self.ids_by_date.get(date_key)
+        if not ids or entry_id not in ids:
+            return
+        ids.remove(entry_id)
+        if not ids:
+            del self.ids_by_date[date_key]
+            del self.dates[bisect.bisect_left(self.dates, date_key)]
+
+    # Ids of the entries on one date, oldest first
+    def ids_on(self, date_key):
+        return list(self.ids_by_date.get(date_key, ()))
+
+    # Dates between start and end (inclusive), in order
+    def dates_between(self, start, end):
+        lo = bisect.bisect_left(self.dates, start)
+        hi = bisect.bisect_right(self.dates, end)
+        return self.dates[lo:hi]
+
+    def ids_between(self, start, end):
+        ids = []
+        for date_key in self.dates_between(start, end):
+            ids.extend(self.ids_by_date[date_key])
+        return ids
+
+    # Number of entries on each date between start and end
+    def counts_between(self, start, end):
+        return {date_key: len(self.ids_by_date[date_key]) for date_key in self.dates_between(start, end)}
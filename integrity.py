@@ -0,0 +1,297 @@
+# integrity.py
+import argparse
+import json
+import mmap
+import os
+import re
+import shutil
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from entry import Entry, encode_entry
+
+
+# Canonical JSON of an entry's fields: the same text for the same entry, whatever the key order
+_canonical = json.JSONEncoder(sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def entry_checksum(data):
+    """CRC-32 (8 hex digits) of an entry's fields"""
+    fields = {key: value for key, value in data.items() if key != "checksum"}
+    return f"{zlib.crc32(_canonical.encode(fields).encode('utf-8')):08x}"
+
+
+def encode_checked(obj):
+    """JSON hook writing entries with their checksum"""
+    if isinstance(obj, Entry):
+        data = obj.to_dict()
+        data["checksum"] = entry_checksum(data)
+        return data
+    return encode_entry(obj)
+
+
+def verify_entry(data):
+    """Take the checksum off an entry read from disk; False if it does not match. Entries
+    written before checksums were kept have none and pass."""
+    stored = data.pop("checksum", None)
+    return stored is None or stored == entry_checksum(data)
+
+
+# Salvaging a diary file that json cannot parse. The storages write it with
+# indent=4, so every member of an object starts on a line of its own at the
+# same indentation; after a damaged member, parsing picks up again at the
+# next line indented like it (or less, which closes the object).
+
+_decoder = json.JSONDecoder()
+_MEMBER_LINE = re.compile(r'\n( *)(["}])')
+
+
+def _skip_space(text, pos):
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _column(text, pos):
+    return pos - text.rfind("\n", 0, pos) - 1
+
+
+def _resync(text, start, column):
+    """(position, indentation) of the next member starting at column, or of the next line left of it
+    (the end of the object); (len(text), -1) if there is none. A brace at column closes the damaged member."""
+    for match in _MEMBER_LINE.finditer(text, start):
+        indent = len(match.group(1))
+        if indent < column or (indent == column and match.group(2) == '"'):
+            return match.start() + 1, indent
+    return len(text), -1
+
+
+def _decode_member(text, pos):
+    """(key, value start, value, end) of one "key": value member; value and end are None if it is damaged"""
+    key = value_start = None
+    try:
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip_space(text, pos)
+        if not isinstance(key, str) or text[pos:pos + 1] != ":":
+            return None, None, None, None
+        value_start = _skip_space(text, pos + 1)
+        value, end = _decoder.raw_decode(text, value_start)
+    except (ValueError, IndexError):
+        return key if isinstance(key, str) else None, value_start, None, None
+    if text[_skip_space(text, end):_skip_space(text, end) + 1] not in (",", "}"):
+        return key, value_start, None, None
+    return key, value_start, value, end
+
+
+def salvage_object(text, pos, levels, path, damaged):
+    """Decode the object at pos member by member; a damaged member is descended into while
+    levels > 0 (to save what is intact inside it) or else noted in damaged and skipped.
+    Returns (object, end)."""
+    result = {}
+    column = None
+    pos += 1
+    while True:
+        pos = _skip_space(text, pos)
+        if pos >= len(text):
+            return result, pos
+        if text[pos] == "}":
+            return result, pos + 1
+        if text[pos] == ",":
+            pos += 1
+            continue
+        start = pos
+        column = _column(text, start) if column is None else column
+        key, value_start, value, end = _decode_member(text, pos)
+        if end is not None:
+            result[key] = value
+            pos = end
+            continue
+        if levels > 0 and key is not None and value_start is not None and text[value_start:value_start + 1] == "{":
+            result[key], pos = salvage_object(text, value_start, levels - 1, path + [key], damaged)
+            continue
+        pos, indent = _resync(text, start + 1, column)
+        damaged.append({"path": path + [key], "reason": "unreadable", "raw": text[start:pos].rstrip()})
+        if indent < column:  # the object's closing brace was damaged too
+            return result, pos
+
+
+def salvage_users(text):
+    """(parsed file, damaged parts) of a diary file that json cannot parse"""
+    damaged = []
+    header = re.match(r'\s*\{\s*"schema_version"\s*:\s*\d+', text)
+    # Objects whose members are saved one by one: (users,) user, entries/revisions; entries are kept whole
+    levels = 3 if header else 2
+    data, _ = salvage_object(text, max(text.find("{"), 0), levels, [], damaged)
+    users = data.get("users") if header else data
+    for username in list(users or {}):
+        record = users[username]
+        if not isinstance(record, dict) or "password" not in record:
+            damaged.append({"path": (["users"] if header else []) + [username], "reason": "no password left",
+                            "raw": json.dumps(record, default=encode_entry)})
+            del users[username]
+            continue
+        entries = record.setdefault("entries", {})
+        if "next_id" not in record and all(key.isdigit() for key in entries):
+            # Ids must never be handed out twice, even if the counter was lost
+            record["next_id"] = max([int(key) for key in entries] + [0]) + 1
+    return data, damaged
+
+
+def quarantine(filename, damaged):
+    """Keep a copy of the damaged file and the parts that were dropped; returns the folder"""
+    folder = os.path.join(os.path.splitext(filename)[0] + ".quarantine", f"{datetime.now():%Y%m%d-%H%M%S-%f}")
+    os.makedirs(folder, exist_ok=True)
+    shutil.copyfile(filename, os.path.join(folder, os.path.basename(filename)))
+    with open(os.path.join(folder, "damaged.json"), "w") as f:
+        json.dump(damaged, f, indent=4, default=encode_entry)
+    return folder
+
+
+# Scrubbing: every entry of a diary file is re-read and its checksum checked.
+# The file is split into byte ranges checked by worker processes; each one
+# finds the user and section it starts in by looking back for the nearest
+# lines at those indentations. For the mmap storage, whose index points at
+# records in a data file, the workers check slices of the index instead.
+
+_KEY_LINE = re.compile(rb'^( +)"((?:[^"\\\n]|\\.)*)": ', re.M)
+_MMAP_INDEX = re.compile(rb'\{(?:"schema_version": \d+, )?"generation": ')
+_JSON_FILE = re.compile(rb'\s*\{(?:\s*\}|\n {4}")')
+
+
+def _check(raw):
+    """Status of one entry's JSON text: checked, unchecked (saved before checksums) or damaged"""
+    try:
+        entry = json.loads(raw)
+        has_checksum = "checksum" in entry
+        ok = verify_entry(entry)
+    except (ValueError, TypeError, AttributeError):
+        return "damaged"
+    if not ok:
+        return "damaged"
+    return "checked" if has_checksum else "unchecked"
+
+
+def _owner(data, start, indent):
+    """Name on the last line at exactly this indentation before start, or None"""
+    line = data.rfind(b"\n" + b" " * indent + b'"', 0, start)
+    if line < 0:
+        return None
+    match = _KEY_LINE.match(data, line + 1)
+    return json.loads(b'"' + match.group(2) + b'"') if match else None
+
+
+def scrub_range(filename, start, end, base):
+    """Check the entries whose key line starts in [start, end); returns (checked, unchecked, damaged)"""
+    checked = unchecked = 0
+    damaged = []
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        user = _owner(data, start, base + 4)
+        section = _owner(data, start, base + 8)
+        for match in _KEY_LINE.finditer(data, start):
+            if match.start() >= end:
+                break
+            indent, name = len(match.group(1)), json.loads(b'"' + match.group(2) + b'"')
+            if indent == base + 4:
+                user, section = name, None
+            elif indent == base + 8:
+                section = name
+            elif indent == base + 12 and section == "entries":
+                close = data.find(b"\n" + b" " * indent + b"}", match.end())
+                close = len(data) if close < 0 else close + indent + 2
+                status = _check(data[match.end():close])
+                if status == "damaged":
+                    damaged.append({"user": user, "entry": name})
+                elif status == "checked":
+                    checked += 1
+                else:
+                    unchecked += 1
+    return checked, unchecked, damaged
+
+
+def scrub_records(data_filename, records):
+    """Check mmap storage records, given as (user, key, offset, length); returns (checked, unchecked, damaged)"""
+    checked = unchecked = 0
+    damaged = []
+    if not records:
+        return checked, unchecked, damaged
+    if not os.path.exists(data_filename) or not os.path.getsize(data_filename):
+        return checked, unchecked, [{"user": user, "entry": key} for user, key, _, _ in records]
+    with open(data_filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for user, key, offset, length in records:
+            status = _check(data[offset:offset + length]) if offset + length <= len(data) else "damaged"
+            if status == "damaged":
+                damaged.append({"user": user, "entry": key})
+            elif status == "checked":
+                checked += 1
+            else:
+                unchecked += 1
+    return checked, unchecked, damaged
+
+
+# The work of a scrub: the file to check, and the arguments of scrub_range or scrub_records per piece
+def _scrub_pieces(filename, pieces):
+    with open(filename, "rb") as f:
+        head = f.read(256)
+    if _MMAP_INDEX.match(head):
+        with open(filename, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        # Named like MmapDiaryStorage.data_filename
+        data_filename = f"{os.path.splitext(filename)[0]}.{index.get('generation', 0)}.dat"
+        records = [(user, key, pos[0], pos[1]) for user, record in index.get("users", {}).items()
+                   for key, pos in record.get("entries", {}).items()]
+        bounds = [len(records) * i // pieces for i in range(pieces + 1)]
+        return data_filename, scrub_records, [(data_filename, records[bounds[i]:bounds[i + 1]]) for i in range(pieces)]
+    if not _JSON_FILE.match(head):
+        raise ValueError(f"{filename} is neither a diary file nor an mmap storage index")
+    base = 4 if re.match(rb'\s*\{\s*"schema_version"', head) else 0
+    size = os.path.getsize(filename)
+    bounds = [size * i // pieces for i in range(pieces + 1)]
+    return filename, scrub_range, [(filename, bounds[i], bounds[i + 1], base) for i in range(pieces)]
+
+
+def scrub(filename, workers=None, chunks_per_worker=4):
+    """Verify every entry of a diary file, or of an mmap storage given its index file, in parallel;
+    returns a report with throughput. Raises ValueError for a file in neither layout."""
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    checked_file, check, pieces = _scrub_pieces(filename, max(1, workers * chunks_per_worker))
+    size = os.path.getsize(checked_file) if os.path.exists(checked_file) else 0
+    checked = unchecked = 0
+    damaged = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(check, *zip(*pieces)):
+            checked += result[0]
+            unchecked += result[1]
+            damaged += result[2]
+    seconds = time.perf_counter() - started
+    entries = checked + unchecked + len(damaged)
+    return {"entries": entries, "checked": checked, "unchecked": unchecked, "damaged": damaged,
+            "bytes": size, "seconds": seconds, "workers": workers,
+            "entries_per_s": entries / seconds if seconds else 0.0,
+            "mb_per_s": size / 1024 / 1024 / seconds if seconds else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a diary file for damaged entries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scrub_command = commands.add_parser("scrub", help="verify the checksum of every entry")
+    scrub_command.add_argument("filename", nargs="?", default="diary.json",
+                               help="diary file, or the index file of the mmap storage")
+    scrub_command.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        report = scrub(args.filename, args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{report['entries']} entries in {report['seconds']:.2f} s with {report['workers']} workers "
+          f"({report['entries_per_s']:.0f} entries/s, {report['mb_per_s']:.1f} MB/s)")
+    print(f"{report['checked']} verified, {report['unchecked']} without a checksum yet, "
+          f"{len(report['damaged'])} damaged")
+    for item in report["damaged"]:
+        print(f"  damaged: user {item['user']!r}, entry {item['entry']}")
+
+
+if __name__ == "__main__":
+    main()
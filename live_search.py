@@ -0,0 +1,119 @@
+# live_search.py
+import threading
+from collections import OrderedDict
+
+
+class SearchCancelled(Exception):
+    """Raised inside a search when its query has been superseded"""
+    pass
+
+
+class CancelToken:
+    """Flag shared between the UI and a running search so the search can stop early"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    # Called by long loops; raises once the search has been cancelled
+    def check(self):
+        if self._event.is_set():
+            raise SearchCancelled()
+
+
+class QueryCache:
+    """LRU cache of recent query -> results, kept separately for every user.
+
+    Diary clears a user's part of the cache whenever one of their entries
+    is created, edited or deleted.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._users = {}  # username -> OrderedDict of key -> results
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username, key):
+        with self._lock:
+            cached = self._users.get(username)
+            if cached is None or key not in cached:
+                self.misses += 1
+                return None
+            cached.move_to_end(key)
+            self.hits += 1
+            return cached[key]
+
+    def put(self, username, key, results):
+        with self._lock:
+            cached = self._users.setdefault(username, OrderedDict())
+            cached[key] = results
+            cached.move_to_end(key)
+            while len(cached) > self.max_entries:
+                cached.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._users.pop(username, None)
+
+
+class LiveSearch:
+    """Ranked keyword search for one user that is re-run as the query is typed.
+
+    Results come from the diary's query cache when possible. When the new
+    query only extends the previous one (more letters or more words), it can
+    only match a subset of the previous results, so those are the only
+    candidates scored.
+    """
+
+    def __init__(self, diary, username):
+        self.diary = diary
+        self.username = username
+        self.last_key = None
+        self.last_ids = None
+        self.last_generation = None
+
+    def search(self, query, tag_query=None, cancel=None, fuzzy=False):
+        """Return the (score, id) ranking for a query, or raise SearchCancelled"""
+        query = query.strip().lower()
+        key = ("fuzzy" if fuzzy else "rank", query, tag_query or "")
+        generation = self.diary.generation(self.username)
+
+        cached = self.diary.query_cache.get(self.username, key)
+        if cached is not None:
+            self._remember(key, cached, generation)
+            return cached
+
+        candidates = self.diary.filter_ids(self.username, tag_query or None)
+        if self._extends_last(key, generation):
+            candidates = self.last_ids if candidates is None else candidates & self.last_ids
+
+        ranking = self.diary.rank(query, self.username, candidates, cancel, fuzzy)
+
+        # Don't cache results computed against entries that changed meanwhile
+        if self.diary.generation(self.username) == generation:
+            self.diary.query_cache.put(self.username, key, ranking)
+            self._remember(key, ranking, generation)
+        return ranking
+
+    def _extends_last(self, key, generation):
+        if self.last_key is None or generation != self.last_generation:
+            return False
+        kind, query, tags = key
+        last_kind, last_query, last_tags = self.last_key
+        # Typo-tolerant matches of a longer word are not a subset of those of a shorter one
+        if kind != "rank" or last_kind != "rank":
+            return False
+        return tags == last_tags and last_query and query.startswith(last_query)
+
+    def _remember(self, key, ranking, generation):
+        self.last_key = key
+        self.last_ids = {entry_id for _, entry_id in ranking}
+        self.last_generation = generation
@@ -1,18 +1,32 @@
 
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox
 import calendar
 from datetime import datetime, date
-from typing import Dict, Optional, List
-from storage import DiaryStorage
+from mmap_storage import open_storage
 from diary import Diary
-import json, os
+from events import open_event_bus, DELETED
+from ranking import mark_highlights
+from live_search import LiveSearch, CancelToken, SearchCancelled
+from locks import ReadWriteLock
+from metrics import METRICS, timed
+from profiling import PROFILER, profiled
+from stall_detector import StallDetector
+import logging
+import os, sys
+import bisect
+import queue
+import threading
 
 
 currUser = {
     "name": ""
 }
 
+# Background searches read the diary under this lock; every change made from the UI takes it to write,
+# so a search never sees the indexes half-updated
+diary_lock = ReadWriteLock()
+
 
 class DiaryExceptions:
     """Custom exception classes for diary application frontend"""
@@ -127,21 +141,21 @@ class LoginDialog:
             messagebox.showerror("Login Error", "Please enter both username and password!")
             return
 
-        try:
-            with open("diary.json", "r") as f:
-                users = json.load(f)
-        except FileNotFoundError:
-            messagebox.showerror("Login Error", "User does not exist")
+        store = self._open_store("Login Error")
+        if store is None:
             return
 
         # Check if user exists
-        if self.username not in users:
-            messagebox.showerror("Login Error", "User does not exist!")
+        if self.username not in store.users:
+            if any(self.username in part["path"][:2] for part in getattr(store, "damaged", [])):
+                messagebox.showerror("Login Error", "This user's data is damaged and was set aside in\n"
+                                     f"{store.quarantine_folder}")
+            else:
+                messagebox.showerror("Login Error", "User does not exist!")
             return
 
         # Validate password
-        stored_password = users[self.username]["password"]
-        if self.password == stored_password:
+        if store.validate_user(self.username, self.password):
             self.success = True
             messagebox.showinfo("Success", "Login successful!")
             currUser["name"] = self.username
@@ -151,6 +165,22 @@ class LoginDialog:
             self.password_entry.delete(0, tk.END)
             self.password_entry.focus()
 
+    def _open_store(self, title):
+        """Opens the diary storage, or shows why it can't be opened and returns None. Damaged
+        records are set aside by the storage when it loads; say so once, since they are missing now"""
+        try:
+            store = open_storage()
+        except (OSError, ValueError) as error:
+            messagebox.showerror(title, f"The diary could not be opened:\n{error}")
+            return None
+        if getattr(store, "damaged", None):
+            messagebox.showwarning(
+                "Diary Repaired",
+                f"{len(store.damaged)} damaged record(s) could not be read and were set aside in\n"
+                f"{store.quarantine_folder}\nEverything else was loaded."
+            )
+        return store
+
     def _open_register_dialog(self):
         """Opens a dialog for registering a new user"""
         reg_dialog = tk.Toplevel(self.dialog)
@@ -191,23 +221,18 @@ class LoginDialog:
                 """UI-only password match check"""
                 if password_entry.get() != confirm_entry.get():
                     messagebox.showerror("Error", "Passwords do not match!")
+                    return
                 else:
                     username = username_entry.get().strip()
 
-                    users = {}
-                    if os.path.exists("diary.json"):
-                        with open("diary.json", "r") as f:
-                            try:
-                                users = json.load(f)
-                            except json.JSONDecodeError:
-                                users = {}
-
-                    if username in users:
+                    store1 = self._open_store("Error")
+                    if store1 is None:
+                        return
+                    if username in store1.users:
                         messagebox.showerror("Error", f"User '{username}' already exists!")
                         return
 
                 messagebox.showinfo("Success", "User registered.")
-                store1 = DiaryStorage()
                 store1.add_user(username, password_entry.get())
                 reg_dialog.destroy()
 
@@ -223,9 +248,10 @@ class LoginDialog:
 class CalendarWidget:
     """Custom calendar widget for intuitive date navigation"""
     
-    def __init__(self, parent, date_callback):
+    def __init__(self, parent, date_callback, entry_counts=None):
         self.parent = parent
         self.date_callback = date_callback  # Callback when date is selected
+        self.entry_counts = entry_counts  # Callback giving {date_key: count} for a date range
         self.current_date = datetime.now()
         self.selected_date = date.today()
         
@@ -304,6 +330,7 @@ class CalendarWidget:
         self._update_calendar_display()
         self.date_callback(self.selected_date)
     
+    @timed("ui.calendar.update_display")
     def _update_calendar_display(self):
         """Updates the calendar display with current month"""
         # Clear existing calendar
@@ -326,6 +353,12 @@ class CalendarWidget:
         cal_matrix = calendar.monthcalendar(self.current_date.year, 
                                            self.current_date.month)
         
+        # Number of entries on each day of the month, from the date index
+        counts = {}
+        if self.entry_counts:
+            month_prefix = f"{self.current_date.year:04d}-{self.current_date.month:02d}"
+            counts = self.entry_counts(f"{month_prefix}-01", f"{month_prefix}-31")
+
         # Create day buttons
         today = date.today()
         for week_num, week in enumerate(cal_matrix, 1):
@@ -340,12 +373,10 @@ class CalendarWidget:
                                      self.current_date.month, day)
                     
                     # Style button based on state
-                    button_text = str(day)
-                    if button_date == today:
-                        button_text = f"[{day}]"  # Mark today
+                    button_text = self._day_text(button_date, counts.get(button_date.strftime("%Y-%m-%d"), 0), today)
                     
                     day_button = ttk.Button(self.calendar_grid, text=button_text, 
-                                          width=3,
+                                          width=4,
                                           command=lambda d=button_date: self._select_date(d))
                     day_button.grid(row=week_num, column=day_num, padx=1, pady=1, 
                                   sticky='nsew')
@@ -357,6 +388,27 @@ class CalendarWidget:
                     if button_date == self.selected_date:
                         day_button.configure(style='Accent.TButton')
     
+    def _day_text(self, button_date, count, today=None):
+        """Label of a day button: today in brackets, then a dot (and the count) if it has entries"""
+        button_text = str(button_date.day)
+        if button_date == (today or date.today()):
+            button_text = f"[{button_date.day}]"  # Mark today
+        if count:
+            button_text += "•" if count == 1 else f"•{count}"  # Mark days with entries
+        return button_text
+
+    def apply_change(self, event):
+        """Relabels only the day buttons whose entry count a change event touched"""
+        for date_key in event.dates():
+            try:
+                button_date = datetime.strptime(date_key, "%Y-%m-%d").date()
+            except (TypeError, ValueError):
+                continue
+            button = self.day_buttons.get(button_date)
+            if button is not None:
+                count = self.entry_counts(date_key, date_key).get(date_key, 0) if self.entry_counts else 0
+                button.configure(text=self._day_text(button_date, count))
+
     def _select_date(self, selected_date):
         """Handles date selection"""
         self.selected_date = selected_date
@@ -374,13 +426,13 @@ class CalendarWidget:
 class EntriesViewer:
     """Window to display all diary entries in list format (robust and clickable)"""
 
-    def __init__(self, parent, entries, open_callback=None):
-        store1 = DiaryStorage()
+    def __init__(self, parent, diary, open_callback=None):
         self.parent = parent
-        self.entries = store1.list_entries(currUser["name"])  # expected to be dict keyed by "YYYY-MM-DD"
+        self.entries = diary.store.list_summaries(currUser["name"])  # entry id -> summary (no bodies)
         self.open_callback = open_callback
         self.ascending = True
-        self.id_map = {}  # map tree iid -> date_key
+        self.id_map = {}  # map tree iid -> entry
+        self.sort_keys = []  # (date ordinal, id) of every row, ascending, to find where a changed row goes
 
 
         # Create viewer window
@@ -445,6 +497,23 @@ class EntriesViewer:
         # Load entries initially
         self.load_entries()
 
+        # From now on, saves and deletes update single rows instead of reloading the list
+        unsubscribe = diary.events.subscribe(self.apply_change, username=currUser["name"])
+        self.window.bind("<Destroy>", lambda event: unsubscribe() if event.widget is self.window else None)
+
+    @staticmethod
+    def _sort_key(entry):
+        return (entry.date_ord or 0, entry.id)
+
+    @staticmethod
+    def _row_values(entry):
+        def preview_text(text, limit=10):
+            return text[:limit] + "..." if len(text) > limit else text
+
+        return (entry.date, preview_text(entry.title, 8) or "Untitled", preview_text(entry.preview, 20))
+
+    @timed("ui.entries_viewer.load_entries")
+    @profiled("entries_viewer.load_entries")
     def load_entries(self):
         """Load entries into the treeview with stable iids and an id_map"""
         # clear previous
@@ -452,30 +521,46 @@ class EntriesViewer:
             self.tree.delete(row)
         self.id_map.clear()
 
-        # Build sorted list of entries (entries is a dict of date_key -> MockDiaryEntry)
+        # Build sorted list of entries (entries maps entry id -> summary), several per day ordered by id
         sorted_entries = sorted(
             self.entries.values(),
-            key=lambda e: datetime.strptime(e['date'], "%Y-%m-%d"),
+            key=self._sort_key,
             reverse=not self.ascending
         )
-
-        def preview_text(text, limit=10):
-            return text[:limit] + "..." if len(text) > limit else text
-
-        # Insert with sequential iids and store mapping to date_key
-        for idx, entry in enumerate(sorted_entries):
-            dt = datetime.strptime(entry['date'], "%Y-%m-%d")
-            iid = str(idx)
-            self.id_map[iid] = entry['date']  # date_key (YYYY-MM-DD)
+        self.sort_keys = [self._sort_key(entry) for entry in sorted_entries]
+        if not self.ascending:
+            self.sort_keys.reverse()
+
+        # Insert with the entry ids as iids and store mapping to the entry
+        for entry in sorted_entries:
+            iid = str(entry['id'])
+            self.id_map[iid] = entry
             self.tree.insert(
                 "",
                 tk.END,
                 iid=iid,
-                values=(dt.strftime("%Y-%m-%d"), preview_text(entry['title'], 8) or "Untitled", preview_text(entry['content'], 20))
+                values=self._row_values(entry)
             )
 
+    def apply_change(self, event):
+        """Removes, adds or moves the one row a change event is about"""
+        iid = str(event.entry_id)
+        old = self.id_map.pop(iid, None)
+        if old is not None:
+            del self.sort_keys[bisect.bisect_left(self.sort_keys, self._sort_key(old))]
+            self.tree.delete(iid)
+        if event.kind == DELETED or event.summary is None:
+            return
+        entry = event.summary
+        position = bisect.bisect_left(self.sort_keys, self._sort_key(entry))
+        self.sort_keys.insert(position, self._sort_key(entry))
+        self.id_map[iid] = entry
+        row = position if self.ascending else len(self.sort_keys) - 1 - position
+        self.tree.insert("", row, iid=iid, values=self._row_values(entry))
+
     def toggle_order(self):
         self.ascending = not self.ascending
+        self.entries = dict(self.id_map)  # the rows as they are now, changes included
         self.load_entries()
 
     def _open_selected_entry(self, event=None):
@@ -486,16 +571,16 @@ class EntriesViewer:
             return
 
         iid = selection[0]
-        date_key = self.id_map.get(iid)
-        if not date_key:
+        entry = self.id_map.get(iid)
+        if not entry:
             messagebox.showerror("Error", "Could not resolve selected entry.")
             return
 
-        # If the caller provided an open_callback, call it with a date object
+        # If the caller provided an open_callback, call it with a date object and the entry id
         if self.open_callback:
             try:
-                parsed_date = datetime.strptime(date_key, "%Y-%m-%d").date()
-                self.open_callback(parsed_date)
+                parsed_date = datetime.strptime(entry['date'], "%Y-%m-%d").date()
+                self.open_callback(parsed_date, entry['id'])
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to open entry: {e}")
         else:
@@ -505,12 +590,307 @@ class EntriesViewer:
 
 
 
+class RevisionsViewer:
+    """Window listing the saved revisions of one entry, with diff and restore"""
+
+    def __init__(self, parent, diary, entry_id, restore_callback=None):
+        self.diary = diary
+        self.entry_id = entry_id
+        self.restore_callback = restore_callback
+
+        self.window = tk.Toplevel(parent)
+        self.window.title(f"🕘 Revision History - Entry #{entry_id}")
+        self.window.geometry("640x480")
+        self.window.transient(parent)
+        self.window.grab_set()
+
+        main_frame = ttk.Frame(self.window, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(main_frame, columns=("Rev", "Saved", "Changed"),
+                                 show="headings", height=8)
+        self.tree.heading("Rev", text="Revision")
+        self.tree.heading("Saved", text="Replaced At")
+        self.tree.heading("Changed", text="Changed Fields")
+        self.tree.column("Rev", width=80, anchor=tk.CENTER)
+        self.tree.column("Saved", width=180, anchor=tk.CENTER)
+        self.tree.column("Changed", width=200, anchor=tk.CENTER)
+        self.tree.pack(fill=tk.X)
+        self.tree.bind("<<TreeviewSelect>>", self._show_diff)
+
+        # Diff against the current entry for the selected revision
+        self.diff_text = tk.Text(main_frame, wrap=tk.NONE, font=('Courier', 10), height=14)
+        self.diff_text.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(fill=tk.X, pady=8)
+        ttk.Button(btn_frame, text="↩ Restore Selected", command=self._restore_selected).pack(side=tk.LEFT, padx=6)
+        ttk.Button(btn_frame, text="Close", command=self.window.destroy).pack(side=tk.RIGHT, padx=6)
+
+        self._load_revisions()
+
+    def _load_revisions(self):
+        """Fills the list with the revisions, newest first"""
+        for row in self.tree.get_children():
+            self.tree.delete(row)
+        for revision in reversed(self.diary.list_revisions(self.entry_id, currUser["name"])):
+            self.tree.insert("", tk.END, iid=str(revision["rev"]),
+                             values=(revision["rev"], revision["saved_at"], ", ".join(revision["fields"])))
+
+    def _selected_rev(self):
+        selection = self.tree.selection()
+        return int(selection[0]) if selection else None
+
+    def _show_diff(self, event=None):
+        """Shows what changed between the selected revision and the current entry"""
+        rev = self._selected_rev()
+        if rev is None:
+            return
+        self.diff_text.delete(1.0, tk.END)
+        self.diff_text.insert(1.0, self.diary.diff_revisions(self.entry_id, currUser["name"], rev) or "No differences")
+
+    def _restore_selected(self):
+        """Restores the selected revision as the current entry"""
+        rev = self._selected_rev()
+        if rev is None:
+            messagebox.showinfo("Selection", "Please select a revision to restore!")
+            return
+        if not messagebox.askyesno("Restore Revision", f"Replace the current entry with revision {rev}?"):
+            return
+        with diary_lock.writing():
+            restored = self.diary.restore_revision(self.entry_id, currUser["name"], rev)
+        if self.restore_callback:
+            self.restore_callback(datetime.strptime(restored["date"], "%Y-%m-%d").date(), self.entry_id)
+        self.window.destroy()
+
+
+class AutocompleteDropdown:
+    """Suggestion list shown under an entry box while typing"""
+
+    def __init__(self, entry, suggest, select, limit=8):
+        self.entry = entry
+        self.suggest = suggest  # text -> list of (label, value)
+        self.select = select  # called with the chosen value
+        self.limit = limit
+        self.suggestions = []
+        self.popup = None
+        self.listbox = None
+
+        entry.bind('<KeyRelease>', self._on_key, add='+')
+        entry.bind('<Down>', self._focus_list, add='+')
+        entry.bind('<Escape>', lambda e: self.hide(), add='+')
+        entry.bind('<FocusOut>', lambda e: entry.after(150, self._hide_unless_focused), add='+')
+
+    def _on_key(self, event):
+        """Refreshes the suggestions for the text typed so far"""
+        if event.keysym in ('Down', 'Up', 'Escape', 'Return', 'Tab'):
+            return
+        self.suggestions = self.suggest(self.entry.get())[:self.limit]
+        if self.suggestions:
+            self._show()
+        else:
+            self.hide()
+
+    def _show(self):
+        """Shows the suggestion list right under the entry box"""
+        if self.popup is None:
+            self.popup = tk.Toplevel(self.entry)
+            self.popup.overrideredirect(True)
+            self.listbox = tk.Listbox(self.popup, font=('Arial', 10), activestyle='dotbox')
+            self.listbox.pack(fill=tk.BOTH, expand=True)
+            self.listbox.bind('<Return>', self._choose)
+            self.listbox.bind('<Double-1>', self._choose)
+            self.listbox.bind('<Escape>', lambda e: self._back_to_entry())
+
+        self.listbox.delete(0, tk.END)
+        for label, _ in self.suggestions:
+            self.listbox.insert(tk.END, label)
+        self.listbox.config(height=len(self.suggestions))
+
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self.popup.geometry(f"{self.entry.winfo_width()}x{self.listbox.winfo_reqheight()}+{x}+{y}")
+        self.popup.lift()
+
+    def _focus_list(self, event=None):
+        """Moves the keyboard focus into the suggestion list"""
+        if self.popup is None:
+            return None
+        self.listbox.focus_set()
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(0)
+        self.listbox.activate(0)
+        return "break"
+
+    def _back_to_entry(self):
+        self.hide()
+        self.entry.focus_set()
+
+    def _choose(self, event=None):
+        """Hands the chosen suggestion to the select callback"""
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        value = self.suggestions[selection[0]][1]
+        self.hide()
+        self.select(value)
+
+    def _hide_unless_focused(self):
+        if self.popup is not None and self.entry.focus_get() is not self.listbox:
+            self.hide()
+
+    def hide(self):
+        if self.popup is not None:
+            self.popup.destroy()
+            self.popup = None
+            self.listbox = None
+
+
+class StatisticsViewer:
+    """Window with the writing statistics of the current user"""
+
+    BAR_WIDTH = 30  # Characters of the longest bar in the charts
+
+    def __init__(self, parent, diary):
+        self.diary = diary
+        self.window = tk.Toplevel(parent)
+        self.window.title("📊 Diary Statistics")
+        self.window.geometry("560x620")
+        self.window.transient(parent)
+
+        main_frame = ttk.Frame(self.window, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.text = text = tk.Text(main_frame, wrap=tk.NONE, font=('Courier', 10))
+        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=text.yview)
+        text.configure(yscrollcommand=scrollbar.set)
+        text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self._render()
+
+        ttk.Button(self.window, text="Close", command=self.window.destroy).pack(pady=8)
+
+        # The running statistics are already updated by the diary; redraw them after every change
+        unsubscribe = diary.events.subscribe(lambda event: self._render(), username=currUser["name"])
+        self.window.bind("<Destroy>", lambda event: unsubscribe() if event.widget is self.window else None)
+
+    def _render(self):
+        """Writes the current statistics into the text box, keeping the scroll position"""
+        top = self.text.yview()[0]
+        self.text.config(state='normal')
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, self._report(self.diary.stats(currUser["name"]).summary()))
+        self.text.config(state='disabled')
+        self.text.yview_moveto(top)
+
+    def _bars(self, rows):
+        """Text bar chart of (label, value) rows"""
+        largest = max((value for _, value in rows), default=0) or 1
+        return "\n".join(f"  {label:>8} {'█' * round(value * self.BAR_WIDTH / largest):<{self.BAR_WIDTH}} {value}"
+                         for label, value in rows)
+
+    def _report(self, summary):
+        """Formats the statistics summary as text"""
+        streaks = summary["streaks"]
+        longest = ""
+        if streaks["longest"]:
+            longest = f" ({streaks['longest_start']} to {streaks['longest_end']})"
+        top_words = ", ".join(f"{word} ({count})" for word, count in summary["top_words"]) or "-"
+        hours = [(f"{hour:02d}:00", count) for hour, count in enumerate(summary["entries_by_hour"])]
+
+        return f"""📝 Total Entries: {summary['total_entries']}
+📖 Total Words: {summary['total_words']}
+⭐ Average Words per Entry: {summary['average_words']}
+📅 Days with Entries: {summary['days_with_entries']}
+🔥 Current Streak: {streaks['current']} days
+🏆 Longest Streak: {streaks['longest']} days{longest}
+
+Most used words:
+  {top_words}
+
+Words per month (last 12):
+{self._bars(summary['words_by_month'])}
+
+Words per week (last 12):
+{self._bars(summary['words_by_week'])}
+
+Words per day (last 14 days written):
+{self._bars(summary['words_by_day'])}
+
+Entries by time of day:
+{self._bars(hours)}
+"""
+
+
+class DiagnosticsViewer:
+    """Window with the operation timings and counters collected by metrics.METRICS"""
+
+    def __init__(self, parent, stall_detector=None):
+        self.stall_detector = stall_detector
+        self.window = tk.Toplevel(parent)
+        self.window.title("🩺 Diagnostics")
+        self.window.geometry("760x560")
+        self.window.transient(parent)
+
+        main_frame = ttk.Frame(self.window, padding="10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.text = tk.Text(main_frame, wrap=tk.NONE, font=('Courier', 10))
+        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.text.yview)
+        self.text.configure(yscrollcommand=scrollbar.set)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        button_frame = ttk.Frame(self.window)
+        button_frame.pack(pady=8)
+        ttk.Button(button_frame, text="Refresh", command=self._refresh).pack(side=tk.LEFT, padx=4)
+        ttk.Button(button_frame, text="Reset", command=self._reset).pack(side=tk.LEFT, padx=4)
+        ttk.Button(button_frame, text="Close", command=self.window.destroy).pack(side=tk.LEFT, padx=4)
+        self._refresh()
+
+    def _report(self):
+        """Text shown in the window"""
+        report = METRICS.report() + "\n" + PROFILER.report()
+        if self.stall_detector is not None:
+            report += "\n" + self.stall_detector.report()
+        return report
+
+    def _refresh(self):
+        self.text.config(state='normal')
+        self.text.delete(1.0, tk.END)
+        self.text.insert(tk.END, self._report())
+        self.text.config(state='disabled')
+
+    def _reset(self):
+        METRICS.reset()
+        self._refresh()
+
+
 class SearchDialog:
     """Search dialog for finding diary entries"""
+
+    PAGE_SIZE = 50  # Results inserted into the list at a time
+    SEARCH_DELAY_MS = 250  # Wait for a pause in typing before searching
+    POLL_MS = 30  # How often finished background searches are picked up
     
-    def __init__(self, parent, search_callback):
+    def __init__(self, parent, diary, search_callback):
         self.parent = parent
+        self.diary = diary
         self.search_callback = search_callback
+        self.pending_rows = []  # Ranked (score, id) pairs or entries not shown yet
+        self.shown_count = 0
+        self.keyword = ""
+        self.fuzzy = False  # Whether the listed results allow typos
+
+        # Search-as-you-type state: keyword searches run on a worker thread and
+        # hand their results back through a queue read from the Tk event loop
+        self.live_search = LiveSearch(diary, currUser["name"])
+        self.results_queue = queue.Queue()
+        self.search_serial = 0  # Only results of the latest search are shown
+        self.cancel_token = None
+        self.delay_job = None
+        self.poll_job = None
         
         # Create search dialog
         self.dialog = tk.Toplevel(parent)
@@ -518,6 +898,7 @@ class SearchDialog:
         self.dialog.geometry("500x600")
         self.dialog.transient(parent)
         self.dialog.grab_set()
+        self.dialog.protocol("WM_DELETE_WINDOW", self._close)
         
         # Center dialog
         self._center_dialog()
@@ -548,6 +929,18 @@ class SearchDialog:
         self.search_entry = ttk.Entry(search_frame, font=('Arial', 11))
         self.search_entry.pack(fill=tk.X, pady=(5, 10))
         self.search_entry.bind('<Return>', lambda e: self._perform_search())
+        self.search_entry.bind('<KeyRelease>', self._schedule_search)
+
+        # Past titles matching what is typed; choosing one opens that entry
+        self.title_dropdown = AutocompleteDropdown(self.search_entry, self._suggest_titles,
+                                                   self._open_entry)
+
+        ttk.Label(search_frame, text="Tags (e.g. work AND (home OR travel) NOT sick):", 
+                 font=('Arial', 11)).pack(anchor=tk.W)
+        self.tags_entry = ttk.Entry(search_frame, font=('Arial', 11))
+        self.tags_entry.pack(fill=tk.X, pady=(5, 10))
+        self.tags_entry.bind('<Return>', lambda e: self._perform_search())
+        self.tags_entry.bind('<KeyRelease>', self._schedule_search)
         
         # Search options
         options_frame = ttk.Frame(search_frame)
@@ -560,24 +953,34 @@ class SearchDialog:
         row1.pack(fill=tk.X, pady=5)
 
         ttk.Radiobutton(row1, text="Search for titles and content", 
-                       variable=self.search_option, value="titleContent").pack(side=tk.LEFT)
+                       variable=self.search_option, value="titleContent",
+                       command=self._schedule_search).pack(side=tk.LEFT)
         ttk.Radiobutton(row1, text="Search for dates (format: 2025-04-31)", 
-                       variable=self.search_option, value="date").pack(side=tk.LEFT, padx=(20, 0))
+                       variable=self.search_option, value="date",
+                       command=self._schedule_search).pack(side=tk.LEFT, padx=(20, 0))
 
         # Second row frame
         row2 = ttk.Frame(options_frame)
         row2.pack(fill=tk.X, pady=5)
 
         ttk.Radiobutton(row2, text="Search for day (format: 31)", 
-                       variable=self.search_option, value="day").pack(side=tk.LEFT)
+                       variable=self.search_option, value="day",
+                       command=self._schedule_search).pack(side=tk.LEFT)
         ttk.Radiobutton(row2, text="Search for month (format: 05)", 
-                       variable=self.search_option, value="month").pack(side=tk.LEFT, padx=(20, 0))
+                       variable=self.search_option, value="month",
+                       command=self._schedule_search).pack(side=tk.LEFT, padx=(20, 0))
         
          # Third row frame
         row3 = ttk.Frame(options_frame)
         row3.pack(fill=tk.X, pady=5)    
         ttk.Radiobutton(row3, text="Search for year (format: 2025)", 
-               variable=self.search_option, value="year").pack(side=tk.LEFT)
+               variable=self.search_option, value="year",
+                       command=self._schedule_search).pack(side=tk.LEFT)
+
+        # Typo-tolerant keyword search ("cofee" finds "coffee")
+        self.fuzzy_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(row3, text="Allow typos", variable=self.fuzzy_var,
+                        command=self._schedule_search).pack(side=tk.LEFT, padx=(20, 0))
         
         # Search button
         ttk.Button(search_frame, text="🔍 Search", 
@@ -621,62 +1024,211 @@ class SearchDialog:
         
         ttk.Button(button_frame, text="Open Selected", 
                   command=self._open_selected_entry).pack(side=tk.LEFT)
+        self.load_more_btn = ttk.Button(button_frame, text="⬇ Load More", 
+                                        command=self._load_more, state='disabled')
+        self.load_more_btn.pack(side=tk.LEFT, padx=(10, 0))
         ttk.Button(button_frame, text="Close", 
-                  command=self.dialog.destroy).pack(side=tk.RIGHT)
+                  command=self._close).pack(side=tk.RIGHT)
+
+        self.count_label = ttk.Label(button_frame, text="")
+        self.count_label.pack(side=tk.RIGHT, padx=(0, 10))
         
         # Focus on search entry
         self.search_entry.focus()
     
+    def _suggest_titles(self, text):
+        """Title suggestions, only while searching titles and content"""
+        if self.search_option.get() != "titleContent":
+            return []
+        return [(f"{e['title']}  ({e['date']})", e)
+                for e in self.diary.complete_titles(text, currUser["name"])]
+
+    def _open_entry(self, entry):
+        """Opens an entry chosen from the title suggestions"""
+        self.search_callback(datetime.strptime(entry['date'], "%Y-%m-%d").date(), entry['id'])
+        self._close()
+
+    def _schedule_search(self, event=None):
+        """Runs the search once typing pauses for SEARCH_DELAY_MS"""
+        if event is not None and event.keysym in ('Return', 'Tab', 'Shift_L', 'Shift_R', 'Control_L', 'Control_R'):
+            return
+        if self.delay_job is not None:
+            self.dialog.after_cancel(self.delay_job)
+        self.delay_job = self.dialog.after(self.SEARCH_DELAY_MS, self._start_search)
+
+    @profiled("search.perform_search")
     def _perform_search(self):
-        """Performs the search operation - Frontend simulation"""
+        """Searches right away (Search button or Enter)"""
         search_term = self.search_entry.get().strip()
+        tag_query = self.tags_entry.get().strip()
         
-        if not search_term:
-            messagebox.showwarning("Search", "Please enter a search term!")
+        if not search_term and not tag_query:
+            messagebox.showwarning("Search", "Please enter a search term or a tag query!")
             return
         
         if not (self.search_option.get()):
             messagebox.showwarning("Search", "Please select at least one search option!")
             return
-        
-        # Clear previous results
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
 
-        diary1 = Diary()
+        self._start_search(show_errors=True)
+
+    @timed("ui.search.start")
+    @profiled("search.start_search")
+    def _start_search(self, show_errors=False):
+        """Starts a search for the current inputs, superseding any search still running"""
+        if self.delay_job is not None:
+            self.dialog.after_cancel(self.delay_job)
+            self.delay_job = None
+
+        # Whatever is still running belongs to an older query
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_token = None
+        self.search_serial += 1
+
+        search_term = self.search_entry.get().strip()
+        tag_query = self.tags_entry.get().strip()
+        if not search_term and not tag_query:
+            self._show_results(None, [])
+            self.count_label.config(text="")
+            return
 
         search_choice = self.search_option.get()
 
-        if(search_choice == "titleContent"):
-            results = diary1.search_by_keyword(search_term, currUser["name"])
-        elif(search_choice == "date"):
-            results = diary1.search_by_date(search_term, currUser["name"])
-        elif(search_choice == "month"):
-            results = diary1.search_by_date(search_term, currUser["name"], "month")
-        elif(search_choice == "day"):
-            results = diary1.search_by_date(search_term, currUser["name"], "day")
-        elif(search_choice == "year"):
-            results = diary1.search_by_date(search_term, currUser["name"], "year")
-
-        # Mock search results for demonstration
-        # mock_results = [
-        #     {"date": "2024-01-15", "title": "Morning Thoughts", 
-        #      "preview": f"Found '{search_term}' in this entry about daily reflections..."},
-        #     {"date": "2024-02-03", "title": "Weekend Adventures", 
-        #      "preview": f"This entry contains '{search_term}' and describes outdoor activities..."},
-        #     {"date": "2024-02-20", "title": "", 
-        #      "preview": f"Untitled entry with '{search_term}' mentioned in the content..."}
-        # ]
-        
-        # Populate results
-        for i, result in enumerate(results, 1):
-            self.results_tree.insert('', tk.END, 
+        # The search term is a keyword or a date filter depending on the option, and is combined with the tags
+        keyword = search_term if search_choice == "titleContent" else None
+        date_filter = search_term if search_choice != "titleContent" else None
+        date_type = search_choice if search_choice in ("day", "month", "year") else None
+
+        if keyword:
+            # Keyword matches are ranked with BM25 on a worker thread so typing stays responsive
+            token = CancelToken()
+            self.cancel_token = token
+            self.count_label.config(text="Searching…")
+            threading.Thread(target=self._run_search, daemon=True,
+                             args=(self.search_serial, keyword, tag_query, token, show_errors,
+                                   self.fuzzy_var.get())).start()
+            if self.poll_job is None:
+                self.poll_job = self.dialog.after(self.POLL_MS, self._poll_results)
+            return
+
+        # Date and tag filters are answered from the indexes, which is quick enough to do here
+        try:
+            results = self.diary.search(currUser["name"], tag_query=tag_query or None,
+                                        date=date_filter, date_type=date_type)
+        except ValueError as e:
+            self._show_error(e, show_errors)
+            return
+        self._show_results(None, results)
+
+    @profiled("search.run_search")
+    def _run_search(self, serial, keyword, tag_query, token, show_errors, fuzzy):
+        """Worker thread body; never touches Tk widgets. Any error is handed back to be shown"""
+        try:
+            results = self._locked_search(keyword, tag_query, token, fuzzy)
+            # Nothing spelled exactly like the query: try close spellings instead
+            if not results and not fuzzy:
+                fuzzy = True
+                results = self._locked_search(keyword, tag_query, token, fuzzy)
+        except SearchCancelled:
+            return
+        except Exception as e:
+            results = e
+        self.results_queue.put((serial, keyword, results, show_errors, fuzzy))
+
+    def _locked_search(self, keyword, tag_query, token, fuzzy):
+        """Runs one search under the read lock. Missing indexes (and the typo-tolerant lookup table)
+        are built first under the write lock, so concurrent searches only look them up"""
+        username = currUser["name"]
+        while True:
+            with diary_lock.reading():
+                if self.diary.indexes_built(username) and (
+                        not fuzzy or self.diary._search_index(username).fuzzy_ready()):
+                    return self.live_search.search(keyword, tag_query or None, token, fuzzy)
+            with diary_lock.writing():
+                self.diary.build_indexes(username)
+                if fuzzy:
+                    self.diary._search_index(username).prepare_fuzzy()
+
+    def _poll_results(self):
+        """Picks up finished searches and shows the latest one"""
+        self.poll_job = None
+        while True:
+            try:
+                serial, keyword, results, show_errors, fuzzy = self.results_queue.get_nowait()
+            except queue.Empty:
+                break
+            if serial != self.search_serial:
+                continue  # An older query finished after a newer one started
+            self.cancel_token = None
+            if isinstance(results, ValueError):
+                self._show_error(results, show_errors)
+            elif isinstance(results, Exception):
+                self._show_failure(results, show_errors)
+            else:
+                self._show_results(keyword, results, fuzzy)
+        if self.cancel_token is not None:
+            self.poll_job = self.dialog.after(self.POLL_MS, self._poll_results)
+
+    def _show_error(self, error, show_errors):
+        """Reports a bad tag query; typing only updates the label instead of popping up a warning"""
+        if show_errors:
+            messagebox.showwarning("Search", f"Invalid tag query: {error}")
+        self.count_label.config(text="Invalid tag query")
+
+    def _show_failure(self, error, show_errors):
+        """Reports a search that failed, so the dialog is not left showing "Searching…" """
+        logging.error("Search failed", exc_info=error)
+        if show_errors:
+            messagebox.showerror("Search", f"Search failed: {error}")
+        self.count_label.config(text="Search failed")
+
+    @timed("ui.search.show_results")
+    def _show_results(self, keyword, results, fuzzy=False):
+        """Replaces the listed results with the first page of new ones"""
+        for item in self.results_tree.get_children():
+            self.results_tree.delete(item)
+        self.keyword = keyword
+        self.fuzzy = fuzzy
+        self.pending_rows = results
+        self.shown_count = 0
+        self._load_more()
+
+    def _close(self):
+        """Stops pending searches and closes the dialog"""
+        self.title_dropdown.hide()
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+        for job in (self.delay_job, self.poll_job):
+            if job is not None:
+                self.dialog.after_cancel(job)
+        self.dialog.destroy()
+
+    def _load_more(self):
+        """Inserts the next page of results"""
+        start = self.shown_count
+        if self.keyword:
+            page = self.diary.ranked_results(self.pending_rows, self.keyword, currUser["name"],
+                                             start, self.PAGE_SIZE, self.fuzzy)
+        else:
+            page = [
+                {"id": e['id'], "date": e['date'], "title": e['title'],
+                 "snippet": e.preview, "highlights": []}
+                for e in self.pending_rows[start:start + self.PAGE_SIZE]
+            ]
+
+        for i, result in enumerate(page, start + 1):
+            self.results_tree.insert('', tk.END, iid=str(result['id']),
                                    text=str(i),
                                    values=(result['date'], 
                                           result['title'] or 'Untitled',
-                                          result['content']))
-        
-        messagebox.showinfo("Search Complete", f"Found {len(results)} entries!")
+                                          mark_highlights(result['snippet'], result['highlights'])))
+
+        self.shown_count = start + len(page)
+        total = len(self.pending_rows)
+        close_spellings = " (close spellings)" if self.keyword and self.fuzzy else ""
+        self.count_label.config(text=f"Showing {self.shown_count} of {total}{close_spellings}")
+        self.load_more_btn.config(state='normal' if self.shown_count < total else 'disabled')
     
     def _open_selected_entry(self, event=None):
         """Opens the selected search result"""
@@ -692,8 +1244,8 @@ class SearchDialog:
         # Parse date and callback to main application
         try:
             parsed_date = datetime.strptime(entry_date, "%Y-%m-%d").date()
-            self.search_callback(parsed_date)
-            self.dialog.destroy()
+            self.search_callback(parsed_date, int(selection[0]))
+            self._close()
         except ValueError:
             messagebox.showerror("Error", "Invalid date format in search results!")
 
@@ -710,6 +1262,8 @@ class DiaryMainInterface:
         
         # Current state variables
         self.current_date = None
+        self.current_entry_id = None  # id of the entry in the editor, None for a new entry
+        self.day_entry_ids = []  # ids of the entries on the current date, in selector order
         self.is_modified = False
         self.is_saving = False  # Flag to prevent concurrent operations
         self.mock_entries = {}  # Mock data storage for frontend demo
@@ -722,9 +1276,16 @@ class DiaryMainInterface:
         if not self._handle_authentication():
             self.root.destroy()
             return
+
+        # One diary for the session, so its indexes are built once and kept up to date
+        self.diary = Diary(open_storage(), events=open_event_bus())
         
         # Create main interface
         self._create_main_interface()
+
+        # Log and rank the handlers that keep the event loop blocked (threshold in DIARY_STALL_MS)
+        self.stall_detector = StallDetector(self.root.after, threshold_ms=float(os.environ.get("DIARY_STALL_MS", "500")))
+        self.stall_detector.start()
         
         # Initialize with today's date
         self._load_date_entry(date.today())
@@ -794,6 +1355,7 @@ class DiaryMainInterface:
         menubar.add_cascade(label="❓ Help", menu=help_menu)
         help_menu.add_command(label="🎯 Quick Tutorial", command=self._show_tutorial)
         help_menu.add_command(label="🔧 Keyboard Shortcuts", command=self._show_shortcuts)
+        help_menu.add_command(label="🩺 Diagnostics", command=self._show_diagnostics)
         help_menu.add_separator()
         help_menu.add_command(label="ℹ️ About", command=self._show_about)
     
@@ -809,8 +1371,12 @@ class DiaryMainInterface:
         left_panel.pack_propagate(False)  # Maintain fixed width
         
         # Calendar widget
-        self.calendar_widget = CalendarWidget(left_panel, self._on_date_selected)
+        self.calendar_widget = CalendarWidget(
+            left_panel, self._on_date_selected,
+            lambda start, end: self.diary.entry_counts(start, end, currUser["name"]))
         self.calendar_widget.pack(fill=tk.X, pady=(0, 15))
+        # Saves and deletes relabel just the day cells they change
+        self.diary.events.subscribe(self.calendar_widget.apply_change, username=currUser["name"])
         
         # Quick actions panel
         self._create_quick_actions(left_panel)
@@ -825,14 +1391,15 @@ class DiaryMainInterface:
         """Creates quick action buttons panel"""
         actions_frame = ttk.LabelFrame(parent, text="⚡ Quick Actions", padding="10")
         actions_frame.pack(fill=tk.X, pady=(0, 15))
-        store1 = DiaryStorage()
         buttons = [
     ("💾 Save", self._save_current_entry),
     ("🔍 Search", self._show_search_dialog),
     # ("✏️ Edit", self._edit_current_entry),
     ("🗑️ Delete", self._delete_current_entry),
     ("📅 Today", self._go_to_today),
-    ("📋 View All", lambda: EntriesViewer(self.root, store1.list_entries(currUser["name"]), self._load_date_entry))
+    ("📋 View All", lambda: EntriesViewer(self.root, self.diary, self._on_search_result_selected)),
+    ("🕘 History", self._show_revision_history),
+    ("➕ New Entry", self._new_entry)
 ]
         
         # Create and store button references
@@ -859,6 +1426,14 @@ class DiaryMainInterface:
         self.date_display = ttk.Label(header_frame, text="Select a date to begin", 
                                      font=('Arial', 16, 'bold'))
         self.date_display.pack(anchor=tk.W)
+
+        # Selector for the entries written on the current date
+        day_frame = ttk.Frame(header_frame)
+        day_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(day_frame, text="Entries on this day:", font=('Arial', 10)).pack(side=tk.LEFT)
+        self.day_entries_combo = ttk.Combobox(day_frame, state='readonly', width=40)
+        self.day_entries_combo.pack(side=tk.LEFT, padx=(5, 0))
+        self.day_entries_combo.bind('<<ComboboxSelected>>', self._on_day_entry_selected)
         
         # Entry title section
         title_frame = ttk.Frame(parent)
@@ -870,6 +1445,16 @@ class DiaryMainInterface:
         self.title_entry = ttk.Entry(title_frame, font=('Arial', 12))
         self.title_entry.pack(fill=tk.X, pady=(5, 0))
         self.title_entry.bind('<KeyRelease>', self._on_content_modified)
+
+        # Jump to a past entry by typing part of its title
+        AutocompleteDropdown(self.title_entry, self._suggest_titles, self._jump_to_entry)
+
+        # Explicit tags; #hashtags in the title or content are picked up on save
+        ttk.Label(title_frame, text="🏷️ Tags (comma separated, #hashtags are added automatically):", 
+                 font=('Arial', 10)).pack(anchor=tk.W, pady=(5, 0))
+        self.tags_entry = ttk.Entry(title_frame, font=('Arial', 11))
+        self.tags_entry.pack(fill=tk.X, pady=(3, 0))
+        self.tags_entry.bind('<KeyRelease>', self._on_content_modified)
         
         # Content editor section
         editor_frame = ttk.LabelFrame(parent, text="📖 Diary Content", padding="10")
@@ -907,6 +1492,16 @@ class DiaryMainInterface:
         # Bind content change events
         self.text_editor.bind('<KeyRelease>', self._on_content_modified)
         self.text_editor.bind('<Button-1>', self._on_content_modified)
+
+        # Entries similar to the open one; double-click opens one
+        related_frame = ttk.LabelFrame(parent, text="🔗 Related Entries", padding="5")
+        related_frame.pack(fill=tk.X, pady=(10, 0))
+        self.related_list = tk.Listbox(related_frame, height=4, font=('Arial', 10))
+        self.related_list.pack(fill=tk.X)
+        self.related_list.bind('<Double-1>', self._open_related_entry)
+        self.related_entries = []
+        self.related_offered = False  # the list shows the offer to build the similarity index
+        self.related_requested = False
         
         # Status bar
         self._create_status_bar(parent)
@@ -931,7 +1526,7 @@ class DiaryMainInterface:
         # Keyboard shortcuts
         self.root.bind('<Control-s>', lambda e: self._save_current_entry())
         self.root.bind('<Control-f>', lambda e: self._show_search_dialog())
-        self.root.bind('<Control-n>', lambda e: self._clear_current_entry())
+        self.root.bind('<Control-n>', lambda e: self._new_entry())
         self.root.bind('<Delete>', lambda e: self._delete_current_entry())
         
         # Window closing event
@@ -940,6 +1535,8 @@ class DiaryMainInterface:
         # Text editor specific bindings
         self.text_editor.bind('<Control-a>', self._select_all_text)
     
+    @timed("ui.on_date_selected")
+    @profiled("on_date_selected")
     def _on_date_selected(self, selected_date):
         """Handles date selection from calendar"""
         # Check if current entry needs saving
@@ -979,24 +1576,33 @@ class DiaryMainInterface:
             print(f"Button state update error: {e}")
             messagebox.showerror("Error", "Failed to update button states")
     
-    def _load_date_entry(self, entry_date):
-        """Loads diary entry for the specified date"""
+    @timed("ui.load_date_entry")
+    @profiled("load_date_entry")
+    def _load_date_entry(self, entry_date, entry_id=None):
+        """Loads a diary entry for the specified date (the first one unless entry_id is given)"""
         self.current_date = entry_date
         
         # Update date display
         formatted_date = entry_date.strftime("%A, %B %d, %Y")
         self.date_display.config(text=f"📅 {formatted_date}")
         
-        # Load entry data (mock data for frontend demo)
+        # List the entries of the day from their summaries, and read only the body being opened
         date_key = entry_date.strftime("%Y-%m-%d")
-        
-        store1 = DiaryStorage()
-        entries_list = store1.list_entries(currUser["name"])
+        day_entries = self.diary.summaries_on(date_key, currUser["name"])
+        self._fill_day_entries(day_entries)
+
+        entry = None
+        if day_entries:
+            summary = next((e for e in day_entries if e['id'] == entry_id), day_entries[0])
+            entry = self.diary.get_entry(summary['id'], currUser["name"])
+        self.current_entry_id = entry['id'] if entry is not None else None
 
-        if date_key in entries_list:
-            entry = entries_list[date_key]
+        if entry is not None:
+            self.day_entries_combo.current(self.day_entry_ids.index(entry['id']))
             self.title_entry.delete(0, tk.END)
             self.title_entry.insert(0, entry['title'])
+            self.tags_entry.delete(0, tk.END)
+            self.tags_entry.insert(0, ", ".join(entry.get('tags', [])))
             self.text_editor.delete(1.0, tk.END)
             self.text_editor.insert(1.0, entry['content'])
             self.status_label.config(text=f"Loaded entry from {formatted_date}")
@@ -1004,6 +1610,7 @@ class DiaryMainInterface:
         else:
             # Clear for new entry
             self.title_entry.delete(0, tk.END)
+            self.tags_entry.delete(0, tk.END)
             self.text_editor.delete(1.0, tk.END)
             self.status_label.config(text=f"New entry for {formatted_date}")
             self._update_button_states(is_new_entry=True)
@@ -1011,6 +1618,69 @@ class DiaryMainInterface:
         # Reset modification flag
         self.is_modified = False
         self._update_word_count()
+        self._show_related_entries()
+
+    @timed("ui.show_related_entries")
+    def _show_related_entries(self):
+        """Lists the entries most similar to the open entry. Without a cached similarity index,
+        building one reads every entry, so that waits until the list is asked for"""
+        self.related_list.delete(0, tk.END)
+        self.related_entries = []
+        self.related_offered = False
+        if self.current_entry_id is None:
+            return
+        if not self.related_requested and not self.diary.related_ready(currUser["name"]):
+            self.related_list.insert(tk.END, "Double-click to find related entries")
+            self.related_offered = True
+            return
+        self.related_entries = self.diary.related_entries(self.current_entry_id, currUser["name"])
+        for entry in self.related_entries:
+            self.related_list.insert(tk.END, f"{entry['date']}  {entry['title'] or 'Untitled'}")
+
+    def _open_related_entry(self, event=None):
+        """Opens the entry picked in the related entries list"""
+        if self.related_offered:
+            self.related_requested = True
+            self._show_related_entries()
+            return
+        selection = self.related_list.curselection()
+        if selection:
+            self._jump_to_entry(self.related_entries[selection[0]])
+
+    def _fill_day_entries(self, day_entries):
+        """Fills the selector with the entries written on the current date"""
+        self.day_entry_ids = [entry['id'] for entry in day_entries]
+        self.day_entries_combo['values'] = [
+            f"{i}. {entry['title'] or 'Untitled'} ({entry.get('time', '')})"
+            for i, entry in enumerate(day_entries, 1)
+        ]
+        if not day_entries:
+            self.day_entries_combo.set("No entries yet")
+
+    def _on_day_entry_selected(self, event=None):
+        """Switches the editor to another entry of the same day"""
+        index = self.day_entries_combo.current()
+        if index < 0 or not self.current_date:
+            return
+        if self.is_modified and not messagebox.askyesno(
+                "Unsaved Changes", "Discard unsaved changes and switch entry?"):
+            if self.current_entry_id in self.day_entry_ids:
+                self.day_entries_combo.current(self.day_entry_ids.index(self.current_entry_id))
+            return
+        self._load_date_entry(self.current_date, self.day_entry_ids[index])
+
+    def _new_entry(self):
+        """Starts another entry on the current date"""
+        if not self.current_date:
+            messagebox.showwarning("No Date Selected", "Please select a date first!")
+            return
+        self._clear_current_entry()
+        if self.is_modified:
+            return
+        self.current_entry_id = None
+        self.day_entries_combo.set("New entry")
+        self.status_label.config(text="New entry - it will be added next to the day's other entries")
+        self._update_button_states(is_new_entry=True)
     
     def _on_content_modified(self, event=None):
         """Handles content modification events"""
@@ -1031,10 +1701,7 @@ class DiaryMainInterface:
         if not self.current_date:
             messagebox.showwarning("No Date Selected", "Please select a date first!")
             return
-        store1 = DiaryStorage()
-        entries_list = store1.list_entries(currUser["name"])
-        date_key = self.current_date.strftime("%Y-%m-%d")
-        if date_key not in entries_list:
+        if self.current_entry_id is None:
             messagebox.showinfo("No Entry", "No entry exists for this date to edit!")
             return
 
@@ -1049,6 +1716,8 @@ class DiaryMainInterface:
         self.status_label.config(text="✏️ Editing entry - Remember to save your changes!")
         self.is_modified = True
 
+    @timed("ui.save_current_entry")
+    @profiled("save_current_entry")
     def _save_current_entry(self):
         """Saves the current diary entry"""
         if self.is_saving:
@@ -1074,19 +1743,24 @@ class DiaryMainInterface:
             if not messagebox.askyesno("Save Entry", "Save entry with only title and no content?"):
                 return
         
-        # Save to mock storage
+        # Save through the diary; an entry without an id is added as a new entry for the day
         date_key = self.current_date.strftime("%Y-%m-%d")
-        diary1 = Diary()
-        diary1.create_entry( {
-             "title": title,
-            "content": content,
-             "date": date_key
-        }, currUser["name"])
+        with diary_lock.writing():
+            self.current_entry_id = self.diary.create_entry( {
+                 "id": self.current_entry_id,
+                 "title": title,
+                "content": content,
+                 "date": date_key,
+                 "tags": self.tags_entry.get()
+            }, currUser["name"])
 
         # self.mock_entries[date_key] = MockDiaryEntry(date_key, content, title)
         
         try:
             # Update UI
+            self._fill_day_entries(self.diary.summaries_on(date_key, currUser["name"]))
+            self.day_entries_combo.current(self.day_entry_ids.index(self.current_entry_id))
+            self._show_related_entries()
             self.is_modified = False
             formatted_date = self.current_date.strftime("%B %d, %Y")
             self.status_label.config(text=f"✅ Entry saved for {formatted_date}")
@@ -1098,46 +1772,44 @@ class DiaryMainInterface:
         finally:
             self.is_saving = False  # Reset saving flag
     
+    @timed("ui.delete_current_entry")
+    @profiled("delete_current_entry")
     def _delete_current_entry(self):
         """Deletes the current diary entry"""
-        store1 = DiaryStorage()
-        entries_list = store1.list_entries(currUser["name"])
         try:
             if not self.current_date:
                 messagebox.showwarning("No Date Selected", "Please select a date first!")
                 return
             
-            date_key = self.current_date.strftime("%Y-%m-%d")
+            entry_id = self.current_entry_id
+            temp_entry = self.diary.get_entry(entry_id, currUser["name"]) if entry_id is not None else None
             
-            if date_key not in entries_list:
+            if temp_entry is None:
                 messagebox.showinfo("No Entry", "No entry exists for this date!")
                 return
             
-            # Save the entry temporarily in case we need to restore it
-            temp_entry = entries_list[date_key]
-            
             # Confirm deletion
             formatted_date = self.current_date.strftime("%B %d, %Y")
+            entry_title = temp_entry['title'] or 'Untitled'
             result = messagebox.askyesno("Confirm Deletion", 
-                                       f"Are you sure you want to delete the entry for {formatted_date}?")
+                                       f"Are you sure you want to delete '{entry_title}' from {formatted_date}?")
             
-            diary1 = Diary()
+            diary1 = self.diary
             if result:
                 try:
                     # Attempt deletion
-                    # del entries_list[date_key]
-                    diary1.delete_entry(date_key, currUser["name"])
-                    self.title_entry.delete(0, tk.END)
-                    self.text_editor.delete(1.0, tk.END)
+                    with diary_lock.writing():
+                        diary1.delete_entry(entry_id, currUser["name"])
                     self.is_modified = False
+                    # Show the day's next entry, if there is one
+                    self._load_date_entry(self.current_date)
                     self.status_label.config(text=f"🗑️ Entry deleted for {formatted_date}")
                     messagebox.showinfo("Delete Successful", f"Entry deleted for {formatted_date}!")
-                    
-                    # Update button states after successful deletion
-                    self._update_button_states(is_new_entry=True)
                 except Exception as e:
-                    # Restore the entry if deletion fails
-                    self.entries_list[date_key] = temp_entry
+                    # Restore the entry if deletion fails part-way
+                    if diary1.get_entry(entry_id, currUser["name"]) is None:
+                        with diary_lock.writing():
+                            diary1.create_entry(temp_entry, currUser["name"])
                     raise Exception(f"Failed to delete entry: {str(e)}")
                     
         except Exception as e:
@@ -1153,22 +1825,43 @@ class DiaryMainInterface:
                 return
         
         self.title_entry.delete(0, tk.END)
+        self.tags_entry.delete(0, tk.END)
         self.text_editor.delete(1.0, tk.END)
         self.is_modified = False
         self.status_label.config(text="Entry cleared")
     
+    def _show_revision_history(self):
+        """Shows the saved revisions of the current entry"""
+        if self.current_entry_id is None:
+            messagebox.showwarning("No Entry", "Please open a saved entry first!")
+            return
+        RevisionsViewer(self.root, self.diary, self.current_entry_id, self._on_search_result_selected)
+
+    def _suggest_titles(self, text):
+        """Past entries whose title matches the typed title (except the open entry)"""
+        return [(f"{e['title']}  ({e['date']})", e)
+                for e in self.diary.complete_titles(text, currUser["name"])
+                if e['id'] != self.current_entry_id]
+
+    def _jump_to_entry(self, entry):
+        """Opens an entry chosen from the title suggestions"""
+        if self.is_modified and not messagebox.askyesno(
+                "Unsaved Changes", "Discard unsaved changes and open this entry?"):
+            return
+        self._on_search_result_selected(datetime.strptime(entry['date'], "%Y-%m-%d").date(), entry['id'])
+
     def _show_search_dialog(self):
         """Shows the search dialog"""
-        SearchDialog(self.root, self._on_search_result_selected)
+        SearchDialog(self.root, self.diary, self._on_search_result_selected)
     
-    def _on_search_result_selected(self, result_date):
+    def _on_search_result_selected(self, result_date, entry_id=None):
         """Handles search result selection"""
         # Update calendar to show the selected month
         self.calendar_widget.current_date = datetime(result_date.year, result_date.month, 1)
         self.calendar_widget._update_calendar_display()
         
-        # Load the entry for the selected date
-        self._load_date_entry(result_date)
+        # Load the selected entry of that date
+        self._load_date_entry(result_date, entry_id)
     
     def _go_to_today(self):
         """Navigates to today's date"""
@@ -1212,19 +1905,11 @@ class DiaryMainInterface:
     
     def _show_statistics(self):
         """Shows diary statistics"""
-        store1 = DiaryStorage()
-        entries_list = store1.list_entries(currUser["name"])
-        total_entries = len(entries_list)
-        total_words = sum(len(entry['content'].split()) for entry in entries_list.values())
-        
-        stats_msg = f"""📊 Diary Statistics:
-        
-📝 Total Entries: {total_entries}
-📖 Total Words: {total_words}
-⭐ Average Words per Entry: {total_words // max(total_entries, 1)}
-📅 Date Range: {len(entries_list)} days with entries"""
-        
-        messagebox.showinfo("Diary Statistics", stats_msg)
+        StatisticsViewer(self.root, self.diary)
+    
+    def _show_diagnostics(self):
+        """Shows the collected timings and counters"""
+        DiagnosticsViewer(self.root, self.stall_detector)
     
     def _show_tutorial(self):
         """Shows quick tutorial"""
@@ -1249,7 +1934,7 @@ class DiaryMainInterface:
 🔍 Ctrl+F - Search entries  
 📋 Ctrl+C - Copy selected text
 📄 Ctrl+V - Paste text
-🆕 Ctrl+N - Clear current entry
+🆕 Ctrl+N - New entry for the selected day
 🗑️ Del - Delete current entry
 📝 Ctrl+A - Select all text"""
         
@@ -1289,6 +1974,8 @@ the user interface design and interactions."""
         
         # Show goodbye message
         messagebox.showinfo("Goodbye", "Thank you for using Personal Diary!\n📔✨")
+        self.stall_detector.stop()
+        self.diary.close()
         self.root.destroy()
     
     def run(self):
@@ -1298,6 +1985,13 @@ the user interface design and interactions."""
 
 def main():
     """Main function to start the diary application"""
+    # --profile: profile the UI actions and keep the slow ones (see profiling.py)
+    if "--profile" in sys.argv[1:]:
+        PROFILER.enabled = True
+    # DIARY_STALL_LOG=path: write event-loop stalls to a file instead of the console
+    if os.environ.get("DIARY_STALL_LOG"):
+        logging.basicConfig(filename=os.environ["DIARY_STALL_LOG"], level=logging.WARNING,
+                            format="%(asctime)s %(message)s")
     try:
         app = DiaryMainInterface()
         app.run()
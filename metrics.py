@@ -0,0 +1,129 @@
+# metrics.py
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class Histogram:
+    """Count, total and maximum of a measurement, plus its most recent samples for percentiles"""
+
+    def __init__(self, max_samples=2048):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    # Nearest-rank percentile over the kept samples
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max
+        }
+
+
+class Metrics:
+    """In-process counters and histograms for storage, search and UI operations.
+
+    Nothing is recorded unless enabled is set; the instrumented code checks
+    the flag before doing any work, so a disabled registry costs one
+    attribute read per call. Timings are in milliseconds.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+
+    def timed(self, name):
+        """Decorator recording the call count and latency of a function under name"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, (time.perf_counter() - start) * 1000)
+            return wrapper
+        return decorate
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": {name: h.summary() for name, h in sorted(self.histograms.items())}
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=4)
+
+    def report(self):
+        """The snapshot as plain text, for the diagnostics window"""
+        snapshot = self.snapshot()
+        if not self.enabled:
+            return "Metrics are off. Start the diary with DIARY_METRICS=1 to collect them.\n"
+        lines = [f"Collected over {snapshot['uptime_s']:.0f} s", "",
+                 "Timings in ms (*.scanned_entries: entries looked at per query)",
+                 f"{'operation':<42}{'calls':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for name, h in snapshot["histograms"].items():
+            lines.append(f"{name:<42}{h['count']:>7}{h['p50']:>9.2f}{h['p95']:>9.2f}{h['p99']:>9.2f}{h['max']:>9.2f}")
+        lines += ["", "Counters"]
+        for name, value in snapshot["counters"].items():
+            lines.append(f"{name:<42}{value:>12}")
+        return "\n".join(lines) + "\n"
+
+
+# DIARY_METRICS=1 turns collection on; DIARY_METRICS_FILE=path also writes the metrics there on exit
+METRICS = Metrics(enabled=bool(os.environ.get("DIARY_METRICS") or os.environ.get("DIARY_METRICS_FILE")))
+timed = METRICS.timed
+
+if os.environ.get("DIARY_METRICS_FILE"):
+    atexit.register(METRICS.dump, os.environ["DIARY_METRICS_FILE"])
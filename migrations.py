@@ -0,0 +1,468 @@
+# migrations.py
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections.abc import MutableMapping
+from integrity import entry_checksum, verify_entry
+
+# Version of the layout this code reads and writes. Files written before the
+# version header existed count as version 0.
+SCHEMA_VERSION = 1
+
+MIGRATIONS = {}  # version -> Migration bringing a user record from version - 1 to version
+
+
+class Migration:
+    def __init__(self, version, description, upgrade):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+
+
+def migration(version, description):
+    """Decorator registering upgrade(record) as the step from version - 1 to version.
+
+    A file migration hands the step a record whose entries and revisions are
+    kept on disk, so a step stores a changed entry with entries[key] = entry
+    rather than changing the entry it read in place.
+    """
+    def register(upgrade):
+        MIGRATIONS[version] = Migration(version, description, upgrade)
+        return upgrade
+    return register
+
+
+# Older files keyed each user's entries by date, with no id. Re-key them by a
+# stable entry id (and move their revision history along) so a day can hold
+# several entries. Works on any mutable mapping of entries.
+@migration(1, "Key entries by a stable id instead of their date")
+def upgrade_user(record):
+    if "next_id" in record:
+        return False
+    entries = record.setdefault("entries", {})
+    revisions = record.get("revisions", {})
+    next_id = 1
+    for date_key in sorted(entries):
+        entry = dict(entries[date_key])
+        entry.setdefault("date", date_key)
+        entry["id"] = next_id
+        del entries[date_key]
+        entries[str(next_id)] = entry
+        if date_key in revisions:
+            revisions[str(next_id)] = revisions.pop(date_key)
+        next_id += 1
+    record["next_id"] = next_id
+    return True
+
+
+def migrate_record(record, version, target=SCHEMA_VERSION):
+    """Run the migrations after version on one user record, in place"""
+    if version > target:
+        raise ValueError(f"Diary data has schema version {version}, newer than this app's {target}")
+    for step in range(version + 1, target + 1):
+        MIGRATIONS[step].upgrade(record)
+    return record
+
+
+def split_header(data):
+    """(schema version, users) of a parsed diary file, with or without the version header"""
+    if isinstance(data.get("schema_version"), int) and isinstance(data.get("users"), dict):
+        return data["schema_version"], data["users"]
+    return 0, data
+
+
+class UserStream:
+    """Reads a diary file one user at a time, or one record member at a time.
+
+    Iterating gives (username, record) pairs and holds only the record being
+    decoded and one read chunk in memory. For records too large for that,
+    users() gives each username with the stream placed at its record, and
+    members() walks an object key by key, so a user's entries can be read
+    one entry at a time with value(). version is the file's schema version,
+    known once the first user has been reached.
+    """
+
+    def __init__(self, f, chunk_size=64 * 1024):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.version = None
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        chunk = self.f.read(size or self.chunk_size)
+        self.eof = not chunk
+        self.buffer += chunk
+        return bool(chunk)
+
+    def _skip_space(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return
+
+    def _next_char(self):
+        char = self.peek()
+        if not char:
+            raise ValueError("Unexpected end of diary file")
+        self.pos += 1
+        return char
+
+    def _expect(self, char):
+        found = self._next_char()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in diary file, found {found!r}")
+
+    def peek(self):
+        """The next character that is not white space, or "" at the end of the file"""
+        self._skip_space()
+        return self.buffer[self.pos:self.pos + 1]
+
+    def value(self):
+        """Decode the JSON value at the stream's position, reading more of the file until it is complete"""
+        self._skip_space()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self._fill(max(self.chunk_size, len(self.buffer))):
+                    raise
+                continue
+            # A number may be cut off at the end of the buffer
+            if end == len(self.buffer) and not self.eof and not isinstance(value, (dict, list, str)):
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Keys of the JSON object at the stream's position, in file order. After each key, its value
+        is read (value(), members() or skip()) before the next key is asked for"""
+        self._expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected a key in diary file, found {key!r}")
+            self._expect(":")
+            yield key
+            char = self._next_char()
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' in diary file, found {char!r}")
+
+    def skip(self):
+        """Read past the value at the stream's position, one object member at a time"""
+        if self.peek() == "{":
+            for _ in self.members():
+                self.skip()
+        else:
+            self.value()
+
+    def users(self):
+        """Usernames in file order; after each, the user's record is read before the next is asked for"""
+        headed = False
+        for key in self.members():
+            if self.version is None and key == "schema_version":
+                self.version = self.value()
+                headed = True
+            elif headed:
+                if key != "users":
+                    raise ValueError("Expected \"users\" after the schema version")
+                yield from self.members()
+            else:
+                self.version = 0
+                yield key
+        if self.version is None:
+            self.version = 0
+
+    def __iter__(self):
+        for username in self.users():
+            yield username, self.value()
+
+
+class SpilledItems(MutableMapping):
+    """Members of a JSON object kept in a temporary SQLite file instead of memory, in insertion order.
+
+    A file migration reads a user's entries and revisions into these, so the
+    upgrade steps (which work on any mutable mapping) run on a record of any
+    size while only the item being handled is in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("CREATE TABLE items (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, value TEXT)")
+
+    def __getitem__(self, key):
+        row = self.db.execute("SELECT value FROM items WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    # A key that is already there keeps its place, like in a dict
+    def __setitem__(self, key, value):
+        self.db.execute("INSERT INTO items (key, value) VALUES (?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, json.dumps(value)))
+
+    def __delitem__(self, key):
+        if not self.db.execute("DELETE FROM items WHERE key = ?", (key,)).rowcount:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for (key,) in self.db.execute("SELECT key FROM items ORDER BY seq").fetchall():
+            yield key
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    # (key, value) pairs read in one pass over the table
+    def pairs(self):
+        for key, value in self.db.execute("SELECT key, value FROM items ORDER BY seq"):
+            yield key, json.loads(value)
+
+    def close(self):
+        self.db.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Record members keyed by entry, read item by item into SpilledItems
+SPILLED_MEMBERS = ("entries", "revisions")
+
+
+def _indented(value, indent):
+    return json.dumps(value, indent=4).replace("\n", "\n" + " " * indent)
+
+
+class FileMigration:
+    """Upgrades a diary file to the target schema version, streaming it one entry at a time.
+
+    A user's entries and revisions are read item by item into temporary
+    SQLite files next to the diary (SpilledItems), the record is upgraded
+    there and then written out item by item, so memory is bounded by the
+    largest entry rather than the largest user. The upgraded file is
+    written next to the original (<file>.migrating) and only replaces it at
+    the end. Every checkpoint_every entries (or other record members), the
+    output is flushed and <file>.migration.json notes how far it got, so a
+    run that was interrupted resumes from there instead of starting over,
+    even in the middle of a user. dry_run() goes through the same steps
+    without writing the output, and reports the time and disk space the
+    migration will need.
+    """
+
+    def __init__(self, filename, target=SCHEMA_VERSION, checkpoint_every=100, chunk_size=64 * 1024):
+        self.filename = filename
+        self.target = target
+        self.checkpoint_every = checkpoint_every
+        self.chunk_size = chunk_size
+
+    @property
+    def output_filename(self):
+        return self.filename + ".migrating"
+
+    @property
+    def checkpoint_filename(self):
+        return self.filename + ".migration.json"
+
+    # Identifies the input, so a checkpoint taken on a different file is not resumed
+    def _source_stamp(self):
+        stat = os.stat(self.filename)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_filename, "r") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get("source") != self._source_stamp() or checkpoint.get("target") != self.target:
+            return None
+        if not os.path.exists(self.output_filename) or "units_done" not in checkpoint:
+            return None
+        return checkpoint
+
+    # users_done users are complete in the output, and units_done units of the next one
+    def _write_checkpoint(self, users_done, units_done, output_bytes):
+        checkpoint = {"source": self._source_stamp(), "target": self.target,
+                      "users_done": users_done, "units_done": units_done, "output_bytes": output_bytes}
+        with open(self.checkpoint_filename + ".tmp", "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(self.checkpoint_filename + ".tmp", self.checkpoint_filename)
+
+    # The upgraded file is laid out like json.dump(..., indent=4) in DiaryStorage, which the
+    # recovery loader and the scrubber rely on
+    def _header(self):
+        return '{\n    "schema_version": %d,\n    "users": {' % self.target
+
+    def _footer(self):
+        return "\n    }\n}"
+
+    # Read the user record at the stream's position: entries and revisions item by item into
+    # temporary files, with each entry checked against its checksum on the way
+    def _read_record(self, stream, username, damaged):
+        record = {}
+        for key in stream.members():
+            if key not in SPILLED_MEMBERS or stream.peek() != "{":
+                record[key] = stream.value()
+                continue
+            items = record[key] = SpilledItems(f"{self.filename}.{key}.spill")
+            for item_key in stream.members():
+                item = stream.value()
+                if key == "entries" and isinstance(item, dict) and not verify_entry(item):
+                    damaged.append({"user": username, "entry": item_key})
+                items[item_key] = item
+        return record
+
+    def _close_record(self, record):
+        for value in record.values():
+            if isinstance(value, SpilledItems):
+                value.close()
+
+    # One user as it is written to the upgraded file, in units: the opening with the separator before
+    # it, each member of the record, each entry or revision list and the closing. Entries are stamped
+    # with a new checksum after the migration
+    def _units(self, index, username, record):
+        yield ("\n" if index == 0 else ",\n") + "        " + json.dumps(username) + ": {"
+        for position, (key, value) in enumerate(record.items()):
+            head = ("\n" if position == 0 else ",\n") + "            " + json.dumps(key) + ": "
+            if not isinstance(value, SpilledItems):
+                yield head + _indented(value, 12)
+                continue
+            if not len(value):
+                yield head + "{}"
+                continue
+            yield head + "{"
+            for item_position, (item_key, item) in enumerate(value.pairs()):
+                if key == "entries" and isinstance(item, dict):
+                    item["checksum"] = entry_checksum(item)
+                yield (("\n" if item_position == 0 else ",\n") + "                " + json.dumps(item_key) + ": "
+                       + _indented(item, 16))
+            yield "\n            }"
+        yield "\n        }" if record else "}"
+
+    def file_version(self):
+        with open(self.filename, "r", encoding="utf-8") as f:
+            stream = UserStream(f, self.chunk_size)
+            next(stream.users(), None)
+            return stream.version
+
+    def dry_run(self):
+        """Migrate every record without writing the output; returns what a real run would need"""
+        start = time.perf_counter()
+        users = largest = largest_entry = output_bytes = 0
+        damaged = []
+        with open(self.filename, "r", encoding="utf-8") as f:
+            stream = UserStream(f, self.chunk_size)
+            for index, username in enumerate(stream.users()):
+                record = self._read_record(stream, username, damaged)
+                try:
+                    migrate_record(record, stream.version, self.target)
+                    sizes = [len(unit.encode("utf-8")) for unit in self._units(index, username, record)]
+                finally:
+                    self._close_record(record)
+                output_bytes += sum(sizes)
+                largest = max(largest, sum(sizes))
+                largest_entry = max([largest_entry] + sizes)
+                users += 1
+        output_bytes += len(self._header()) + len(self._footer())
+        version = stream.version
+        return {
+            "from_version": version,
+            "to_version": self.target,
+            "steps": [MIGRATIONS[v].description for v in range(version + 1, self.target + 1)],
+            "users": users,
+            "input_bytes": os.path.getsize(self.filename),
+            "output_bytes": output_bytes,
+            "largest_user_bytes": largest,
+            "largest_entry_bytes": largest_entry,
+            "damaged": damaged,
+            "free_bytes": shutil.disk_usage(os.path.dirname(os.path.abspath(self.filename))).free,
+            "seconds": time.perf_counter() - start
+        }
+
+    def run(self):
+        """Migrate the file (resuming an interrupted run); returns the number of users migrated"""
+        checkpoint = self._read_checkpoint()
+        users_done = checkpoint["users_done"] if checkpoint else 0
+        units_done = checkpoint["units_done"] if checkpoint else 0
+        with open(self.filename, "r", encoding="utf-8") as src, \
+                open(self.output_filename, "r+b" if checkpoint else "wb") as dst:
+            if checkpoint:
+                dst.truncate(checkpoint["output_bytes"])
+                dst.seek(checkpoint["output_bytes"])
+            else:
+                dst.write(self._header().encode("utf-8"))
+            stream = UserStream(src, self.chunk_size)
+            count = written = 0
+            for index, username in enumerate(stream.users()):
+                count = index + 1
+                if index < users_done:  # already in the output
+                    stream.skip()
+                    continue
+                damaged = []
+                record = self._read_record(stream, username, damaged)
+                try:
+                    if damaged:
+                        raise ValueError(f"Damaged entries {damaged}: open the diary once to set them aside, "
+                                         f"then migrate again")
+                    migrate_record(record, stream.version, self.target)
+                    for unit_index, unit in enumerate(self._units(index, username, record)):
+                        if index == users_done and unit_index < units_done:  # already in the output
+                            continue
+                        dst.write(unit.encode("utf-8"))
+                        written += 1
+                        if written % self.checkpoint_every == 0:
+                            dst.flush()
+                            os.fsync(dst.fileno())
+                            self._write_checkpoint(index, unit_index + 1, dst.tell())
+                finally:
+                    self._close_record(record)
+            dst.write(self._footer().encode("utf-8"))
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(self.output_filename, self.filename)
+        if os.path.exists(self.checkpoint_filename):
+            os.remove(self.checkpoint_filename)
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade a diary file to the current schema version")
+    parser.add_argument("filename", nargs="?", default="diary.json")
+    parser.add_argument("--dry-run", action="store_true", help="report the time and space needed, change nothing")
+    args = parser.parse_args()
+
+    job = FileMigration(args.filename)
+    if args.dry_run:
+        plan = job.dry_run()
+        print(f"Schema version {plan['from_version']} -> {plan['to_version']}, {plan['users']} users")
+        for step in plan["steps"]:
+            print(f"  - {step}")
+        print(f"Needs {plan['output_bytes']} bytes of disk space next to the file ({plan['free_bytes']} free) "
+              f"and up to {plan['largest_user_bytes']} more while a user is upgraded, "
+              f"largest entry {plan['largest_entry_bytes']} bytes in memory, about {plan['seconds']:.1f} s")
+        if plan["damaged"]:
+            print(f"{len(plan['damaged'])} damaged entries: open the diary once to set them aside first")
+        return
+    if job.file_version() == job.target:
+        print(f"{args.filename} is already at schema version {job.target}")
+        return
+    print(f"Migrated {job.run()} users to schema version {job.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+# mmap_storage.py
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import ItemsView, Mapping, MutableMapping, ValuesView
+from entry import Entry, EntrySummary
+from integrity import encode_checked, quarantine, verify_entry
+from metrics import METRICS, timed
+from migrations import SCHEMA_VERSION, migrate_record
+from storage import DiaryStorage
+
+
+class BodyCache:
+    """Recently read entry records, keyed by their (offset, length) in the data file.
+
+    Holds at most max_entries records and drops the least recently used one
+    first, so reopening an entry doesn't decode it again while memory stays
+    bounded however many entries are read. Reads reorder the records, so
+    the cache has its own lock: concurrent readers (the server's, under a
+    shared read lock) may use it at the same time.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, position):
+        with self.lock:
+            entry = self.records.get(position)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.records.move_to_end(position)
+            self.hits += 1
+            return entry
+
+    def put(self, position, entry):
+        with self.lock:
+            self.records[position] = entry
+            self.records.move_to_end(position)
+            while len(self.records) > self.max_entries:
+                self.records.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+
+class SummaryView(Mapping):
+    """Read-only key -> EntrySummary view of an EntryIndex"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __getitem__(self, key):
+        if key not in self.entries:
+            raise KeyError(key)
+        return self.entries.summary(key)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class StoredValues(ValuesView):
+    """Values of an EntryIndex, skipping records dropped as damaged while they are read"""
+
+    def __iter__(self):
+        for key in self._mapping:
+            try:
+                yield self._mapping[key]
+            except KeyError:
+                continue
+
+
+class StoredItems(ItemsView):
+    """Items of an EntryIndex, skipping records dropped as damaged while they are read"""
+
+    def __iter__(self):
+        for key in self._mapping:
+            try:
+                yield key, self._mapping[key]
+            except KeyError:
+                continue
+
+
+class EntryIndex(MutableMapping):
+    """Entries of one user, kept as (offset, length) pointers into the data file.
+
+    The summary of every entry (title, date, tags, length, preview) stays in
+    memory; reading an item fetches the full entry from the data file. A
+    record that fails its checksum is quarantined and taken out of the
+    index, and reading it raises KeyError like a missing entry.
+    """
+
+    def __init__(self, storage, offsets=None, summaries=None):
+        self.storage = storage
+        self.offsets = dict(offsets or {})  # key -> (offset, length) of the stored record
+        self.summaries = dict(summaries or {})  # key -> EntrySummary
+        self.pending = {}  # key -> entry written since the last save
+        self.removed = set()  # keys deleted since the last save
+
+    def __getitem__(self, key):
+        if key in self.pending:
+            return self.pending[key]
+        if key in self.removed or key not in self.offsets:
+            raise KeyError(key)
+        offset, length = self.offsets[key]
+        try:
+            return self.storage.read_body(offset, length)
+        except ValueError:
+            self.storage.drop_damaged(self, key)
+            raise KeyError(key)
+
+    def values(self):
+        return StoredValues(self)
+
+    def items(self):
+        return StoredItems(self)
+
+    def __setitem__(self, key, entry):
+        self.pending[key] = entry
+        self.removed.discard(key)
+        self.summaries[key] = EntrySummary.from_entry(entry)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.pending.pop(key, None)
+        self.summaries.pop(key, None)
+        if key in self.offsets:
+            self.removed.add(key)
+
+    # Summary of an entry; only an index written before summaries were kept has to read the body
+    def summary(self, key):
+        summary = self.summaries.get(key)
+        if summary is None:
+            summary = self.summaries[key] = EntrySummary.from_entry(self[key])
+        return summary
+
+    def __contains__(self, key):
+        if key in self.pending:
+            return True
+        return key in self.offsets and key not in self.removed
+
+    def __iter__(self):
+        yield from list(self.pending)
+        for key in list(self.offsets):
+            if key not in self.pending and key not in self.removed:
+                yield key
+
+    def __len__(self):
+        stored = sum(1 for key in self.offsets if key not in self.pending and key not in self.removed)
+        return stored + len(self.pending)
+
+    def __eq__(self, other):
+        if isinstance(other, MutableMapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+
+class MmapDiaryStorage(DiaryStorage):
+    """Storage mode with entry bodies in one append-only data file read through mmap.
+
+    The index file holds every user's password and a key -> (offset, length,
+    summary) map, so opening the diary and reading one entry never parses the
+    other entries, and lists and the calendar work from the summaries without
+    reading any body. Recently read bodies are kept in a BodyCache of
+    body_cache_size records. Edits and deletes leave dead bytes behind in the
+    data file until compact() rewrites it.
+    """
+
+    def __init__(self, filename="diary_index.json", compact_threshold=0.5, compact_min_bytes=64 * 1024,
+                 body_cache_size=256, read_only=False, usernames=None):
+        self.compact_threshold = compact_threshold
+        self.compact_min_bytes = compact_min_bytes
+        self.generation = 0
+        self.dead_bytes = 0
+        self.bodies = BodyCache(body_cache_size)
+        self._map = None
+        self._damage_lock = threading.RLock()
+        super().__init__(filename, read_only=read_only, usernames=usernames)
+
+    # Data file for the current generation, e.g. diary_index.0.dat
+    @property
+    def data_filename(self):
+        base = os.path.splitext(self.filename)[0]
+        return f"{base}.{self.generation}.dat"
+
+    # Load the index and map the data file, without reading any entry bodies
+    @timed("storage.load_users")
+    def load_users(self):
+        self._close_map()
+        self.bodies.clear()
+        self.users = {}
+        self.generation = 0
+        self.dead_bytes = 0
+        if os.path.exists(self.filename):
+            with open(self.filename, "r") as f:
+                index = json.load(f)
+            self.generation = index.get("generation", 0)
+            self.dead_bytes = index.get("dead_bytes", 0)
+            version = index.get("schema_version", 0)
+            for username, record in index.get("users", {}).items():
+                if self.usernames is not None and username not in self.usernames:
+                    continue
+                record = dict(record)
+                offsets, summaries = {}, {}
+                for key, pos in record.get("entries", {}).items():
+                    offsets[key] = (pos[0], pos[1])
+                    if len(pos) > 2:
+                        summaries[key] = EntrySummary.from_dict(pos[2])
+                record["entries"] = EntryIndex(self, offsets, summaries)
+                migrate_record(record, version)
+                self.users[username] = record
+        self._open_map()
+        return self.users
+
+    # Append changed entries to the data file and rewrite the index
+    @timed("storage.save_entries")
+    def save_entries(self, users=None):
+        if self.read_only:
+            raise ValueError(f"{self.filename} was opened read-only")
+        if users is not None:
+            self.users = users
+        with open(self.data_filename, "ab") as f:
+            for record in self.users.values():
+                entries = record.get("entries", {})
+                if not isinstance(entries, EntryIndex):
+                    index = EntryIndex(self)
+                    index.update(entries)
+                    record["entries"] = entries = index
+                self._flush_user(entries, f)
+        self._write_index()
+        self._open_map()
+        if self._should_compact():
+            self.compact()
+
+    def _flush_user(self, entries, f):
+        for key in entries.removed:
+            self.dead_bytes += entries.offsets.pop(key)[1]
+        for key, entry in entries.pending.items():
+            data = json.dumps(entry, default=encode_checked).encode("utf-8")
+            offset = f.tell()
+            f.write(data)
+            METRICS.count("storage.bytes_written", len(data))
+            if key in entries.offsets:
+                self.dead_bytes += entries.offsets[key][1]
+            entries.offsets[key] = (offset, len(data))
+        entries.pending.clear()
+        entries.removed.clear()
+
+    # Decode one record straight out of the mapped data file
+    def read_record(self, offset, length):
+        if self._map is None:
+            raise KeyError(offset)
+        METRICS.count("storage.bytes_read", length)
+        with memoryview(self._map) as view, view[offset:offset + length] as chunk:
+            data = json.loads(str(chunk, "utf-8"))
+        if not verify_entry(data):
+            METRICS.count("storage.damaged_records")
+            raise ValueError(f"Entry record at offset {offset} of {self.data_filename} is damaged")
+        return Entry.from_dict(data)
+
+    # Take an entry whose record is damaged out of the index and keep the record in quarantine,
+    # as load_users does for the JSON file; the index is rewritten so the entry stays dropped.
+    # A read-only storage only leaves the entry out
+    def drop_damaged(self, entries, key):
+        with self._damage_lock:
+            if key not in entries.offsets:
+                return
+            offset, length = entries.offsets.pop(key)
+            entries.summaries.pop(key, None)
+            if self.read_only:
+                return
+            self.dead_bytes += length
+            username = next((name for name, record in self.users.items() if record.get("entries") is entries), None)
+            raw = bytes(self._map[offset:offset + length]).decode("utf-8", "replace")
+            part = {"path": [username, "entries", key], "reason": "checksum mismatch", "raw": raw}
+            self.damaged.append(part)
+            self.quarantine_folder = quarantine(self.data_filename, [part])
+            self._write_index()
+
+    # A stored entry, from the body cache or else decoded from the data file
+    def read_body(self, offset, length):
+        position = (offset, length)
+        entry = self.bodies.get(position)
+        if entry is None:
+            entry = self.read_record(offset, length)
+            self.bodies.put(position, entry)
+        return entry
+
+    def list_summaries(self, username):
+        entries = self.list_entries(username)
+        if not isinstance(entries, EntryIndex):
+            return super().list_summaries(username)
+        return SummaryView(entries)
+
+    # Read a single entry without touching any other entry's bytes
+    def get_entry(self, username, key):
+        return self.list_entries(username).get(key)
+
+    # Rewrite the data file with only live records and drop the old generation
+    def compact(self):
+        old_filename = self.data_filename
+        reclaimed = self.dead_bytes
+        self.generation += 1
+        with open(self.data_filename, "wb") as f:
+            with memoryview(self._map) if self._map is not None else memoryview(b"") as view:
+                for record in self.users.values():
+                    entries = record["entries"]
+                    for key, (offset, length) in list(entries.offsets.items()):
+                        entries.summary(key)
+                        new_offset = f.tell()
+                        f.write(view[offset:offset + length])
+                        entries.offsets[key] = (new_offset, length)
+        self.dead_bytes = 0
+        self.bodies.clear()
+        self._write_index()
+        self._open_map()
+        if os.path.exists(old_filename):
+            os.remove(old_filename)
+        return reclaimed
+
+    def _should_compact(self):
+        size = self._data_size()
+        if size < self.compact_min_bytes:
+            return False
+        return self.dead_bytes > size * self.compact_threshold
+
+    def _data_size(self):
+        if os.path.exists(self.data_filename):
+            return os.path.getsize(self.data_filename)
+        return 0
+
+    # The index is replaced atomically so a crash never leaves it half-written
+    def _write_index(self):
+        users = {}
+        for username, record in self.users.items():
+            record = dict(record)
+            entries = record["entries"]
+            record["entries"] = {key: [offset, length, entries.summary(key).to_dict()]
+                                 for key, (offset, length) in entries.offsets.items()}
+            users[username] = record
+        index = {"schema_version": SCHEMA_VERSION, "generation": self.generation, "dead_bytes": self.dead_bytes, "users": users}
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_filename, self.filename)
+
+    def _open_map(self):
+        self._close_map()
+        if self._data_size() == 0:
+            return
+        with open(self.data_filename, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def close(self):
+        self._close_map()
+
+
+def open_storage():
+    """Opens the diary storage: the mmap-indexed mode when DIARY_STORAGE=mmap, per-user files
+    behind a memory-budgeted cache when DIARY_STORAGE=users (budget in DIARY_USER_CACHE_MB),
+    otherwise the JSON file, archiving years older than DIARY_ARCHIVE_YEARS if that is set"""
+    mode = os.environ.get("DIARY_STORAGE")
+    if mode == "mmap":
+        return MmapDiaryStorage()
+    if mode == "users":
+        from user_cache import CachedDiaryStorage
+        budget_mb = float(os.environ.get("DIARY_USER_CACHE_MB", "64"))
+        return CachedDiaryStorage(budget_bytes=int(budget_mb * 1024 * 1024))
+    archive_years = os.environ.get("DIARY_ARCHIVE_YEARS")
+    return DiaryStorage(archive_after_years=int(archive_years) if archive_years else None)
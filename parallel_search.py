@@ -0,0 +1,187 @@
+# parallel_search.py
+import heapq
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from indexes import DateIndex
+
+# Set in each worker process by _init_worker
+_worker_open = None  # (storage class, filename)
+_worker_stamp = None  # file stamp of the data the worker has loaded
+_worker_users = {}  # username -> (read-only storage holding just that user, the user's DateIndex)
+
+
+def _init_worker(storage_class, filename):
+    global _worker_open
+    _worker_open = (storage_class, filename)
+
+
+def file_stamp(filename):
+    """Changes whenever the diary file is saved"""
+    try:
+        info = os.stat(filename)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+# A user's storage and date index in a worker, opened again when the file changed since it was last read.
+# Workers open the file read-only with only that user loaded, so they never quarantine or save anything
+def _worker_user(stamp, username):
+    global _worker_stamp
+    if stamp != _worker_stamp:
+        for store, _ in _worker_users.values():
+            if hasattr(store, "close"):
+                store.close()
+        _worker_users.clear()
+        _worker_stamp = stamp
+    loaded = _worker_users.get(username)
+    if loaded is None:
+        storage_class, filename = _worker_open
+        store = storage_class(filename, read_only=True, usernames=[username])
+        loaded = _worker_users[username] = (store, DateIndex.from_entries(store.list_summaries(username)))
+    return loaded
+
+
+def _date_matcher(date, date_type):
+    """Test for entry dates, matching search_by_date: exact date, or a day, month or year"""
+    if not date:
+        return None
+    if date_type == "day":
+        pattern = re.compile(rf"\d\d\d\d-\d\d-{re.escape(date)}")
+    elif date_type == "month":
+        pattern = re.compile(rf"\d\d\d\d-{re.escape(date)}-\d\d")
+    elif date_type == "year":
+        pattern = re.compile(rf"{re.escape(date)}-\d\d-\d\d")
+    else:
+        return lambda date_key: date_key == date
+    return lambda date_key: bool(pattern.fullmatch(date_key))
+
+
+# Dates of a DateIndex within one year, e.g. "2024"
+def dates_in_year(index, year):
+    return index.dates_between(f"{year}-", f"{year}-\uffff")
+
+
+def search_partition(stamp, username, year, keyword=None, date=None, date_type=None, include_content=False):
+    """Search one (user, year) partition in a worker; results are sorted by (date, username, id)"""
+    store, index = _worker_user(stamp, username)
+    pattern = re.compile(re.escape(keyword), re.IGNORECASE) if keyword else None
+    date_matches = _date_matcher(date, date_type)
+    results = []
+    for date_key in dates_in_year(index, year):
+        if date_matches is not None and not date_matches(date_key):
+            continue
+        for entry_id in index.ids_by_date[date_key]:
+            entry = store.get_entry(username, str(entry_id))
+            if entry is None or not _matches(entry, pattern):
+                continue
+            result = {"username": username, "id": entry["id"], "date": entry["date"], "title": entry["title"]}
+            if include_content:
+                result["content"] = entry["content"]
+            results.append(result)
+    results.sort(key=result_order)
+    return results
+
+
+def _matches(entry, pattern):
+    return pattern is None or bool(pattern.search(entry["title"]) or pattern.search(entry["content"]))
+
+
+def result_order(result):
+    return (result["date"], result["username"], result["id"])
+
+
+class ParallelSearcher:
+    """Keyword and date search over every user's entries, spread over worker processes.
+
+    The entries are split into (user, year) partitions, taken from each
+    user's DateIndex (the given diary's, which its saves keep current, or
+    one built here from the entry summaries and rebuilt after the file
+    changes). They are searched in a ProcessPoolExecutor whose workers open
+    the diary file themselves, read-only and one user at a time (and open
+    it again only after it has been saved). A year or exact date filter
+    skips the partitions of other years. The
+    results come back as a generator in date order: a year is merged and
+    handed out as soon as all of its partitions are done, and at most
+    `max_in_flight` partitions are queued or running at once, so memory
+    holds one year of results rather than the whole corpus.
+
+    The storage must be saved to disk; workers read it from its file.
+    """
+
+    def __init__(self, store, workers=None, max_in_flight=None, diary=None):
+        self.store = store
+        self.diary = diary
+        self.date_indexes = {}  # username -> DateIndex, when no diary is given
+        self.indexes_stamp = None  # file stamp the date_indexes were built from
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(type(store), store.filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def _date_index(self, username):
+        if self.diary is not None:
+            return self.diary._date_index(username)
+        stamp = file_stamp(self.store.filename)
+        if stamp != self.indexes_stamp:
+            self.date_indexes.clear()
+            self.indexes_stamp = stamp
+        index = self.date_indexes.get(username)
+        if index is None:
+            index = self.date_indexes[username] = DateIndex.from_entries(self.store.list_summaries(username))
+        return index
+
+    # (year, username) of every partition, oldest year first
+    def partitions(self, usernames=None, year=None):
+        if usernames is None:
+            usernames = list(self.store.users)
+        plan = set()
+        for username in usernames:
+            index = self._date_index(username)
+            if year is not None:
+                if dates_in_year(index, year):
+                    plan.add((year, username))
+                continue
+            plan.update((date_key[:4], username) for date_key in index.dates)
+        return sorted(plan)
+
+    def search(self, keyword=None, date=None, date_type=None, usernames=None, include_content=False):
+        """Yield the matching entries of all (or the given) users, in date order"""
+        stamp = file_stamp(self.store.filename)
+        year = date[:4] if date and date_type in (None, "year") else None
+        pending = deque(self.partitions(usernames, year))
+        window = deque()  # (year, future) in submission order
+        year_results = []
+        current_year = None
+
+        while pending or window:
+            while pending and len(window) < self.max_in_flight:
+                year, username = pending.popleft()
+                future = self.pool.submit(search_partition, stamp, username, year, keyword, date, date_type, include_content)
+                window.append((year, future))
+
+            year, future = window.popleft()
+            if year != current_year:
+                yield from heapq.merge(*year_results, key=result_order)
+                year_results = []
+                current_year = year
+            year_results.append(future.result())
+
+        yield from heapq.merge(*year_results, key=result_order)
+
+
+def search_all_users(store, keyword=None, date=None, date_type=None, usernames=None, workers=None):
+    """One-off parallel search; returns the results as a list in date order"""
+    with ParallelSearcher(store, workers) as searcher:
+        return list(searcher.search(keyword, date, date_type, usernames))
@@ -0,0 +1,139 @@
+# profiling.py
+import cProfile
+import functools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+
+
+def function_label(key):
+    """"file:line(function)" for a pstats key, with the file shortened to its name"""
+    filename, line, name = key
+    if filename == "~":  # built-in
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class Profiler:
+    """Opt-in cProfile capture of UI actions.
+
+    When enabled, every action wrapped with profiled() runs under cProfile.
+    An action slower than threshold_ms has its profile written to
+    folder/<time>-<action>.prof (open it with pstats or snakeviz), and its
+    functions are added to a per-session tally of the hot functions, which
+    is saved to folder/hot_functions.json so the next session can still
+    show it. Actions started while another one is being profiled (a handler
+    calling another handler) are counted as part of the outer one.
+    """
+
+    def __init__(self, enabled=False, threshold_ms=200, folder="profiles", top=15):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.folder = folder
+        self.top = top
+        self.hot = {}  # function label -> [calls, own seconds, cumulative seconds], over the slow actions
+        self.captures = []  # (action, ms, profile file) of the slow actions of this session
+        self._active = threading.local()
+
+    @property
+    def hot_filename(self):
+        return os.path.join(self.folder, "hot_functions.json")
+
+    def profiled(self, action):
+        """Decorator profiling a callback under the given action name"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or getattr(self._active, "running", False):
+                    return func(*args, **kwargs)
+                return self.run(action, func, *args, **kwargs)
+            return wrapper
+        return decorate
+
+    def run(self, action, func, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler (a debugger, say) is already active
+            return func(*args, **kwargs)
+        self._active.running = True
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._active.running = False
+            if elapsed_ms >= self.threshold_ms:
+                self._capture(action, elapsed_ms, profile)
+
+    # Write the profile of one slow action and add its functions to the tally
+    def _capture(self, action, elapsed_ms, profile):
+        os.makedirs(self.folder, exist_ok=True)
+        safe_action = re.sub(r"[^\w-]", "_", action)
+        path = os.path.join(self.folder, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{safe_action}.prof")
+        profile.dump_stats(path)
+        self.captures.append((action, elapsed_ms, path))
+
+        for key, (_, calls, own, cumulative, _) in pstats.Stats(profile).stats.items():
+            totals = self.hot.setdefault(function_label(key), [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += own
+            totals[2] += cumulative
+        self._save_hot()
+
+    def _save_hot(self):
+        data = {
+            "saved": datetime.now().isoformat(timespec="seconds"),
+            "captures": [{"action": a, "ms": round(ms, 1), "file": path} for a, ms, path in self.captures],
+            "functions": [{"function": label, "calls": calls, "own_s": own, "cumulative_s": cumulative}
+                          for label, (calls, own, cumulative) in self.top_functions(self.top * 4)]
+        }
+        with open(self.hot_filename, "w") as f:
+            json.dump(data, f, indent=4)
+
+    def top_functions(self, n=None):
+        """(label, [calls, own s, cumulative s]) of the functions with the most own time, highest first"""
+        ranked = sorted(self.hot.items(), key=lambda item: item[1][1], reverse=True)
+        return ranked[:n or self.top]
+
+    def last_session(self):
+        """Hot functions of this session, or else of the last session that saved any"""
+        if self.hot:
+            return {
+                "captures": [{"action": a, "ms": ms, "file": path} for a, ms, path in self.captures],
+                "functions": [{"function": label, "calls": calls, "own_s": own, "cumulative_s": cumulative}
+                              for label, (calls, own, cumulative) in self.top_functions()]
+            }
+        try:
+            with open(self.hot_filename, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        data["functions"] = data.get("functions", [])[:self.top]
+        return data
+
+    def report(self):
+        """Hot functions as plain text, for the diagnostics window"""
+        session = self.last_session()
+        if session is None:
+            state = "on" if self.enabled else "off (start with --profile or DIARY_PROFILE=1)"
+            return f"Profiling is {state}; no action has been slower than {self.threshold_ms} ms yet.\n"
+        lines = [f"Slow actions (over {self.threshold_ms} ms)"]
+        lines += [f"  {c['action']:<28}{c['ms']:>9.1f} ms  {c['file']}" for c in session["captures"][-10:]]
+        lines += ["", f"{'hot function':<56}{'calls':>8}{'own s':>9}{'cum s':>9}"]
+        for row in session["functions"]:
+            lines.append(f"{row['function'][:56]:<56}{row['calls']:>8}{row['own_s']:>9.3f}{row['cumulative_s']:>9.3f}")
+        return "\n".join(lines) + "\n"
+
+
+# --profile on the command line (see main.py) or DIARY_PROFILE=1 turns profiling on;
+# DIARY_PROFILE_MS sets the slow-action threshold and DIARY_PROFILE_DIR the output folder
+PROFILER = Profiler(enabled=bool(os.environ.get("DIARY_PROFILE")),
+                    threshold_ms=float(os.environ.get("DIARY_PROFILE_MS", "200")),
+                    folder=os.environ.get("DIARY_PROFILE_DIR", "profiles"))
+profiled = PROFILER.profiled
@@ -0,0 +1,266 @@
+# ranking.py
+import bisect
+import math
+import re
+from collections import Counter
+from fuzzy import FuzzyIndex, allowed_distance
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Words too common to say anything about what an entry is about
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from had has have he her his i if in is it its me my of on or our
+she so that the their them then there they this to up was we were what when which who will with
+you your am been did do not no
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased words of a text"""
+    return [word.lower() for word in WORD_PATTERN.findall(text or "")]
+
+
+def entry_term_counts(entries):
+    """(entry, title word counts, content word counts) of each entry. Mappings that keep the
+    counts (the archive does, per year) hand them out without reading the bodies"""
+    term_counts = getattr(entries, "term_counts", None)
+    if term_counts is not None:
+        return term_counts()
+    return ((entry, Counter(tokenize(entry["title"])), Counter(tokenize(entry["content"])))
+            for entry in entries.values())
+
+
+class TermStats:
+    """Cached term frequencies and lengths of one entry's title and content"""
+
+    __slots__ = ("title_tf", "content_tf", "title_len", "content_len")
+
+    def __init__(self, title, content):
+        title_words = tokenize(title)
+        content_words = tokenize(content)
+        self.title_tf = Counter(title_words)
+        self.content_tf = Counter(content_words)
+        self.title_len = len(title_words)
+        self.content_len = len(content_words)
+
+    @classmethod
+    def from_counts(cls, title_tf, content_tf):
+        stats = cls.__new__(cls)
+        stats.title_tf = Counter(title_tf)
+        stats.content_tf = Counter(content_tf)
+        stats.title_len = sum(stats.title_tf.values())
+        stats.content_len = sum(stats.content_tf.values())
+        return stats
+
+    def terms(self):
+        return self.title_tf.keys() | self.content_tf.keys()
+
+
+class SearchIndex:
+    """BM25 index over the titles and contents of one user's entries.
+
+    Title words count `title_boost` times as much as content words (a simple
+    BM25F). Per-entry term statistics, the postings and the sorted vocabulary
+    are updated as entries are saved and deleted, so a query only touches the
+    entries that contain one of its terms.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, title_boost=3.0):
+        self.k1 = k1
+        self.b = b
+        self.title_boost = title_boost
+        self.stats = {}  # entry id -> TermStats
+        self.postings = {}  # term -> set of entry ids
+        self.vocabulary = []  # sorted terms, for prefix lookups
+        self.total_length = 0.0
+        self.fuzzy = None  # FuzzyIndex over the vocabulary, built on the first typo-tolerant search
+
+    @classmethod
+    def from_entries(cls, entries, **options):
+        index = cls(**options)
+        for entry, title_tf, content_tf in entry_term_counts(entries):
+            index.add_stats(entry["id"], TermStats.from_counts(title_tf, content_tf))
+        return index
+
+    def _length(self, stats):
+        return self.title_boost * stats.title_len + stats.content_len
+
+    def add(self, entry_id, title, content):
+        self.add_stats(entry_id, TermStats(title, content))
+
+    def add_stats(self, entry_id, stats):
+        self.remove(entry_id)
+        self.stats[entry_id] = stats
+        self.total_length += self._length(stats)
+        for term in stats.terms():
+            ids = self.postings.get(term)
+            if ids is None:
+                ids = self.postings[term] = set()
+                bisect.insort(self.vocabulary, term)
+                if self.fuzzy is not None:
+                    self.fuzzy.add(term)
+            ids.add(entry_id)
+
+    def remove(self, entry_id):
+        stats = self.stats.pop(entry_id, None)
+        if stats is None:
+            return
+        self.total_length -= self._length(stats)
+        for term in stats.terms():
+            ids = self.postings[term]
+            ids.discard(entry_id)
+            if not ids:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+                if self.fuzzy is not None:
+                    self.fuzzy.remove(term)
+
+    # Vocabulary terms starting with a prefix, found with bisect on the sorted vocabulary
+    def expand_prefix(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\U0010ffff")
+        return self.vocabulary[start:end]
+
+    # Each query word matches itself and the longer words it is a prefix of
+    def query_terms(self, query):
+        groups = []
+        for word in tokenize(query):
+            terms = self.expand_prefix(word)
+            if terms:
+                groups.append(terms)
+        return groups
+
+    # Build the FuzzyIndex over the vocabulary, unless one covering max_distance is there already
+    def prepare_fuzzy(self, max_distance=2):
+        if self.fuzzy is None or self.fuzzy.max_distance < max_distance:
+            self.fuzzy = FuzzyIndex.from_terms(self.vocabulary, max_distance=max_distance)
+        return self.fuzzy
+
+    def fuzzy_ready(self, max_distance=2):
+        return self.fuzzy is not None and self.fuzzy.max_distance >= max_distance
+
+    # Each query word matches the vocabulary terms within a few typos of it
+    def fuzzy_terms(self, query, max_distance=2):
+        """Term groups for a typo-tolerant query, and the edit distance of every term"""
+        self.prepare_fuzzy(max_distance)
+        groups = []
+        distances = {}
+        for word in tokenize(query):
+            matches = self.fuzzy.lookup(word, allowed_distance(word, max_distance))
+            if matches:
+                groups.append([term for term, _ in matches])
+                for term, distance in matches:
+                    distances[term] = min(distance, distances.get(term, distance))
+        return groups, distances
+
+    def idf(self, term):
+        n = len(self.stats)
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def score(self, query, candidates=None, cancel=None):
+        """BM25 scores of the entries matching every word of the query, best first.
+
+        Returns a list of (score, entry_id). `candidates` limits the result to
+        a set of ids coming from other filters. `cancel` is an optional token
+        whose check() is called while scoring, so a superseded search can stop.
+        """
+        groups = self.query_terms(query)
+        if len(groups) < len(tokenize(query)):
+            return []
+        return self.score_groups(groups, candidates, cancel)
+
+    def score_fuzzy(self, query, candidates=None, cancel=None, max_distance=2):
+        """Like score(), but query words also match terms a few typos away.
+
+        Closer spellings weigh more: a term's idf is divided by 1 + its distance.
+        """
+        groups, distances = self.fuzzy_terms(query, max_distance)
+        if len(groups) < len(tokenize(query)):
+            return []
+        return self.score_groups(groups, candidates, cancel, distances)
+
+    def score_groups(self, groups, candidates=None, cancel=None, distances=None):
+        """Score the entries matching a term of every group (see score())"""
+        if not groups:
+            return []
+
+        # Entries must match every query word (any of its expansions)
+        matching = None
+        for terms in groups:
+            ids = set().union(*(self.postings[term] for term in terms))
+            matching = ids if matching is None else matching & ids
+        if candidates is not None:
+            matching &= set(candidates)
+        if not matching:
+            return []
+
+        avg_length = self.total_length / max(len(self.stats), 1) or 1.0
+        distances = distances or {}
+        weights = {term: self.idf(term) / (1 + distances.get(term, 0)) for terms in groups for term in terms}
+        results = []
+        for count, entry_id in enumerate(matching):
+            if cancel is not None and count % 256 == 0:
+                cancel.check()
+            stats = self.stats[entry_id]
+            norm = self.k1 * (1 - self.b + self.b * self._length(stats) / avg_length)
+            total = 0.0
+            for term, idf in weights.items():
+                tf = self.title_boost * stats.title_tf.get(term, 0) + stats.content_tf.get(term, 0)
+                if tf:
+                    total += idf * tf * (self.k1 + 1) / (tf + norm)
+            results.append((total, entry_id))
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return results
+
+
+def make_snippet(text, terms, width=120):
+    """Cut the part of `text` (about `width` characters) with the most matches of `terms`.
+
+    Returns the snippet and the (start, end) spans of the matches inside it.
+    """
+    text = text or ""
+    terms = set(terms)
+    matches = [m.span() for m in WORD_PATTERN.finditer(text) if m.group().lower() in terms]
+    if not matches:
+        snippet = text[:width]
+        return (snippet + "…" if len(text) > width else snippet), []
+
+    # Slide a window over the matches and keep the one holding the most of them
+    best_start, best_count = 0, 0
+    right = 0
+    for left in range(len(matches)):
+        while right < len(matches) and matches[right][1] - matches[left][0] <= width:
+            right += 1
+        if right - left > best_count:
+            best_start, best_count = left, right - left
+
+    first = matches[best_start][0]
+    last = matches[best_start + best_count - 1][1]
+    start = max(0, first - (width - (last - first)) // 2)
+    end = min(len(text), start + width)
+    start = max(0, min(start, end - width))
+    # Don't cut words in half at the edges
+    while start > 0 and text[start - 1].isalnum() and start < first:
+        start += 1
+    while end < len(text) and text[end].isalnum() and end > last:
+        end -= 1
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    snippet = prefix + text[start:end].replace("\n", " ") + suffix
+    offset = len(prefix) - start
+    spans = [(s + offset, e + offset) for s, e in matches if s >= start and e <= end]
+    return snippet, spans
+
+
+def mark_highlights(snippet, spans, before="[", after="]"):
+    """Wrap the highlighted spans of a snippet in markers, for plain-text views"""
+    parts = []
+    last = 0
+    for start, end in spans:
+        parts.append(snippet[last:start])
+        parts.append(before + snippet[start:end] + after)
+        last = end
+    parts.append(snippet[last:])
+    return "".join(parts)
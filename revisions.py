@@ -0,0 +1,188 @@
+# revisions.py
+import difflib
+import json
+import re
+from datetime import datetime, timedelta
+
+# Fields of an entry that are versioned
+TRACKED_FIELDS = ("title", "content")
+
+EMPTY_ENTRY = {"title": "", "content": ""}
+
+
+# Split text into lines (keeping line endings) so deltas are line-based
+def _lines(text):
+    return (text or "").splitlines(keepends=True)
+
+
+# Split text into words, each with the whitespace after it, for diffing inside a changed line
+_WORD = re.compile(r"\S+\s*|\s+")
+
+# Changed line blocks larger than this (in words, either side) are stored whole rather than diffed word by word
+MAX_WORD_DIFF = 20000
+
+
+def _words(text):
+    return _WORD.findall(text)
+
+
+def _diff(new_parts, old_parts):
+    """Opcodes rebuilding old_parts from new_parts: [start, end] copies, strings are inserted"""
+    ops = []
+    matcher = difflib.SequenceMatcher(None, new_parts, old_parts, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append("".join(old_parts[j1:j2]))
+    return ops
+
+
+def make_delta(new_text, old_text):
+    """Build opcodes that rebuild old_text from new_text.
+
+    A [start, end] pair copies lines from new_text, a string is inserted as is,
+    so the delta only carries the lines that actually changed. Where lines were
+    changed rather than added, [start, end, word_ops] rebuilds them from the
+    words of new_text's lines start to end, so editing a word in a long
+    paragraph stores that word and not the whole paragraph.
+    """
+    new_lines = _lines(new_text)
+    old_lines = _lines(old_text)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, new_lines, old_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif tag == "insert":
+            ops.append("".join(old_lines[j1:j2]))
+        elif tag == "replace":
+            old_block = "".join(old_lines[j1:j2])
+            new_words, old_words = _words("".join(new_lines[i1:i2])), _words(old_block)
+            if max(len(new_words), len(old_words)) <= MAX_WORD_DIFF:
+                word_ops = _diff(new_words, old_words)
+                if len(json.dumps(word_ops)) < len(json.dumps(old_block)):
+                    ops.append([i1, i2, word_ops])
+                    continue
+            ops.append(old_block)
+    return ops
+
+
+def apply_delta(new_text, ops):
+    """Rebuild the older text from new_text and a delta made by make_delta"""
+    new_lines = _lines(new_text)
+    parts = []
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        elif len(op) == 3:
+            words = _words("".join(new_lines[op[0]:op[1]]))
+            for word_op in op[2]:
+                parts.append(word_op if isinstance(word_op, str) else "".join(words[word_op[0]:word_op[1]]))
+        else:
+            parts.extend(new_lines[op[0]:op[1]])
+    return "".join(parts)
+
+
+class RetentionPolicy:
+    """How many old revisions of an entry to keep, and for how long"""
+
+    def __init__(self, max_revisions=50, max_age_days=None):
+        self.max_revisions = max_revisions
+        self.max_age_days = max_age_days
+
+
+class RevisionHistory:
+    """Reverse-delta revision chain for the entries of one user.
+
+    Works on the user's "revisions" dict, keyed like the entries themselves.
+    Each record holds the delta from the next newer state back to the old
+    one, so the current entry is always stored in full and every older
+    revision costs only the bytes that changed.
+    """
+
+    def __init__(self, revisions, policy=None):
+        self.revisions = revisions
+        self.policy = policy or RetentionPolicy()
+
+    # Save the state being replaced (old_entry) as a delta against new_entry.
+    # old_entry is None when the entry did not exist (e.g. it was deleted),
+    # new_entry is None when it is being deleted.
+    def record(self, key, old_entry, new_entry=None):
+        if old_entry is None:
+            if key not in self.revisions:
+                return None
+            old_entry = EMPTY_ENTRY
+        new_entry = new_entry or EMPTY_ENTRY
+        delta = {}
+        for field in TRACKED_FIELDS:
+            old_text = old_entry.get(field, "")
+            new_text = new_entry.get(field, "")
+            if old_text != new_text:
+                delta[field] = make_delta(new_text, old_text)
+        if not delta:
+            return None
+
+        chain = self.revisions.setdefault(key, {"next_rev": 1, "history": []})
+        rev = chain["next_rev"]
+        chain["next_rev"] += 1
+        chain["history"].append({
+            "rev": rev,
+            "date": old_entry.get("date", ""),
+            "time": old_entry.get("time", ""),
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "delta": delta
+        })
+        self.apply_retention(key)
+        return rev
+
+    # Drop the oldest revisions that fall outside the retention policy
+    def apply_retention(self, key):
+        chain = self.revisions.get(key)
+        if not chain:
+            return
+        history = chain["history"]
+        if self.policy.max_revisions is not None and len(history) > self.policy.max_revisions:
+            del history[:len(history) - self.policy.max_revisions]
+        if self.policy.max_age_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.policy.max_age_days)).isoformat(timespec="seconds")
+            while history and history[0]["saved_at"] < cutoff:
+                history.pop(0)
+
+    # Summaries of the stored revisions, oldest first
+    def list(self, key):
+        chain = self.revisions.get(key, {"history": []})
+        return [
+            {"rev": r["rev"], "time": r["time"], "saved_at": r["saved_at"], "fields": sorted(r["delta"])}
+            for r in chain["history"]
+        ]
+
+    # Rebuild the entry as it was at revision `rev` (title, content and date)
+    def get(self, key, rev, current_entry=None):
+        state = {field: (current_entry or EMPTY_ENTRY).get(field, "") for field in TRACKED_FIELDS}
+        chain = self.revisions.get(key, {"history": []})
+        for record in reversed(chain["history"]):
+            for field, ops in record["delta"].items():
+                state[field] = apply_delta(state[field], ops)
+            if record["rev"] == rev:
+                if record.get("date"):
+                    state["date"] = record["date"]
+                return state
+        raise KeyError(f"No revision {rev} for {key}")
+
+    # Forget all revisions of an entry
+    def drop(self, key):
+        self.revisions.pop(key, None)
+
+
+# Unified diff between two versions of an entry
+def diff_entries(old_entry, new_entry, old_label="old", new_label="new"):
+    lines = []
+    for field in TRACKED_FIELDS:
+        lines.extend(difflib.unified_diff(
+            _lines(old_entry.get(field, "") + "\n"),
+            _lines(new_entry.get(field, "") + "\n"),
+            fromfile=f"{old_label}/{field}",
+            tofile=f"{new_label}/{field}"
+        ))
+    return "".join(lines)
@@ -0,0 +1,333 @@
+# server.py
+import argparse
+import json
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from diary import Diary
+from mmap_storage import open_storage
+from locks import ReadWriteLock
+from entry import encode_entry
+
+ENTRY_PATH = re.compile(r"^/entries/(\d+)$")
+
+
+class ApiError(Exception):
+    """Error returned to the client as {"error": message} with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class DiaryService:
+    """The diary operations offered over HTTP, on one shared storage session.
+
+    Reads (listing, searching, statistics) share the lock, saves and
+    deletes take it alone. A user's indexes are built at login, under a
+    separate lock, so concurrent reads only ever look them up. The
+    typo-tolerant lookup table is only built for users who search with
+    fuzzy=true, on their first such search, under the write lock.
+    """
+
+    def __init__(self, diary):
+        self.diary = diary
+        self.lock = ReadWriteLock()
+        self.build_lock = threading.Lock()
+        self.sessions = {}  # token -> username
+        self.sessions_lock = threading.Lock()
+
+    def _read(self, action, *args):
+        with self.lock.reading():
+            return action(*args)
+
+    def _write(self, action, *args):
+        with self.lock.writing():
+            return action(*args)
+
+    # Read with the user's indexes in place. A storage that evicts users drops their indexes,
+    # so they may be gone since login; they are built again alone, under the write lock
+    def _read_user(self, username, action, *args):
+        while True:
+            with self.lock.reading():
+                if self.diary.indexes_built(username):
+                    return action(*args)
+            self._write(self.diary.build_indexes, username)
+
+    # Build a user's indexes before concurrent reads use them
+    def _prepare(self, username):
+        with self.build_lock:
+            self.diary.build_indexes(username)
+
+    # Build a user's typo-tolerant lookup table before the first fuzzy search reads it
+    def _prepare_fuzzy(self, username):
+        self.diary._search_index(username).prepare_fuzzy()
+
+    def register(self, username, password):
+        if not username or not password:
+            raise ApiError(400, "username and password are required")
+
+        def add():
+            if username in self.diary.store.users:
+                raise ApiError(409, "Username already exists")
+            self.diary.store.add_user(username, password)
+        self._write(add)
+
+    def login(self, username, password):
+        if not self._read(self.diary.store.validate_user, username, password):
+            raise ApiError(401, "Invalid username or password")
+        self._read(self._prepare, username)
+        token = secrets.token_urlsafe(24)
+        with self.sessions_lock:
+            self.sessions[token] = username
+        return token
+
+    def logout(self, token):
+        with self.sessions_lock:
+            self.sessions.pop(token, None)
+
+    def user_for(self, token):
+        with self.sessions_lock:
+            username = self.sessions.get(token)
+        if username is None:
+            raise ApiError(401, "Missing or unknown token")
+        return username
+
+    def list_entries(self, username, date=None):
+        if date:
+            return self._read_user(username, self.diary.entries_on, date, username)
+        return self._read(lambda: sorted(self.diary.store.list_entries(username).values(),
+                                         key=lambda e: (e["date"], e["id"])))
+
+    def get_entry(self, username, entry_id):
+        entry = self._read(self.diary.get_entry, entry_id, username)
+        if entry is None:
+            raise ApiError(404, f"No entry {entry_id}")
+        return entry
+
+    def save_entry(self, username, fields, entry_id=None):
+        if not fields.get("date"):
+            raise ApiError(400, "date is required")
+        entry = {
+            "id": entry_id,
+            "title": fields.get("title", ""),
+            "content": fields.get("content", ""),
+            "date": fields["date"],
+            "tags": fields.get("tags", [])
+        }
+
+        def save():
+            if entry_id is not None and self.diary.get_entry(entry_id, username) is None:
+                raise ApiError(404, f"No entry {entry_id}")
+            return self.diary.create_entry(entry, username)
+        return self._write(save)
+
+    def delete_entry(self, username, entry_id):
+        if not self._write(self.diary.delete_entry, entry_id, username):
+            raise ApiError(404, f"No entry {entry_id}")
+
+    def search(self, username, query=None, tags=None, date=None, date_type=None, fuzzy=False, limit=50):
+        def run():
+            if query:
+                candidates = self.diary.filter_ids(username, tags, date, date_type)
+                ranking = self.diary.rank(query, username, candidates, None, fuzzy)
+                return self.diary.ranked_results(ranking, query, username, 0, limit, fuzzy)
+            return self.diary.search(username, None, tags, date, date_type)[:limit]
+
+        if fuzzy and not self._read_user(username, lambda: self.diary._search_index(username).fuzzy_ready()):
+            self._write(self._prepare_fuzzy, username)
+        try:
+            return self._read_user(username, run)
+        except ValueError as e:
+            raise ApiError(400, f"Invalid tag query: {e}")
+
+    def stats(self, username):
+        return self._read_user(username, lambda: self.diary.stats(username).summary())
+
+
+class DiaryRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over DiaryService; HTTP/1.1, so clients can keep connections open"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = 5  # Close idle keep-alive connections, so they don't hold a worker forever (set by make_server)
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't let the body wait for an ACK
+    service = None  # set by make_server
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload if payload is not None else {}, default=encode_entry).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        if not self.raw_body:
+            return {}
+        try:
+            body = json.loads(self.raw_body)
+        except (ValueError, UnicodeDecodeError):
+            raise ApiError(400, "Body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Body must be a JSON object")
+        return body
+
+    def _token(self):
+        header = self.headers.get("Authorization", "")
+        return header[len("Bearer "):] if header.startswith("Bearer ") else ""
+
+    def _user(self):
+        return self.service.user_for(self._token())
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Without the body's length the next request can't be found, so the connection ends here
+            self.close_connection = True
+            self._send(400, {"error": "Content-Length must be a non-negative number"})
+            return
+        # Always read the whole body, so the next request on a kept-alive connection starts cleanly
+        self.raw_body = self.rfile.read(length)
+        try:
+            status, payload = self._route(method, path, query)
+        except ApiError as e:
+            status, payload = e.status, {"error": e.message}
+        except Exception as e:
+            status, payload = 500, {"error": f"Internal error: {e}"}
+        self._send(status, payload)
+
+    def _route(self, method, path, query):
+        service = self.service
+        match = ENTRY_PATH.match(path)
+        entry_id = int(match.group(1)) if match else None
+
+        if method == "POST" and path == "/register":
+            body = self._body()
+            service.register(body.get("username", ""), body.get("password", ""))
+            return 201, {"username": body["username"]}
+        if method == "POST" and path == "/login":
+            body = self._body()
+            return 200, {"token": service.login(body.get("username", ""), body.get("password", ""))}
+        if method == "POST" and path == "/logout":
+            service.logout(self._token())
+            return 200, {}
+
+        if path == "/entries" and method == "GET":
+            return 200, {"entries": service.list_entries(self._user(), query.get("date"))}
+        if path == "/entries" and method == "POST":
+            username = self._user()
+            return 201, {"id": service.save_entry(username, self._body())}
+        if entry_id is not None and method == "GET":
+            return 200, service.get_entry(self._user(), entry_id)
+        if entry_id is not None and method == "PUT":
+            username = self._user()
+            return 200, {"id": service.save_entry(username, self._body(), entry_id)}
+        if entry_id is not None and method == "DELETE":
+            service.delete_entry(self._user(), entry_id)
+            return 200, {}
+
+        if path == "/search" and method == "GET":
+            username = self._user()
+            try:
+                limit = int(query.get("limit", 50))
+            except ValueError:
+                raise ApiError(400, "limit must be a number")
+            results = service.search(username, query.get("q"), query.get("tags"), query.get("date"),
+                                     query.get("date_type"), query.get("fuzzy") in ("1", "true"), limit)
+            return 200, {"results": results}
+        if path == "/stats" and method == "GET":
+            return 200, service.stats(self._user())
+
+        raise ApiError(404, f"No route for {method} {path}")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer handing each connection to a fixed pool of worker threads.
+
+    At most `max_workers + backlog` connections are queued or being served;
+    beyond that the accept loop waits, and new clients wait in the kernel's
+    listen queue instead of piling up threads.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, handler, max_workers=8, backlog=64, verbose=False):
+        super().__init__(address, handler)
+        self.verbose = verbose
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="diary-http")
+        self.slots = threading.BoundedSemaphore(max_workers + backlog)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        future = self.pool.submit(self._serve, request, client_address)
+        future.add_done_callback(lambda f: self.slots.release())
+
+    def _serve(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def make_server(diary=None, host="127.0.0.1", port=8765, max_workers=8, verbose=False, idle_timeout=5):
+    """Create the API server (not started yet); port 0 picks a free port. A connection idle for
+    idle_timeout seconds is closed, giving its worker to the next client"""
+    service = DiaryService(diary if diary is not None else Diary(open_storage()))
+    handler = type("BoundDiaryRequestHandler", (DiaryRequestHandler,), {"service": service, "timeout": idle_timeout})
+    return ThreadPoolHTTPServer((host, port), handler, max_workers=max_workers, verbose=verbose)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the diary as a local HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--idle-timeout", type=float, default=5, help="seconds before an idle connection is closed")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = make_server(host=args.host, port=args.port, max_workers=args.workers, verbose=args.verbose,
+                         idle_timeout=args.idle_timeout)
+    print(f"Diary API listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# similar.py
+import os
+from collections import Counter
+import numpy as np
+from ranking import tokenize, entry_term_counts, STOP_WORDS
+
+
+class RelatedIndex:
+    """TF-IDF vectors of one user's entries, for finding entries similar to another.
+
+    Each entry is a sparse row of log-scaled term frequencies (term column
+    ids and values in compact numpy arrays). Saving an entry only
+    re-tokenizes that entry; the next query appends the new rows to the
+    CSR arrays, which grow by doubling. A changed or removed entry's old row
+    stays behind with id -1 until dead rows outnumber live ones, when the
+    arrays are rebuilt. Idf weights are applied at query time, so document
+    frequencies can change without touching the stored rows, and all cosine
+    scores come from one sparse matrix-vector product.
+    """
+
+    def __init__(self):
+        self.columns = {}  # term -> column number
+        self.df = np.zeros(0, dtype=np.int32)  # entries containing each column's term
+        self.rows = {}  # entry id -> (column numbers, log tf values)
+        self.stamp = None  # stamp of the state of the entries the rows describe (set by the diary)
+        # CSR arrays with spare room at the end: entry id (-1 once dead), row pointers, columns and tf
+        # values, of which _count rows are used (_dead of them dead); set up by _rebuild
+        self._rebuild()
+        self.changed = False  # rows differ from the cache file
+
+    @classmethod
+    def from_entries(cls, entries):
+        index = cls()
+        for entry, title_tf, content_tf in entry_term_counts(entries):
+            index.add_counts(entry["id"], title_tf + content_tf)
+        return index
+
+    def _column(self, term):
+        column = self.columns.get(term)
+        if column is None:
+            column = self.columns[term] = len(self.columns)
+            if column >= len(self.df):
+                self.df = np.concatenate([self.df, np.zeros(max(64, len(self.df)), dtype=np.int32)])
+        return column
+
+    def add(self, entry_id, title, content):
+        self.add_counts(entry_id, Counter(tokenize(f"{title} {content}")))
+
+    # Add an entry from its word counts (stop words and numbers are left out here)
+    def add_counts(self, entry_id, word_counts):
+        self.remove(entry_id)
+        terms = sorted(w for w in word_counts if w not in STOP_WORDS and not w.isdigit())
+        if not terms:
+            return
+        counts = np.fromiter((word_counts[term] for term in terms), dtype=np.float64, count=len(terms))
+        columns = np.fromiter((self._column(term) for term in terms), dtype=np.int32, count=len(terms))
+        order = np.argsort(columns)
+        columns = columns[order]
+        self.rows[entry_id] = (columns, (1.0 + np.log(counts[order])).astype(np.float32))
+        self.df[columns] += 1
+        self._pending[entry_id] = None
+        self.changed = True
+
+    def remove(self, entry_id):
+        row = self.rows.pop(entry_id, None)
+        if row is None:
+            return
+        self.df[row[0]] -= 1
+        self._pending.pop(entry_id, None)
+        position = self._positions.pop(entry_id, None)
+        if position is not None:
+            self._ids[position] = -1
+            self._dead += 1
+        self.changed = True
+
+    def idf(self):
+        n = max(len(self.rows), 1)
+        df = self.df[:len(self.columns)]
+        return np.log((1 + n) / (1 + df)).astype(np.float32) + 1.0
+
+    # The rows as CSR arrays: ids (-1 for dead rows), row pointers, column numbers and tf values.
+    # Rows added since the last call are appended; the arrays are only rebuilt once mostly dead
+    def matrix(self):
+        if self._dead > len(self.rows):
+            self._rebuild()
+        if self._pending:
+            self._append(list(self._pending))
+            self._pending.clear()
+        count = self._count
+        size = self._indptr[count]
+        return self._ids[:count], self._indptr[:count + 1], self._indices[:size], self._data[:size]
+
+    # Start the arrays afresh (rows loaded from a cache file are views into the old ones) with every live row
+    def _rebuild(self):
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._data = np.zeros(0, dtype=np.float32)
+        self._count = self._dead = 0
+        self._positions = {}  # entry id -> its row in the arrays
+        self._pending = dict.fromkeys(self.rows)  # ids of rows not in the arrays yet, in the order added
+
+    def _append(self, entry_ids):
+        rows = [self.rows[entry_id] for entry_id in entry_ids]
+        lengths = np.fromiter((len(columns) for columns, _ in rows), dtype=np.int64, count=len(rows))
+        start, size = self._count, int(self._indptr[self._count])
+        end, new_size = start + len(rows), size + int(lengths.sum())
+        self._ids = _grown(self._ids, end)
+        self._indptr = _grown(self._indptr, end + 1)
+        self._indices = _grown(self._indices, new_size)
+        self._data = _grown(self._data, new_size)
+        self._ids[start:end] = entry_ids
+        np.cumsum(lengths, out=self._indptr[start + 1:end + 1])
+        self._indptr[start + 1:end + 1] += size
+        if rows:
+            self._indices[size:new_size] = np.concatenate([columns for columns, _ in rows])
+            self._data[size:new_size] = np.concatenate([values for _, values in rows])
+        self._positions.update(zip(entry_ids, range(start, end)))
+        self._count = end
+
+    def similar(self, entry_id, k=5):
+        """The k entries most similar to an entry, as (cosine score, entry id), best first"""
+        if entry_id not in self.rows:
+            return []
+        ids, indptr, indices, data = self.matrix()
+        if len(self.rows) < 2:
+            return []
+
+        idf = self.idf()
+        weighted = data * idf[indices]
+        # Row norms and the dot products with the query are both sums over each row's slice
+        starts = indptr[:-1]
+        norms = np.sqrt(np.add.reduceat(weighted * weighted, starts))
+
+        query_columns, query_values = self.rows[entry_id]
+        query = np.zeros(len(idf), dtype=np.float32)
+        query[query_columns] = query_values * idf[query_columns]
+        query /= np.linalg.norm(query)
+
+        scores = np.add.reduceat(weighted * query[indices], starts) / norms
+        scores[(ids == entry_id) | (ids < 0)] = -1.0
+
+        k = min(k, len(ids) - 1)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[i]), int(ids[i])) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        """Write the rows to an .npz cache file"""
+        if self._dead:
+            self._rebuild()
+        ids, indptr, indices, data = self.matrix()
+        terms = np.array(sorted(self.columns, key=self.columns.get), dtype=str)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, ids=ids, indptr=indptr, indices=indices, data=data,
+                 terms=terms, stamp=np.array(self.stamp or ""))
+        os.replace(tmp_path, path)
+        self.changed = False
+
+    @classmethod
+    def load(cls, path, stamp):
+        """Read a cache file, or return None when it is missing or older than the entries"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as cached:
+                if str(cached["stamp"]) != stamp:
+                    return None
+                index = cls()
+                terms = cached["terms"].tolist()
+                index.columns = {term: column for column, term in enumerate(terms)}
+                ids, indptr, indices, data = cached["ids"], cached["indptr"], cached["indices"], cached["data"]
+                for row, entry_id in enumerate(ids.tolist()):
+                    start, end = indptr[row], indptr[row + 1]
+                    index.rows[entry_id] = (indices[start:end], data[start:end])
+                    index._positions[entry_id] = row
+                index.df = np.bincount(indices, minlength=len(terms)).astype(np.int32)
+                index._ids, index._indptr, index._indices, index._data = ids, indptr, indices, data
+                index._count = len(ids)
+        except (OSError, ValueError, KeyError):
+            return None
+        index.stamp = stamp
+        return index
+
+
+# An array with room for at least size items, doubling its length when it has to grow
+def _grown(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
@@ -0,0 +1,144 @@
+# stall_detector.py
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+log = logging.getLogger("diary.stalls")
+
+
+def in_tkinter(frame):
+    """True for frames of tkinter itself, which dispatches the event and after callbacks"""
+    return frame.f_code.co_filename.endswith(os.path.join("tkinter", "__init__.py"))
+
+
+# Decorators around the handlers (metrics timing, profiling) that should not be named as the handler
+WRAPPER_FILES = ("metrics.py", "profiling.py")
+
+
+def handler_name(frames, is_dispatcher=in_tkinter):
+    """Name of the callback being run in a stack (outermost frame first): the frame
+    right after the innermost dispatcher frame, or the innermost frame if there is none"""
+    if not frames:
+        return "unknown"
+    index = len(frames) - 1
+    for i in range(len(frames) - 1):
+        if is_dispatcher(frames[i]) and not is_dispatcher(frames[i + 1]):
+            index = i + 1
+    while index < len(frames) - 1 and os.path.basename(frames[index].f_code.co_filename) in WRAPPER_FILES:
+        index += 1
+    code = frames[index].f_code
+    return getattr(code, "co_qualname", code.co_name)
+
+
+class StallStats:
+    """Stalls of one handler"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_stack = ""
+
+    def add(self, ms, stack):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if stack:
+            self.last_stack = stack
+
+
+class StallDetector:
+    """Watchdog for a blocked Tk event loop.
+
+    A heartbeat rescheduled with after(interval_ms) notes when it runs; a
+    monitor thread checks how late the next beat is. Once it is more than
+    threshold_ms late, the monitor takes the stack of the event-loop thread
+    (sys._current_frames) and the name of the handler on it, and when the
+    beat finally runs the stall is logged to the "diary.stalls" logger with
+    its full duration and added to the per-handler totals. after is
+    root.after, or any function with the same (ms, callback) signature
+    that runs callbacks on the loop thread.
+    """
+
+    def __init__(self, after, interval_ms=100, threshold_ms=500, is_dispatcher=in_tkinter, keep=200):
+        self.after = after
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.is_dispatcher = is_dispatcher
+        self.by_handler = {}  # handler name -> StallStats
+        self.recent = deque(maxlen=keep)  # (wall time, handler, ms) of the latest stalls
+        self.loop_thread = None
+        self.due = None  # monotonic time the next beat should run at
+        self.pending = None  # (handler, stack) of a stall the monitor caught, until the beat runs
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._monitor_thread = None
+
+    def start(self):
+        """Start watching; call this on the event-loop thread"""
+        self.loop_thread = threading.get_ident()
+        self.due = time.monotonic() + self.interval_ms / 1000
+        self.after(self.interval_ms, self._beat)
+        self._monitor_thread = threading.Thread(target=self._monitor, name="stall-monitor", daemon=True)
+        self._monitor_thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _beat(self):
+        now = time.monotonic()
+        with self._lock:
+            late_ms = (now - self.due) * 1000
+            pending, self.pending = self.pending, None
+            self.due = now + self.interval_ms / 1000
+        if late_ms >= self.threshold_ms:
+            self._record(pending, late_ms)
+        if not self._stopped.is_set():
+            self.after(self.interval_ms, self._beat)
+
+    def _monitor(self):
+        while not self._stopped.wait(self.interval_ms / 2000):
+            with self._lock:
+                if self.pending is not None or (time.monotonic() - self.due) * 1000 < self.threshold_ms:
+                    continue
+                self.pending = self._capture()
+
+    # Handler name and stack of the event-loop thread, taken while it is blocked
+    def _capture(self):
+        frame = sys._current_frames().get(self.loop_thread)
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+        stack = "".join(traceback.format_list(traceback.extract_stack(frames[-1]))) if frames else ""
+        return handler_name(frames, self.is_dispatcher), stack
+
+    def _record(self, pending, ms):
+        handler, stack = pending or ("unknown (shorter than a monitor check)", "")
+        with self._lock:
+            self.by_handler.setdefault(handler, StallStats()).add(ms, stack)
+            self.recent.append((time.time(), handler, ms))
+        log.warning("Event loop blocked for %.0f ms in %s\n%s", ms, handler, stack)
+
+    def worst(self, n=10):
+        """(handler, StallStats) with the most blocked time in total, worst first"""
+        with self._lock:
+            return sorted(self.by_handler.items(), key=lambda item: item[1].total_ms, reverse=True)[:n]
+
+    def report(self):
+        """Stall ranking as plain text, for the diagnostics window"""
+        worst = self.worst()
+        if not worst:
+            return f"No event-loop stalls over {self.threshold_ms} ms so far.\n"
+        lines = [f"Event-loop stalls over {self.threshold_ms} ms",
+                 f"{'handler':<44}{'stalls':>7}{'total ms':>10}{'max ms':>9}"]
+        for handler, stats in worst:
+            lines.append(f"{handler[:44]:<44}{stats.count:>7}{stats.total_ms:>10.0f}{stats.max_ms:>9.0f}")
+        handler, stats = worst[0]
+        lines += ["", f"Last stack of {handler}:", stats.last_stack]
+        return "\n".join(lines) + "\n"
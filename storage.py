@@ -1,30 +1,154 @@
 # storage.py
 import json
 import os
-from datetime import datetime
+import re
+from datetime import date
+from entry import Entry
+from archive import ArchiveShelf, TieredEntries, TieredSummaries, entry_year
+from metrics import METRICS, timed
+from migrations import SCHEMA_VERSION, UserStream, migrate_record, split_header
+from integrity import encode_checked, quarantine, salvage_users, verify_entry
+
+
+# Bring a user record read from JSON (written at schema `version`) up to date and hold its entries as Entry
+# records. Entries failing their checksum are left out and added to `damaged`, if given
+def prepare_user(record, version=0, damaged=None):
+    migrate_record(record, version)
+    entries = record["entries"]
+    for key in list(entries):
+        data = entries[key]
+        if isinstance(data, dict) and not verify_entry(data):
+            del entries[key]
+            if damaged is not None:
+                damaged.append({"path": ["entries", key], "reason": "checksum mismatch", "raw": data})
+            continue
+        entries[key] = Entry.from_dict(data)
+    return record
+
+
+# JSON hook for saving: a user with archived years keeps only the hot entries in the diary file
+def encode_stored(obj):
+    if isinstance(obj, TieredEntries):
+        return obj.hot
+    return encode_checked(obj)
+
 
 class DiaryStorage:
-    def __init__(self, filename="diary.json"):
+    def __init__(self, filename="diary.json", archive_after_years=None, read_only=False, usernames=None):
         self.filename = filename
+        # A read-only storage never writes: damaged entries are left out without being quarantined,
+        # old years are not moved out, and saving raises. usernames, if given, are the only users loaded
+        self.read_only = read_only
+        self.usernames = None if usernames is None else set(usernames)
+        # Years older than this many years before the current one go to compressed archive
+        # segments (see archive.py); None keeps every entry in the diary file
+        self.archive_after_years = archive_after_years
         self.users = {}  # Holds users and their diary data
+        self.damaged = []  # Parts of the file left out on loading because they were damaged
+        self.quarantine_folder = None  # Where those parts (and a copy of the file) were kept
         self.load_users()
 
+    # Folder of the archived years, e.g. diary.archive/<user>/2015.entries.json.gz
+    @property
+    def archive_folder(self):
+        return os.path.splitext(self.filename)[0] + ".archive"
+
+    # Archive folder of a user, kept in the user record. Usernames differing only in characters that
+    # are not allowed in file names get numbered folders, so no user ever reads another's archive
+    def _archive_name(self, username):
+        record = self.users[username]
+        name = record.get("archive_name")
+        if name is None:
+            safe_name = re.sub(r"[^\w-]", "_", username)
+            taken = {other.get("archive_name") for other in self.users.values()}
+            name, suffix = safe_name, 1
+            while name in taken:
+                suffix += 1
+                name = f"{safe_name}.{suffix}"
+            record["archive_name"] = name
+        return name
+
+    def _tiered(self, username, entries):
+        folder = os.path.join(self.archive_folder, self._archive_name(username))
+        return TieredEntries(entries, ArchiveShelf(folder))
+
     # Saves all users' data to JSON file
+    @timed("storage.save_entries")
     def save_entries(self, users=None):
+        if self.read_only:
+            raise ValueError(f"{self.filename} was opened read-only")
         if users is not None:
             self.users = users
         with open(self.filename, "w") as f:
-            json.dump(self.users, f, indent=4)
+            json.dump({"schema_version": SCHEMA_VERSION, "users": self.users}, f, indent=4, default=encode_stored)
+            METRICS.count("storage.bytes_written", f.tell())
+        # Segments moved back into the hot entries are only removed once those are on disk
+        for record in self.users.values():
+            if isinstance(record.get("entries"), TieredEntries):
+                record["entries"].shelf.commit()
+
+    # Save after a change to one user's entries; this storage has a single file, so it writes all users
+    def save_user(self, username):
+        self.save_entries()
 
     # Load users and their entries from JSON file
+    @timed("storage.load_users")
     def load_users(self):
-        if os.path.exists(self.filename):
-            with open(self.filename, "r") as f:
-                self.users = json.load(f)
-                return self.users
-        else:
-            self.users = {}
-            return self.users
+        self.damaged = []
+        self.users = {}
+        version = 0
+        if os.path.exists(self.filename) and self.usernames is not None:
+            version, self.users = self._read_users(self.usernames)
+        elif os.path.exists(self.filename):
+            with open(self.filename, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+                METRICS.count("storage.bytes_read", f.tell())
+            try:
+                data = json.loads(text)
+            except ValueError:
+                # Save every user and entry that is still readable instead of losing the whole file
+                data, self.damaged = salvage_users(text)
+            version, self.users = split_header(data)
+        for username, record in self.users.items():
+            damaged = []
+            prepare_user(record, version, damaged)
+            self.damaged += [dict(part, path=[username] + part["path"]) for part in damaged]
+        if self.archive_after_years is not None or os.path.isdir(self.archive_folder):
+            for username, record in self.users.items():
+                record["entries"] = self._tiered(username, record["entries"])
+            if self.archive_after_years is not None and not self.read_only and self.archive_old_years():
+                self.save_entries()
+        if self.damaged and not self.read_only:
+            self.quarantine_folder = quarantine(self.filename, self.damaged)
+            METRICS.count("storage.damaged_records", len(self.damaged))
+            self.save_entries()
+        return self.users
+
+    # Decode only the given users' records, reading past the others without holding them in memory
+    def _read_users(self, usernames):
+        users = {}
+        with open(self.filename, "r", encoding="utf-8", errors="replace") as f:
+            stream = UserStream(f)
+            for username in stream.users():
+                if username in usernames:
+                    users[username] = stream.value()
+                else:
+                    stream.skip()
+            METRICS.count("storage.bytes_read", f.tell())
+        return stream.version, users
+
+    def archive_old_years(self, today=None):
+        """Move every user's entries of years older than archive_after_years into archive
+        segments, and return how many moved (the caller saves the diary file)"""
+        cutoff = (today or date.today()).year - self.archive_after_years
+        moved = 0
+        for record in self.users.values():
+            entries = record["entries"]
+            years = {entry_year(entry) for entry in entries.hot.values()}
+            for year in sorted(year for year in years if year is not None and year < cutoff):
+                moved += entries.archive_year(year)
+        METRICS.count("storage.archive.entries_archived", moved)
+        return moved
 
     # Listing entries for a specific user
     def list_entries(self, username):
@@ -32,13 +156,28 @@ class DiaryStorage:
             return self.users[username].get("entries", {})
         return {}
 
+    # Title, date, length and preview of each of a user's entries. All hot bodies are loaded in this
+    # storage, so those entries serve as their own summaries; archived years have theirs indexed
+    def list_summaries(self, username):
+        entries = self.list_entries(username)
+        if isinstance(entries, TieredEntries):
+            return TieredSummaries(entries)
+        return entries
+
+    # Get a single entry for a user, or None if there is none under that key
+    def get_entry(self, username, key):
+        return self.list_entries(username).get(key)
+
     # Add a new user
     def add_user(self, username, password):
         if username not in self.users:
             self.users[username] = {
                 "password": password,
-                "entries": {}
+                "entries": {},
+                "next_id": 1
             }
+            if self.archive_after_years is not None:
+                self.users[username]["entries"] = self._tiered(username, {})
             self.save_entries()
 
     # Validate user login
@@ -0,0 +1,227 @@
+# sync.py
+import argparse
+import hashlib
+import json
+import os
+import secrets
+from entry import Entry
+from metrics import timed
+
+
+def content_digest(entry):
+    """Hash of an entry without its local id, the same on every replica that holds this version"""
+    data = entry.to_dict() if isinstance(entry, Entry) else dict(entry)
+    data.pop("id", None)
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class SyncState:
+    """Change tracking of one user's entries on one replica, kept in the user record under "sync".
+
+    Every entry has a uid that is the same on all replicas (local entry ids
+    are not) and a stamp [counter, digest]: the counter is a Lamport clock,
+    the digest is the hash of that version's content, and a deleted entry
+    keeps a tombstone stamp with an empty digest. Of two versions, the one
+    with the larger stamp wins, which every replica decides the same way.
+    Changes also get a local sequence number, kept in seq order in
+    "changes", and "peers" holds the sequence number already sent to each
+    other replica, so a sync only looks at what changed since then.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        data.setdefault("replica", secrets.token_hex(6))
+        data.setdefault("clock", 0)
+        data.setdefault("seq", 0)
+        data.setdefault("uids", {})  # local key -> uid
+        data.setdefault("stamps", {})  # uid -> [counter, digest]; digest "" for a tombstone
+        data.setdefault("changes", {})  # uid -> seq of its last change, in seq order
+        data.setdefault("peers", {})  # peer replica id -> last seq sent to it
+        self._keys = None  # uid -> local key, built when first needed
+
+    @property
+    def replica(self):
+        return self.data["replica"]
+
+    def key_for(self, uid):
+        if self._keys is None:
+            self._keys = {known: key for key, known in self.data["uids"].items()}
+        return self._keys.get(uid)
+
+    def bind(self, key, uid):
+        self.data["uids"][key] = uid
+        if self._keys is not None:
+            self._keys[uid] = key
+
+    def unbind(self, key):
+        uid = self.data["uids"].pop(key, None)
+        if self._keys is not None:
+            self._keys.pop(uid, None)
+        return uid
+
+    def _changed(self, uid, stamp):
+        self.data["stamps"][uid] = stamp
+        changes = self.data["changes"]
+        changes.pop(uid, None)
+        self.data["seq"] += 1
+        changes[uid] = self.data["seq"]
+
+    def _tick(self):
+        self.data["clock"] += 1
+        return self.data["clock"]
+
+    # A local save of an entry (new or edited)
+    def saved(self, key, entry):
+        uid = self.data["uids"].get(key)
+        if uid is None:
+            uid = secrets.token_hex(8)  # random, so copies of one diary file never hand out the same uid
+            self.bind(key, uid)
+        self._changed(uid, [self._tick(), content_digest(entry)])
+
+    # A local delete: the uid keeps a tombstone so the delete reaches the other replicas
+    def deleted(self, key):
+        uid = self.unbind(key)
+        if uid is not None:
+            self._changed(uid, [self._tick(), ""])
+
+    # Entries stored before syncing was set up get a uid derived from their key and content,
+    # so two copies of the same diary file agree on them at their first sync
+    def adopt(self, entries):
+        uids = self.data["uids"]
+        if len(uids) == len(entries):  # every change since syncing was set up is tracked already
+            return
+        for key, entry in entries.items():
+            if key not in uids:
+                digest = content_digest(entry)
+                uid = "legacy:" + hashlib.sha1(f"{key}:{digest}".encode("utf-8")).hexdigest()[:20]
+                self.bind(key, uid)
+                self._changed(uid, [self._tick(), digest])
+
+    def changes_since(self, seq):
+        """uids changed after local sequence number seq, oldest first"""
+        changes = self.data["changes"]
+        newer = []
+        for uid in reversed(changes):
+            if changes[uid] <= seq:
+                break
+            newer.append(uid)
+        newer.reverse()
+        return newer
+
+    # A version received from another replica; the clock moves past its counter
+    def received(self, uid, stamp):
+        self.data["clock"] = max(self.data["clock"], stamp[0])
+        self._changed(uid, list(stamp))
+
+
+def sync_state(record):
+    """SyncState of a user record, set up on first use"""
+    return SyncState(record.setdefault("sync", {}))
+
+
+class SyncEngine:
+    """Two-way delta sync of the entries of two diaries (e.g. the copies on a laptop and a desktop).
+
+    Each side sends the versions it changed since its last sync with the
+    other (by uid, with their stamps; deletes as tombstones). A received
+    version replaces the local one only if its stamp is larger, so
+    concurrent edits end with the same winner on both sides, and an entry
+    keeps its local id on each side. Changes are put in place with
+    Diary.replace_entries, which keeps the replaced versions as revisions.
+    """
+
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+
+    @timed("sync.sync")
+    def sync(self):
+        """Sync every user of either diary; returns {username: {"sent": n, "received": n}}"""
+        report = {}
+        usernames = sorted(set(self.local.store.users) | set(self.remote.store.users))
+        for username in usernames:
+            for source, target in ((self.local, self.remote), (self.remote, self.local)):
+                if username not in target.store.users:
+                    target.store.add_user(username, source.users_list[username]["password"])
+            report[username] = self.sync_user(username)
+        return report
+
+    def sync_user(self, username):
+        local_state = self._prepare(self.local, username)
+        remote_state = self._prepare(self.remote, username)
+        if local_state.replica == remote_state.replica:  # one side is a copy of the other's file
+            remote_state.data["replica"] = secrets.token_hex(6)
+            remote_state.data["peers"].pop(local_state.replica, None)
+
+        outgoing = self._outgoing(self.local, local_state, remote_state.replica, username)
+        incoming = self._outgoing(self.remote, remote_state, local_state.replica, username)
+        received = self._apply(self.local, local_state, incoming, username)
+        sent = self._apply(self.remote, remote_state, outgoing, username)
+
+        # Everything up to here is known to both sides now
+        local_state.data["peers"][remote_state.replica] = local_state.data["seq"]
+        remote_state.data["peers"][local_state.replica] = remote_state.data["seq"]
+        for diary in (self.local, self.remote):
+            diary._save(username)
+        return {"sent": sent, "received": received}
+
+    def _prepare(self, diary, username):
+        state = sync_state(diary.users_list[username])
+        state.adopt(diary.store.list_entries(username))
+        return state
+
+    # (uid, stamp, entry or None for a delete) of everything changed since the last sync with peer
+    def _outgoing(self, diary, state, peer, username):
+        changes = []
+        for uid in state.changes_since(state.data["peers"].get(peer, 0)):
+            stamp = state.data["stamps"][uid]
+            key = state.key_for(uid) if stamp[1] else None
+            entry = diary.store.get_entry(username, key) if key is not None else None
+            changes.append((uid, stamp, None if entry is None else Entry.from_dict(entry).to_dict()))
+        return changes
+
+    # Put the winning versions in place on one side; returns how many were applied
+    def _apply(self, diary, state, changes, username):
+        updates, removals = {}, []
+        record = diary.users_list[username]
+        next_id = record.get("next_id") or 1
+        for uid, stamp, entry in changes:
+            current = state.data["stamps"].get(uid)
+            if current is not None and list(current) >= list(stamp):
+                continue
+            key = state.key_for(uid)
+            if entry is None:
+                if key is not None:
+                    removals.append(key)
+                    state.unbind(key)
+            else:
+                if key is None:
+                    key = str(next_id)
+                    next_id += 1
+                    state.bind(key, uid)
+                entry = dict(entry, id=int(key))
+                updates[key] = entry
+            state.received(uid, stamp)
+        if updates or removals:
+            diary.replace_entries(username, updates, removals, track_changes=False)
+        return len(updates) + len(removals)
+
+
+def main():
+    from diary import Diary
+    from storage import DiaryStorage
+
+    parser = argparse.ArgumentParser(description="Sync the diaries in two folders")
+    parser.add_argument("first", help="folder holding a diary.json")
+    parser.add_argument("second", help="folder holding the other diary.json")
+    parser.add_argument("--filename", default="diary.json")
+    args = parser.parse_args()
+
+    first = Diary(DiaryStorage(os.path.join(args.first, args.filename)))
+    second = Diary(DiaryStorage(os.path.join(args.second, args.filename)))
+    for username, counts in SyncEngine(first, second).sync().items():
+        print(f"{username}: sent {counts['sent']}, received {counts['received']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# tags.py
+import re
+
+# A hashtag starts after whitespace/punctuation, e.g. "#work" or "#long-run"
+HASHTAG_PATTERN = re.compile(r"(?<![\w#])#(\w[\w-]*)")
+
+QUERY_TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+
+
+# Tags are compared case-insensitively and without a leading '#'
+def normalize_tag(tag):
+    return tag.strip().lstrip("#").lower()
+
+
+# Explicit tags may come as a list or as a comma separated string
+def normalize_tags(tags):
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    normalized = []
+    for tag in tags:
+        tag = normalize_tag(tag)
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+def parse_hashtags(*texts):
+    """Find the #hashtags in the given texts, in order of first appearance"""
+    found = []
+    for text in texts:
+        for match in HASHTAG_PATTERN.finditer(text or ""):
+            tag = match.group(1).lower()
+            if tag not in found:
+                found.append(tag)
+    return found
+
+
+# Every tag an entry is filed under: its explicit tags plus its hashtags
+def entry_tags(entry):
+    return set(entry.get("tags", [])) | set(entry.get("hashtags", []))
+
+
+class TagIndex:
+    """Tag -> set of entry ids for one user, updated as entries are saved and deleted"""
+
+    def __init__(self):
+        self.ids_by_tag = {}
+        self.tags_by_id = {}  # reverse map, so a remove does not depend on the caller's copy of the entry
+        self.all_ids = set()  # every entry id, so NOT queries have something to subtract from
+
+    @classmethod
+    def from_entries(cls, entries):
+        index = cls()
+        for entry in entries.values():
+            index.add(entry["id"], entry_tags(entry))
+        return index
+
+    # Index an entry under its tags, replacing whatever it was filed under before
+    def add(self, entry_id, tags):
+        self.remove(entry_id)
+        self.all_ids.add(entry_id)
+        self.tags_by_id[entry_id] = set(tags)
+        for tag in tags:
+            self.ids_by_tag.setdefault(tag, set()).add(entry_id)
+
+    def remove(self, entry_id):
+        self.all_ids.discard(entry_id)
+        for tag in self.tags_by_id.pop(entry_id, ()):
+            ids = self.ids_by_tag.get(tag)
+            if ids is None:
+                continue
+            ids.discard(entry_id)
+            if not ids:
+                del self.ids_by_tag[tag]
+
+    def ids_for(self, tag):
+        return self.ids_by_tag.get(normalize_tag(tag), set())
+
+    # Tags with the number of entries filed under each, most used first
+    def counts(self):
+        return sorted(((tag, len(ids)) for tag, ids in self.ids_by_tag.items()), key=lambda item: (-item[1], item[0]))
+
+    def query(self, text):
+        """Evaluate a tag query such as "work AND (home OR travel) NOT sick" to a set of ids"""
+        return TagQuery(text).evaluate(self)
+
+
+class TagQuery:
+    """Parser for tag queries.
+
+    Terms are tag names; AND, OR and NOT (any case) combine them, parentheses
+    group, and two terms next to each other are ANDed. NOT binds tightest,
+    then AND, then OR.
+    """
+
+    def __init__(self, text):
+        self.tokens = QUERY_TOKEN_PATTERN.findall(text or "")
+        self.pos = 0
+        if not self.tokens:
+            raise ValueError("Tag query is empty")
+        self.tree = self._parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.pos]}' in tag query")
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() is not None and self._peek().upper() == "OR":
+            self._next()
+            node = ("or", node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() is not None and self._peek() != ")" and self._peek().upper() != "OR":
+            if self._peek().upper() == "AND":
+                self._next()
+            node = ("and", node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        token = self._next()
+        if token is None:
+            raise ValueError("Tag query ends unexpectedly")
+        if token.upper() == "NOT":
+            return ("not", self._parse_not())
+        if token == "(":
+            node = self._parse_or()
+            if self._next() != ")":
+                raise ValueError("Missing ')' in tag query")
+            return node
+        if token == ")" or token.upper() in ("AND", "OR"):
+            raise ValueError(f"Unexpected '{token}' in tag query")
+        return ("tag", normalize_tag(token))
+
+    # Answer the query with set operations over the index
+    def evaluate(self, index, node=None):
+        node = node or self.tree
+        kind = node[0]
+        if kind == "tag":
+            return set(index.ids_for(node[1]))
+        if kind == "not":
+            return index.all_ids - self.evaluate(index, node[1])
+        left = self.evaluate(index, node[1])
+        right = self.evaluate(index, node[2])
+        return left & right if kind == "and" else left | right
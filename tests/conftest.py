@@ -0,0 +1,31 @@
+import pytest
+from diary import Diary
+from storage import DiaryStorage
+from metrics import METRICS
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Empty JSON storage in the test's temporary folder"""
+    return DiaryStorage(filename=str(tmp_path / "diary.json"))
+
+
+@pytest.fixture
+def diary(store, request):
+    """Diary over the temporary storage, with one user: user1. A test module that sets
+    ENTRIES (a list of entry dicts) gets them saved for user1, in order, so ids start at 1"""
+    store.add_user("user1", "pass123")
+    diary = Diary(store)
+    for entry in getattr(request.module, "ENTRIES", ()):
+        diary.create_entry(dict(entry), "user1")
+    return diary
+
+
+@pytest.fixture
+def metrics():
+    """The shared METRICS registry, switched on and empty for the test"""
+    METRICS.reset()
+    METRICS.enabled = True
+    yield METRICS
+    METRICS.enabled = False
+    METRICS.reset()
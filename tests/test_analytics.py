@@ -0,0 +1,37 @@
+from datetime import date
+from analytics import WritingStats
+
+
+ENTRIES = [
+    {"title": "A", "content": "Walked the dog. The dog was happy.", "date": "2025-03-01"},
+    {"title": "B", "content": "Rain all day.", "date": "2025-03-02"},
+    {"title": "C", "content": "Dog park again.", "date": "2025-03-03"},
+    {"title": "D", "content": "Back to work.", "date": "2025-03-10"},
+]
+
+
+def test_totals_and_word_frequencies(diary):
+    stats = diary.stats("user1")
+    assert stats.total_entries == 4
+    assert stats.total_words == 7 + 3 + 3 + 3
+    assert stats.top_words(2) == [("dog", 3), ("again", 1)]
+    assert stats.words_by_month == {"2025-03": 16}
+    assert stats.words_by_week == {"2025-W09": 10, "2025-W10": 3, "2025-W11": 3}
+    assert sum(stats.entries_by_hour) == 4
+
+
+def test_streaks(diary):
+    streaks = diary.stats("user1").streaks(today=date(2025, 3, 11))
+    assert streaks == {"current": 1, "longest": 3, "longest_start": "2025-03-01", "longest_end": "2025-03-03"}
+    assert diary.stats("user1").streaks(today=date(2025, 3, 20))["current"] == 0
+
+
+def test_updates_on_save_and_delete_match_a_rebuild(diary):
+    stats = diary.stats("user1")
+    diary.create_entry({"id": 1, "title": "A", "content": "Short walk.", "date": "2025-03-04"}, "user1")
+    diary.delete_entry(2, "user1")
+
+    rebuilt = WritingStats.from_entries(diary.store.list_entries("user1"))
+    assert stats.summary() == rebuilt.summary()
+    assert "2025-03-01" not in stats.entries_by_day
+    assert stats.streaks(today=date(2025, 3, 4))["longest"] == 2
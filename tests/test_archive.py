@@ -0,0 +1,123 @@
+import os
+import pytest
+from datetime import date
+from diary import Diary
+from storage import DiaryStorage
+from archive import TieredEntries
+
+
+ENTRIES = [entry for year in (2015, 2016, date.today().year) for entry in (
+    {"title": f"Trip {year}", "content": f"Hiking with Ann in {year}", "date": f"{year}-06-01", "tags": ["travel"]},
+    {"title": f"Work {year}", "content": "Deadline", "date": f"{year}-09-01"})]
+
+
+@pytest.fixture
+def filename(diary):
+    return diary.store.filename
+
+
+def open_diary(filename):
+    return Diary(DiaryStorage(filename=filename, archive_after_years=2))
+
+
+def test_old_years_move_out_of_the_diary_file(filename, metrics):
+    diary = open_diary(filename)
+    assert len(diary.store.users["user1"]["entries"].hot) == 2
+    assert sorted(os.listdir(diary.store.archive_folder + "/user1")) == [
+        "2015.entries.json.gz", "2015.idx.json.gz", "2015.terms.json.gz", "2015.words.json.gz",
+        "2016.entries.json.gz", "2016.idx.json.gz", "2016.terms.json.gz", "2016.words.json.gz"]
+    assert len(diary.store.list_entries("user1")) == 6
+    # Listing, counting and tag lookups come from the segment indexes, without reading a segment
+    summaries = diary.store.list_summaries("user1")
+    assert sorted(s["title"] for s in summaries.values())[0] == "Trip 2015"
+    assert diary.entry_counts("2015-01-01", "2016-12-31", "user1") == {
+        "2015-06-01": 1, "2015-09-01": 1, "2016-06-01": 1, "2016-09-01": 1}
+    assert len(diary.filter_ids("user1", tag_query="travel")) == 3
+    assert metrics.counters.get("storage.archive.segment_loads", 0) == 0
+
+    # So are date searches; a segment is read when one of its entries is opened
+    results = diary.search_by_date("2015", "user1", type="year")
+    assert [e["title"] for e in results] == ["Trip 2015", "Work 2015"]
+    assert metrics.counters.get("storage.archive.segment_loads", 0) == 0
+    assert diary.get_entry(results[0]["id"], "user1")["content"] == "Hiking with Ann in 2015"
+    assert metrics.counters["storage.archive.segment_loads"] == 1
+
+
+def test_keyword_search_only_reads_years_that_can_match(filename, metrics):
+    diary = open_diary(filename)
+    results = diary.search_by_keyword("ann in 2016", "user1")
+    assert [e["title"] for e in results] == ["Trip 2016"]
+    assert metrics.counters["storage.archive.segment_loads"] == 1
+    assert sorted(e["title"] for e in diary.search_by_keyword("deadline", "user1"))[:2] == ["Work 2015", "Work 2016"]
+
+
+def test_editing_an_archived_entry_brings_its_year_back(filename):
+    diary = open_diary(filename)
+    first = diary.get_entry(diary.search_by_date("2015", "user1", type="year")[0]["id"], "user1")
+    diary.create_entry(dict(first.to_dict(), title="Trip 2015, edited"), "user1")
+    entries = diary.store.list_entries("user1")
+    assert isinstance(entries, TieredEntries) and "1" in entries.hot and "2" in entries.hot
+    assert not os.path.exists(os.path.join(diary.store.archive_folder, "user1", "2015.entries.json.gz"))
+
+    # Archived again on the next load, with the edit
+    reopened = open_diary(filename)
+    assert "1" not in reopened.store.list_entries("user1").hot
+    assert reopened.get_entry(1, "user1")["title"] == "Trip 2015, edited"
+    assert len(reopened.store.list_entries("user1")) == 6
+
+
+def test_archived_diary_opens_without_the_policy(filename):
+    open_diary(filename)
+    diary = Diary(DiaryStorage(filename=filename))
+    assert len(diary.store.list_entries("user1")) == 6
+    assert diary.delete_entry(3, "user1")
+    assert sorted(e["title"] for e in diary.search_by_keyword("hiking", "user1")) == [
+        f"Trip {year}" for year in (2015, date.today().year)]
+
+
+def test_a_session_only_opens_the_segments_a_query_reaches(store, metrics):
+    this_year = date.today().year
+    store.add_user("user1", "pw")
+    diary = Diary(store)
+    for year in range(this_year - 15, this_year + 1):
+        for i in range(20):
+            diary.create_entry({"title": f"Walk {i}", "content": f"Walked by the river in {year}, part {i}",
+                                "date": f"{year}-{i % 12 + 1:02d}-{i + 1:02d}"}, "user1")
+    reopen = lambda: Diary(DiaryStorage(filename=store.filename, archive_after_years=3))
+    reopen().close()  # the first open moves the old years out
+
+    # A full session: start, open a day, autocomplete, save, edit, delete, rank, statistics, related
+    metrics.reset()
+    diary = reopen()
+    day = f"{this_year}-01-01"
+    diary.entry_counts(f"{this_year}-01-01", f"{this_year}-01-31", "user1")
+    entry = diary.get_entry(diary.summaries_on(day, "user1")[0]["id"], "user1")
+    diary.related_entries(entry["id"], "user1")
+    diary.complete_titles("walk", "user1")
+    new_id = diary.create_entry({"title": "Swim", "content": "Lake swim", "date": day}, "user1")
+    diary.create_entry(dict(entry.to_dict(), content="Walked in the rain"), "user1")
+    diary.delete_entry(new_id, "user1")
+    assert len(diary.rank("river", "user1")) == 16 * 20 - 1
+    assert diary.stats("user1").total_entries == 16 * 20
+    diary.close()
+    assert metrics.counters.get("storage.archive.segment_loads", 0) == 0
+
+    # A query that reaches archived entries opens just their year
+    results = diary.search_by_keyword(f"river in {this_year - 10}", "user1")
+    assert len(results) == 20
+    assert metrics.counters["storage.archive.segment_loads"] == 1
+
+
+def test_users_with_similar_names_get_their_own_archives(store):
+    old_year = date.today().year - 5
+    store.add_user("ann.lee", "pw")
+    store.add_user("ann_lee", "pw")
+    diary = Diary(store)
+    diary.create_entry({"title": "Secret", "content": "secret of ann.lee", "date": f"{old_year}-01-01"}, "ann.lee")
+    diary.create_entry({"title": "Diary", "content": "ann_lee writing", "date": f"{old_year}-02-01"}, "ann_lee")
+
+    for _ in range(2):  # when the years move out, and again when they are read back
+        storage = DiaryStorage(filename=store.filename, archive_after_years=2)
+        assert [s["title"] for s in storage.list_summaries("ann_lee").values()] == ["Diary"]
+        assert [s["title"] for s in storage.list_summaries("ann.lee").values()] == ["Secret"]
+    assert sorted(os.listdir(storage.archive_folder)) == ["ann_lee", "ann_lee.2"]
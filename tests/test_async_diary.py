@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+import pytest
+from analytics import WritingStats
+from async_diary import AsyncDiary
+from diary import Diary
+from indexes import DateIndex
+from ranking import SearchIndex
+
+
+@pytest.fixture
+def diary(diary):
+    diary.store.add_user("user2", "pass123")
+    return diary
+
+
+def test_writes_and_reads(diary):
+    async def run():
+        async with AsyncDiary(diary) as adiary:
+            ids = await asyncio.gather(*(
+                adiary.create_entry({"title": f"Entry {i}", "content": "Walk", "date": "2025-02-01"}, "user1")
+                for i in range(20)
+            ))
+            assert sorted(ids) == list(range(1, 21))
+            assert len(await adiary.entries_on("2025-02-01", "user1")) == 20
+            assert await adiary.delete_entry(5, "user1")
+            assert await adiary.get_entry(5, "user1") is None
+            assert len(await adiary.search_ranked("walk", "user1")) == 19
+            assert (await adiary.stats("user1"))["total_entries"] == 19
+            assert await adiary.validate_user("user1", "pass123")
+    asyncio.run(run())
+
+
+def test_identical_reads_share_one_call(diary, monkeypatch):
+    calls = []
+    search_ranked = diary.search_ranked
+
+    def slow_search(*args):
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return search_ranked(*args)
+    monkeypatch.setattr(diary, "search_ranked", slow_search)
+
+    async def run():
+        async with AsyncDiary(diary) as adiary:
+            await adiary.create_entry({"title": "Coffee", "content": "", "date": "2025-02-01"}, "user1")
+            results = await asyncio.gather(*(adiary.search_ranked("coffee", "user1") for _ in range(10)))
+            assert len(calls) == 1
+            assert all(r == results[0] for r in results)
+            await adiary.search_ranked("coffee", "user2")
+            assert len(calls) == 2
+    asyncio.run(run())
+
+
+def test_read_after_write_is_not_shared_with_older_read(diary, monkeypatch):
+    list_entries = diary.store.list_entries
+
+    def slow_list(username):
+        time.sleep(0.05)
+        return list_entries(username)
+    monkeypatch.setattr(diary.store, "list_entries", slow_list)
+
+    async def run():
+        async with AsyncDiary(diary) as adiary:
+            before = asyncio.ensure_future(adiary.list_entries("user1"))
+            await asyncio.sleep(0.01)
+            await adiary.create_entry({"title": "New", "content": "", "date": "2025-02-01"}, "user1")
+            after = await adiary.list_entries("user1")
+            assert [e["title"] for e in after] == ["New"]
+            await before
+    asyncio.run(run())
+
+
+def test_event_loop_is_not_blocked(diary, monkeypatch):
+    monkeypatch.setattr(diary, "search_ranked", lambda *args: time.sleep(0.2) or [])
+
+    async def run():
+        async with AsyncDiary(diary) as adiary:
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.ensure_future(ticker())
+            await adiary.search_ranked("x", "user1")
+            task.cancel()
+            assert ticks >= 5
+    asyncio.run(run())
+
+
+def test_indexes_are_built_under_the_write_lock(diary, monkeypatch):
+    for i in range(5):
+        diary.create_entry({"title": f"Walk {i}", "content": "Walk", "date": "2025-02-01"}, "user1")
+    fresh = Diary(diary.store)
+    adiary = AsyncDiary(fresh)
+    writing = []
+    for cls in (SearchIndex, DateIndex, WritingStats):
+        from_entries = cls.from_entries
+        monkeypatch.setattr(cls, "from_entries", lambda entries, build=from_entries: writing.append(adiary.lock._writer)
+                            or build(entries))
+
+    async def run():
+        async with adiary:
+            await asyncio.gather(adiary.search_ranked("walk", "user1"), adiary.stats("user1"),
+                                 adiary.entries_on("2025-02-01", "user1"), adiary.validate_user("nobody", "pw"))
+    asyncio.run(run())
+    assert writing == [True, True, True]
+    assert fresh.indexes_built("user1") and not fresh.indexes_built("nobody")
@@ -0,0 +1,47 @@
+import random
+import string
+import time
+from autocomplete import TitleIndex
+
+
+ENTRIES = [
+    {"title": "Coffee tasting", "content": "", "date": "2025-01-02"},
+    {"title": "Tasting notes", "content": "", "date": "2025-01-03"},
+    {"title": "Cold morning", "content": "", "date": "2025-01-04"},
+]
+
+
+def titles(entries):
+    return [e["title"] for e in entries]
+
+
+def test_completes_title_and_word_prefixes(diary):
+    assert titles(diary.complete_titles("co", "user1")) == ["Coffee tasting", "Cold morning"]
+    assert titles(diary.complete_titles("TAST", "user1")) == ["Tasting notes", "Coffee tasting"]
+    assert titles(diary.complete_titles("coffee ta", "user1")) == ["Coffee tasting"]
+    assert diary.complete_titles("", "user1") == []
+    assert titles(diary.complete_titles("co", "user1", limit=1)) == ["Coffee tasting"]
+
+
+def test_follows_edits_and_deletes(diary):
+    diary.create_entry({"id": 3, "title": "Warm evening", "content": "", "date": "2025-01-04"}, "user1")
+    diary.delete_entry(1, "user1")
+    assert titles(diary.complete_titles("co", "user1")) == []
+    assert titles(diary.complete_titles("eve", "user1")) == ["Warm evening"]
+
+
+def test_lookup_is_fast_on_50k_titles():
+    rng = random.Random(3)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    entries = {
+        str(i): {"id": i, "title": " ".join(rng.choice(words) for _ in range(3))}
+        for i in range(50000)
+    }
+    index = TitleIndex.from_entries(entries)
+    prefixes = [rng.choice(words)[:rng.randint(1, 3)] for _ in range(1000)]
+
+    start = time.perf_counter()
+    for prefix in prefixes:
+        index.complete(prefix)
+    per_lookup = (time.perf_counter() - start) / len(prefixes)
+    assert per_lookup < 0.001
@@ -0,0 +1,56 @@
+import os
+from storage import DiaryStorage
+from backup import BackupStore
+
+
+ENTRIES = [{"title": f"Day {day}", "content": "Walk " * 20, "date": day}
+           for day in ("2025-01-01", "2025-01-02", "2025-01-03")]
+
+
+def test_unchanged_entries_are_shared_between_snapshots(diary, tmp_path):
+    backups = BackupStore(str(tmp_path / "backups"))
+    first = backups.snapshot(diary.store)
+    assert (first["entries"], first["new_objects"]) == (3, 4)  # 3 entries + the revision history
+
+    diary.create_entry({"id": 2, "title": "Edited", "content": "Run", "date": "2025-01-02"}, "user1")
+    second = backups.snapshot(diary.store, label="daily")
+    assert second["new_objects"] == 2  # the edited entry and the new revision history
+    third = backups.snapshot(diary.store)
+    assert third["new_objects"] == 0 and third["new_bytes"] == 0
+    assert [s["id"] for s in backups.list_snapshots()] == [first["id"], second["id"], third["id"]]
+    assert BackupStore(backups.folder).list_snapshots()[1]["label"] == "daily"
+
+
+def test_restore_one_date_or_a_whole_user(diary, tmp_path):
+    backups = BackupStore(str(tmp_path / "backups"))
+    snapshot_id = backups.snapshot(diary.store)["id"]
+    diary.create_entry({"id": 1, "title": "Changed", "content": "", "date": "2025-01-01"}, "user1")
+    diary.create_entry({"title": "Later", "content": "", "date": "2025-01-01"}, "user1")
+    diary.delete_entry(3, "user1")
+
+    assert backups.restore(snapshot_id, diary, "user1", date="2025-01-01") == 1
+    assert [e["title"] for e in diary.entries_on("2025-01-01", "user1")] == ["Day 2025-01-01"]
+    assert diary.get_entry(3, "user1") is None
+
+    assert backups.restore(snapshot_id, diary, "user1") == 3
+    assert diary.get_entry(3, "user1")["title"] == "Day 2025-01-03"
+    assert diary.search_ranked("walk", "user1")  # indexes were rebuilt
+    assert len(diary.list_revisions(1, "user1")) >= 2  # the restore can itself be undone
+    new_id = diary.create_entry({"title": "New", "content": "", "date": "2025-02-01"}, "user1")
+    assert new_id == 5
+
+    reloaded = DiaryStorage(filename=diary.store.filename)
+    assert len(reloaded.list_entries("user1")) == 4
+
+
+def test_prune_deletes_only_unreferenced_objects(diary, tmp_path):
+    backups = BackupStore(str(tmp_path / "backups"))
+    old = backups.snapshot(diary.store)["id"]
+    diary.create_entry({"id": 1, "title": "Changed", "content": "", "date": "2025-01-01"}, "user1")
+    new = backups.snapshot(diary.store)["id"]
+
+    snapshots, objects, freed = backups.prune(keep_last=1)
+    assert (snapshots, objects) == (1, 2) and freed > 0
+    assert [s["id"] for s in backups.list_snapshots()] == [new]
+    assert not os.path.exists(os.path.join(backups.folder, "snapshots", f"{old}.json"))
+    assert len(backups.read_entries(new, "user1")) == 3
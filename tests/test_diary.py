@@ -26,14 +26,30 @@ def diary():
 
 def test_create_entry(diary):
     entry = {"title": "Test", "content": "Content", "date": "01-01-2025"}
-    diary.create_entry(entry, "user1")
-    assert "01-01-2025" in diary.store.list_entries("user1")
+    entry_id = diary.create_entry(entry, "user1")
+    assert str(entry_id) in diary.store.list_entries("user1")
+    assert diary.entries_on("01-01-2025", "user1")[0]["title"] == "Test"
 
 
 def test_delete_entry(diary):
     entry = {"title": "DeleteMe", "content": "Bye", "date": "02-01-2025"}
-    diary.create_entry(entry, "user1")
-    assert diary.delete_entry("02-01-2025", "user1") is True
+    entry_id = diary.create_entry(entry, "user1")
+    assert diary.delete_entry(entry_id, "user1") is True
+    assert diary.entries_on("02-01-2025", "user1") == []
+
+
+def test_several_entries_per_day(diary):
+    first = diary.create_entry({"title": "Morning", "content": "Coffee", "date": "2025-01-05"}, "user1")
+    second = diary.create_entry({"title": "Evening", "content": "Tea", "date": "2025-01-05"}, "user1")
+    assert first != second
+    assert [e["title"] for e in diary.entries_on("2025-01-05", "user1")] == ["Morning", "Evening"]
+
+    # Editing keeps the id, and ids are not reused after a delete
+    diary.create_entry({"id": first, "title": "Morning", "content": "Espresso", "date": "2025-01-05"}, "user1")
+    assert diary.get_entry(first, "user1")["content"] == "Espresso"
+    diary.delete_entry(second, "user1")
+    third = diary.create_entry({"title": "Night", "content": "Sleep", "date": "2025-01-05"}, "user1")
+    assert third > second
 
 
 def test_search_by_keyword(diary):
@@ -47,4 +63,12 @@ def test_search_by_date(diary):
     entry = {"title": "Meeting", "content": "At 10 AM", "date": "04-01-2025"}
     diary.create_entry(entry, "user1")
     results = diary.search_by_date("04-01-2025", "user1")
-    assert len(results) == 1
\ No newline at end of file
+    assert len(results) == 1
+
+
+def test_search_by_year_and_month(diary):
+    diary.create_entry({"title": "A", "content": "a", "date": "2024-05-01"}, "user1")
+    diary.create_entry({"title": "B", "content": "b", "date": "2025-05-02"}, "user1")
+    diary.create_entry({"title": "C", "content": "c", "date": "2025-06-03"}, "user1")
+    assert [e["title"] for e in diary.search_by_date("2025", "user1", "year")] == ["B", "C"]
+    assert [e["title"] for e in diary.search_by_date("05", "user1", "month")] == ["A", "B"]
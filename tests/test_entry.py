@@ -0,0 +1,47 @@
+import json
+import pytest
+from diary import Diary
+from storage import DiaryStorage
+from mmap_storage import MmapDiaryStorage
+from entry import Entry, encode_entry
+
+
+def test_round_trip_keeps_the_json_shape():
+    data = {"id": 3, "title": "Walk", "content": "Park", "date": "2025-02-01", "time": "08:05:09",
+            "tags": ["health"], "hashtags": [], "mood": "good"}
+    entry = Entry.from_dict(data)
+    assert entry.date_ord == 739283 and entry.time_secs == 8 * 3600 + 5 * 60 + 9
+    assert entry.to_dict() == data
+    assert entry == data and dict(entry) == data
+    assert json.loads(json.dumps({"1": entry}, default=encode_entry)) == {"1": data}
+
+
+def test_reads_like_a_dict():
+    entry = Entry.from_dict({"id": 1, "title": "Old", "content": "", "date": "01-01-2025"})
+    assert entry["date"] == "01-01-2025" and entry.date_ord is None
+    assert entry.get("time") is None and entry.get("tags", []) == []
+    entry["date"] = "2025-01-01"
+    assert entry.date_ord is not None and entry["date"] == "2025-01-01"
+
+
+def test_storage_loads_entries_as_records(tmp_path):
+    for storage_class in (DiaryStorage, MmapDiaryStorage):
+        path = str(tmp_path / f"{storage_class.__name__}.json")
+        store = storage_class(filename=path)
+        store.add_user("user1", "pw")
+        Diary(store).create_entry({"title": "A", "content": "B", "date": "2025-03-04"}, "user1")
+        reloaded = storage_class(filename=path)
+        entry = reloaded.get_entry("user1", "1")
+        assert isinstance(entry, Entry)
+        assert (entry.title, entry.date) == ("A", "2025-03-04")
+
+
+def test_membership_follows_the_json_shape():
+    entry = Entry.from_dict({"id": 1, "title": "", "content": "", "date": "2025-01-01", "mood": "ok"})
+    assert "title" in entry and "tags" in entry and "mood" in entry
+    assert "time" not in entry and "weather" not in entry
+    assert Entry(None).get("id") is None and "id" not in Entry(None) and "date" not in Entry(None)
+    summary = entry.summary()
+    assert "preview" in summary and "mood" not in summary and "time" not in summary
+    with pytest.raises(TypeError):
+        {entry}
@@ -0,0 +1,69 @@
+import pytest
+from diary import Diary
+from events import EventBus, EventLog, tail, CREATED, UPDATED, DELETED
+
+
+@pytest.fixture
+def diary(store, tmp_path):
+    store.add_user("user1", "pw")
+    store.add_user("user2", "pw")
+    return Diary(store, events=EventBus(EventLog(str(tmp_path / "diary.events.jsonl"))))
+
+
+def test_saves_and_deletes_publish_typed_events(diary):
+    events = []
+    diary.events.subscribe(events.append, username="user1")
+    entry_id = diary.create_entry({"title": "Walk", "content": "In the park", "date": "2025-03-01"}, "user1")
+    diary.create_entry({"title": "Other user", "content": "", "date": "2025-03-01"}, "user2")
+    diary.create_entry({"id": entry_id, "title": "Long walk", "content": "In the park", "date": "2025-03-02"}, "user1")
+    diary.delete_entry(entry_id, "user1")
+
+    assert [(e.kind, e.entry_id, e.date) for e in events] == [
+        (CREATED, entry_id, "2025-03-01"), (UPDATED, entry_id, "2025-03-02"), (DELETED, entry_id, "2025-03-02")]
+    assert [e.seq for e in events] == [1, 3, 4]
+    # The update moved the entry, so both days' counts changed
+    assert events[1].dates() == ["2025-03-01", "2025-03-02"]
+    assert events[1].summary.title == "Long walk" and events[1].summary.words == 3
+
+
+def test_failing_subscriber_does_not_stop_the_others(diary):
+    seen = []
+
+    def broken(event):
+        raise RuntimeError("view was closed")
+
+    diary.events.subscribe(broken)
+    unsubscribe = diary.events.subscribe(seen.append, kinds=[DELETED])
+    entry_id = diary.create_entry({"title": "Walk", "content": "", "date": "2025-03-01"}, "user1")
+    assert diary.delete_entry(entry_id, "user1")
+    assert [e.kind for e in seen] == [DELETED]
+
+    unsubscribe()
+    diary.create_entry({"title": "Again", "content": "", "date": "2025-03-01"}, "user1")
+    diary.delete_entry(entry_id + 1, "user1")
+    assert len(seen) == 1
+
+
+def test_replaced_entries_publish_one_event_each(diary):
+    first = diary.create_entry({"title": "One", "content": "", "date": "2025-03-01"}, "user1")
+    second = diary.create_entry({"title": "Two", "content": "", "date": "2025-03-02"}, "user1")
+    events = []
+    diary.events.subscribe(events.append)
+    updated = dict(diary.get_entry(first, "user1").to_dict(), title="One, restored")
+    new = {"id": 7, "title": "Seven", "content": "", "date": "2025-03-07"}
+    diary.replace_entries("user1", {str(first): updated, "7": new}, removals=[str(second)])
+    assert sorted((e.kind, e.entry_id) for e in events) == [(CREATED, 7), (DELETED, second), (UPDATED, first)]
+
+
+def test_log_can_be_tailed_from_an_offset(diary, tmp_path):
+    log = str(tmp_path / "diary.events.jsonl")
+    diary.create_entry({"title": "Walk", "content": "", "date": "2025-03-01"}, "user1")
+    (event, offset), = list(tail(log))
+    assert (event.kind, event.username, event.summary.title) == (CREATED, "user1", "Walk")
+
+    # A line still being written is left for the next read
+    diary.create_entry({"title": "Swim", "content": "", "date": "2025-03-02"}, "user1")
+    with open(log, "a") as f:
+        f.write('{"kind": "created", "user')
+    assert [e.summary.title for e, _ in tail(log, offset)] == ["Swim"]
+    assert list(tail(str(tmp_path / "missing.jsonl"))) == []
@@ -0,0 +1,39 @@
+import random
+from fuzzy import FuzzyIndex, levenshtein
+
+
+ENTRIES = [
+    {"title": "Coffee tasting", "content": "Tried three kinds of coffee.", "date": "2025-01-02"},
+    {"title": "Birthday", "content": "Dinner with the family.", "date": "2025-01-03"},
+]
+
+
+def test_levenshtein():
+    assert levenshtein("coffee", "cofee") == 1
+    assert levenshtein("kitten", "sitting") == 3
+    assert levenshtein("kitten", "sitting", max_distance=1) == 2
+
+
+def test_lookup_matches_brute_force():
+    rng = random.Random(7)
+    words = {"".join(rng.choice("abcd") for _ in range(rng.randint(1, 9))) for _ in range(500)}
+    index = FuzzyIndex.from_terms(words)
+    for _ in range(100):
+        query = "".join(rng.choice("abcd") for _ in range(rng.randint(1, 9)))
+        for k in (1, 2):
+            assert {t for t, _ in index.lookup(query, k)} == {w for w in words if levenshtein(query, w) <= k}
+
+
+def test_misspelt_query_finds_entries(diary):
+    assert diary.search_ranked("cofee", "user1") == []
+    results = diary.search_fuzzy("cofee tastin", "user1")
+    assert [r["title"] for r in results] == ["Coffee tasting"]
+    assert "coffee" in [results[0]["snippet"][s:e].lower() for s, e in results[0]["highlights"]]
+    assert [r["title"] for r in diary.search_fuzzy("dinnr famly", "user1")] == ["Birthday"]
+
+
+def test_fuzzy_index_follows_edits(diary):
+    assert diary.search_fuzzy("dinnr", "user1")
+    diary.create_entry({"id": 2, "title": "Birthday", "content": "Lunch with the family.", "date": "2025-01-03"}, "user1")
+    assert diary.search_fuzzy("dinnr", "user1") == []
+    assert [r["title"] for r in diary.search_fuzzy("lunh", "user1")] == ["Birthday"]
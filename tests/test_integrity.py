@@ -0,0 +1,121 @@
+import json
+import os
+import pytest
+from diary import Diary
+from storage import DiaryStorage
+from integrity import scrub
+from mmap_storage import MmapDiaryStorage
+
+
+@pytest.fixture
+def filename(store):
+    diary = Diary(store)
+    for username in ("alice", "bob"):
+        store.add_user(username, "pw")
+        for day in range(1, 21):
+            diary.create_entry({"title": f"Day {day}", "content": f"Notes of {username} on day {day}",
+                                "date": f"2025-03-{day:02d}"}, username)
+    return store.filename
+
+
+def damage(filename, old, new):
+    with open(filename) as f:
+        text = f.read()
+    assert text.count(old) == 1
+    with open(filename, "w") as f:
+        f.write(text.replace(old, new))
+
+
+def test_entries_are_saved_with_checksums(filename):
+    with open(filename) as f:
+        data = json.load(f)
+    assert all("checksum" in entry for entry in data["users"]["alice"]["entries"].values())
+    store = DiaryStorage(filename=filename)
+    assert store.damaged == [] and store.quarantine_folder is None
+    assert "checksum" not in store.list_entries("alice")["1"].to_dict()
+
+
+def test_changed_entry_is_quarantined(filename):
+    damage(filename, "Notes of bob on day 7", "Notes of bob on day 8")
+    store = DiaryStorage(filename=filename)
+    assert [part["path"] for part in store.damaged] == [["bob", "entries", "7"]]
+    assert len(store.list_entries("bob")) == 19 and len(store.list_entries("alice")) == 20
+    with open(os.path.join(store.quarantine_folder, "damaged.json")) as f:
+        assert json.load(f)[0]["raw"]["content"] == "Notes of bob on day 8"
+    assert os.path.exists(os.path.join(store.quarantine_folder, "diary.json"))
+    # The damaged entry was taken out of the file, and its id is not handed out again
+    assert DiaryStorage(filename=filename).damaged == []
+    assert Diary(DiaryStorage(filename=filename)).create_entry(
+        {"title": "New", "content": "", "date": "2025-03-21"}, "bob") == 21
+
+
+def test_unparsable_file_keeps_everything_readable(filename):
+    damage(filename, '"Notes of alice on day 3"', '"Notes of alice on day 3')
+    store = DiaryStorage(filename=filename)
+    assert [part["path"] for part in store.damaged] == [["users", "alice", "entries", "3"]]
+    assert sorted(store.list_entries("alice"), key=int) == [str(i) for i in range(1, 21) if i != 3]
+    assert len(store.list_entries("bob")) == 20
+    assert store.validate_user("alice", "pw") and store.users["alice"]["next_id"] == 21
+
+
+def test_user_without_a_readable_password_is_set_aside(filename):
+    with open(filename) as f:
+        text = f.read()
+    with open(filename, "w") as f:
+        f.write(text.replace('"password": "pw"', '"password": pw"', 1))
+    store = DiaryStorage(filename=filename)
+    assert "alice" not in store.users and store.validate_user("bob", "pw")
+    assert ["users", "alice"] in [part["path"] for part in store.damaged]
+
+
+def test_scrub_checks_every_entry_in_parallel(filename):
+    damage(filename, "Notes of alice on day 12", "Notes of alice on day 13")
+    report = scrub(filename, workers=2)
+    assert report["entries"] == 40 and report["checked"] == 39
+    assert report["damaged"] == [{"user": "alice", "entry": "12"}]
+    assert report["entries_per_s"] > 0
+
+
+def test_scrub_counts_entries_saved_before_checksums(tmp_path):
+    path = tmp_path / "diary.json"
+    path.write_text(json.dumps({"schema_version": 1, "users": {"old": {"password": "pw", "next_id": 2, "entries": {
+        "1": {"id": 1, "title": "Old", "content": "", "date": "2024-01-01"}}}}}, indent=4))
+    report = scrub(str(path), workers=1)
+    assert (report["entries"], report["unchecked"], report["damaged"]) == (1, 1, [])
+
+
+@pytest.fixture
+def mmap_filename(tmp_path):
+    store = MmapDiaryStorage(filename=str(tmp_path / "diary_index.json"))
+    store.add_user("alice", "pw")
+    diary = Diary(store)
+    for day in range(1, 11):
+        diary.create_entry({"title": f"Day {day}", "content": f"Notes of alice on day {day}",
+                            "date": f"2025-03-{day:02d}"}, "alice")
+    store.close()
+    damage(store.data_filename, "Notes of alice on day 4", "Notes of alice on day 5")
+    return store.filename
+
+
+def test_damaged_mmap_record_is_quarantined_when_read(mmap_filename):
+    store = MmapDiaryStorage(filename=mmap_filename)
+    diary = Diary(store)
+    assert diary.get_entry(4, "alice") is None
+    assert [part["path"] for part in store.damaged] == [["alice", "entries", "4"]]
+    with open(os.path.join(store.quarantine_folder, "damaged.json")) as f:
+        assert "Notes of alice on day 5" in json.load(f)[0]["raw"]
+    assert len(diary.search("alice", keyword="notes")) == 9
+    store.close()
+    # Dropped from the index, so the next session does not list it
+    reopened = MmapDiaryStorage(filename=mmap_filename)
+    assert "4" not in reopened.list_entries("alice") and len(reopened.list_entries("alice")) == 9
+    reopened.close()
+
+
+def test_scrub_reads_the_mmap_storage_and_refuses_other_files(mmap_filename, tmp_path):
+    report = scrub(mmap_filename, workers=2)
+    assert (report["entries"], report["checked"]) == (10, 9)
+    assert report["damaged"] == [{"user": "alice", "entry": "4"}]
+    data_file = MmapDiaryStorage(filename=mmap_filename).data_filename
+    with pytest.raises(ValueError):
+        scrub(data_file, workers=1)
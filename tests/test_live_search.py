@@ -0,0 +1,69 @@
+import pytest
+from live_search import LiveSearch, CancelToken, SearchCancelled, QueryCache
+
+
+ENTRIES = [
+    {"title": "Coffee tasting", "content": "Tried three kinds of coffee.", "date": "2025-01-02"},
+    {"title": "Cooking", "content": "Made soup. #home", "date": "2025-01-03"},
+    {"title": "Cold morning", "content": "Coffee by the window. #home", "date": "2025-01-04"},
+]
+
+
+def ids(ranking):
+    return sorted(entry_id for _, entry_id in ranking)
+
+
+def test_extended_query_is_refined_from_previous_results(diary, monkeypatch):
+    search = LiveSearch(diary, "user1")
+    assert ids(search.search("co")) == [1, 2, 3]
+
+    seen = []
+    rank = diary.rank
+    monkeypatch.setattr(diary, "rank", lambda q, u, candidates=None, *args: seen.append(candidates) or rank(q, u, candidates, *args))
+    assert ids(search.search("coff")) == [1, 3]
+    assert ids(search.search("coffee win")) == [3]
+    assert seen == [{1, 2, 3}, {1, 3}]
+
+
+def test_repeated_query_comes_from_cache_until_entries_change(diary):
+    search = LiveSearch(diary, "user1")
+    first = search.search("coffee", "home")
+    assert ids(first) == [3]
+    assert search.search("coffee", "home") is first
+
+    diary.create_entry({"title": "More coffee", "content": "#home", "date": "2025-01-05"}, "user1")
+    assert ids(search.search("coffee", "home")) == [3, 4]
+
+
+def test_shorter_query_is_not_refined(diary):
+    search = LiveSearch(diary, "user1")
+    assert ids(search.search("coffee")) == [1, 3]
+    assert ids(search.search("co")) == [1, 2, 3]
+
+
+def test_cancelled_search_stops():
+    token = CancelToken()
+    token.check()
+    token.cancel()
+    assert token.cancelled
+    with pytest.raises(SearchCancelled):
+        token.check()
+
+
+def test_cancelled_token_stops_scoring(diary):
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(SearchCancelled):
+        LiveSearch(diary, "user1").search("co", cancel=token)
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryCache(max_entries=2)
+    cache.put("user1", "a", [1])
+    cache.put("user1", "b", [2])
+    assert cache.get("user1", "a") == [1]
+    cache.put("user1", "c", [3])
+    assert cache.get("user1", "b") is None
+    assert cache.get("user1", "a") == [1]
+    cache.invalidate("user1")
+    assert cache.get("user1", "c") is None
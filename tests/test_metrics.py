@@ -0,0 +1,40 @@
+import json
+from diary import Diary
+from metrics import METRICS, Histogram
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for value in range(1, 101):
+        histogram.add(value)
+    summary = histogram.summary()
+    assert (summary["p50"], summary["p95"], summary["p99"], summary["max"]) == (51, 96, 100, 100)
+    assert summary["count"] == 100 and summary["mean"] == 50.5
+
+
+def test_storage_and_search_are_measured(metrics, diary, tmp_path):
+    for i in range(3):
+        diary.create_entry({"title": f"Walk {i}", "content": "Park", "date": "2025-01-01"}, "user1")
+    diary.search_by_keyword("park", "user1")
+    diary.search("user1", keyword="walk", date="2025-01-01")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["histograms"]["diary.create_entry"]["count"] == 3
+    assert snapshot["histograms"]["storage.save_entries"]["count"] == 4
+    assert snapshot["histograms"]["diary.search_by_keyword.scanned_entries"]["max"] == 3
+    assert snapshot["histograms"]["diary.search.scanned_entries"]["max"] == 3
+    assert snapshot["counters"]["storage.bytes_written"] > 0
+    assert snapshot["counters"]["storage.bytes_read"] > 0
+    assert "diary.create_entry" in metrics.report()
+
+    path = tmp_path / "metrics.json"
+    metrics.dump(str(path))
+    assert json.loads(path.read_text())["counters"] == snapshot["counters"]
+
+
+def test_nothing_is_recorded_when_disabled(store):
+    METRICS.reset()
+    store.add_user("user1", "pw")
+    Diary(store).create_entry({"title": "Walk", "content": "", "date": "2025-01-01"}, "user1")
+    assert METRICS.snapshot()["histograms"] == {} and METRICS.snapshot()["counters"] == {}
+    assert "off" in METRICS.report()
@@ -0,0 +1,136 @@
+import json
+import os
+import tracemalloc
+import pytest
+import migrations
+from integrity import entry_checksum
+from storage import DiaryStorage
+from migrations import MIGRATIONS, SCHEMA_VERSION, FileMigration, Migration, UserStream
+
+
+def legacy_users(count):
+    return {f"user{i}": {"password": "pw", "entries": {
+        "2025-01-02": {"title": f"Second {i}", "content": "b " * 40, "date": "2025-01-02"},
+        "2025-01-01": {"title": f"First {i}", "content": "a", "date": "2025-01-01"}
+    }} for i in range(count)}
+
+
+@pytest.fixture
+def legacy_file(tmp_path):
+    path = tmp_path / "diary.json"
+    path.write_text(json.dumps(legacy_users(10), indent=4))
+    return str(path)
+
+
+def test_user_stream_reads_one_record_at_a_time(legacy_file):
+    with open(legacy_file) as f:
+        stream = UserStream(f, chunk_size=7)
+        users = dict(stream)
+    assert users == legacy_users(10)
+    assert stream.version == 0
+
+
+def test_migration_writes_the_version_header(legacy_file):
+    assert FileMigration(legacy_file, chunk_size=50).run() == 10
+    with open(legacy_file) as f:
+        data = json.load(f)
+    assert data["schema_version"] == SCHEMA_VERSION
+    assert data["users"]["user3"]["entries"]["1"]["title"] == "First 3"
+    assert data["users"]["user3"]["next_id"] == 3
+
+    storage = DiaryStorage(filename=legacy_file)
+    assert storage.list_entries("user9")["2"]["title"] == "Second 9"
+
+
+def test_interrupted_migration_resumes_from_its_checkpoint(legacy_file, monkeypatch):
+    upgraded = []
+
+    def add_mood(record):
+        if len(upgraded) == 5 and not os.environ.get("RESUMED"):
+            raise KeyboardInterrupt
+        upgraded.append(record["password"])
+        record["mood"] = "unknown"
+    monkeypatch.setitem(MIGRATIONS, SCHEMA_VERSION + 1, Migration(SCHEMA_VERSION + 1, "Add moods", add_mood))
+
+    job = FileMigration(legacy_file, target=SCHEMA_VERSION + 1, checkpoint_every=2)
+    with pytest.raises(KeyboardInterrupt):
+        job.run()
+    assert os.path.exists(job.checkpoint_filename) and os.path.exists(job.output_filename)
+
+    monkeypatch.setenv("RESUMED", "1")
+    assert job.run() == 10
+    # The last checkpoint fell inside the fifth user, so its record is upgraded again and only the
+    # rest of it is written
+    assert len(upgraded) == 5 + 6
+    assert not os.path.exists(job.checkpoint_filename)
+    with open(legacy_file) as f:
+        data = json.load(f)
+    assert data["schema_version"] == SCHEMA_VERSION + 1
+    assert all(record["mood"] == "unknown" for record in data["users"].values())
+    assert len(data["users"]) == 10
+
+
+def test_dry_run_reports_without_changing_the_file(legacy_file):
+    before = open(legacy_file).read()
+    plan = FileMigration(legacy_file).dry_run()
+    assert open(legacy_file).read() == before
+    assert (plan["from_version"], plan["to_version"], plan["users"]) == (0, SCHEMA_VERSION, 10)
+    assert plan["steps"] == ["Key entries by a stable id instead of their date"]
+    assert 0 < plan["largest_user_bytes"] < plan["output_bytes"]
+
+    FileMigration(legacy_file).run()
+    assert os.path.getsize(legacy_file) == plan["output_bytes"]
+
+
+def test_newer_files_are_refused(tmp_path):
+    path = tmp_path / "diary.json"
+    path.write_text(json.dumps({"schema_version": SCHEMA_VERSION + 1, "users": legacy_users(1)}))
+    with pytest.raises(ValueError, match="newer"):
+        DiaryStorage(filename=str(path))
+
+
+@pytest.fixture
+def single_user_file(tmp_path):
+    entries = {f"2024-{i // 28 + 1:02d}-{i % 28 + 1:02d}": {"title": f"Day {i}", "content": f"{i} " + "x" * 2000}
+               for i in range(300)}
+    path = tmp_path / "diary.json"
+    path.write_text(json.dumps({"solo": {"password": "pw", "entries": entries}}, indent=4))
+    return str(path)
+
+
+def test_a_single_user_is_migrated_one_entry_at_a_time(single_user_file):
+    size = os.path.getsize(single_user_file)
+    tracemalloc.start()
+    try:
+        assert FileMigration(single_user_file, chunk_size=4096).run() == 1
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < size / 2  # the whole record took several times the file size
+    entries = DiaryStorage(filename=single_user_file).list_entries("solo")
+    assert len(entries) == 300 and entries["1"]["title"] == "Day 0" and entries["300"]["title"] == "Day 299"
+
+
+def test_interrupted_migration_resumes_in_the_middle_of_a_user(single_user_file, tmp_path, monkeypatch):
+    expected_file = tmp_path / "expected.json"
+    expected_file.write_text(open(single_user_file).read())
+    FileMigration(str(expected_file)).run()
+
+    stamped = []
+
+    def interrupt(entry):
+        if len(stamped) == 150 and not os.environ.get("RESUMED"):
+            raise KeyboardInterrupt
+        stamped.append(entry["id"])
+        return entry_checksum(entry)
+    monkeypatch.setattr(migrations, "entry_checksum", interrupt)
+    job = FileMigration(single_user_file, checkpoint_every=10)
+    with pytest.raises(KeyboardInterrupt):
+        job.run()
+    with open(job.checkpoint_filename) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["users_done"] == 0 and 140 < checkpoint["units_done"] < 160
+
+    monkeypatch.setenv("RESUMED", "1")
+    assert job.run() == 1
+    assert open(single_user_file).read() == expected_file.read_text()
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import pytest
+from diary import Diary
+from mmap_storage import BodyCache, MmapDiaryStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    store = MmapDiaryStorage(filename=str(tmp_path / "diary_index.json"))
+    yield store
+    store.close()
+
+
+def test_save_and_read_single_entry(storage, tmp_path):
+    storage.add_user("user1", "pass123")
+    storage.users["user1"]["entries"]["2025-01-01"] = {"title": "New Year", "content": "Start fresh", "date": "2025-01-01"}
+    storage.users["user1"]["entries"]["2025-01-02"] = {"title": "Day two", "content": "Still going", "date": "2025-01-02"}
+    storage.save_entries()
+
+    reopened = MmapDiaryStorage(filename=str(tmp_path / "diary_index.json"))
+    assert reopened.validate_user("user1", "pass123") is True
+    assert reopened.get_entry("user1", "2025-01-02")["title"] == "Day two"
+    assert reopened.get_entry("user1", "2025-03-03") is None
+    assert sorted(reopened.list_entries("user1")) == ["2025-01-01", "2025-01-02"]
+    reopened.close()
+
+
+def test_edits_and_deletes_leave_dead_bytes(storage):
+    storage.add_user("user1", "pass123")
+    entries = storage.list_entries("user1")
+    entries["2025-01-01"] = {"title": "First", "content": "a" * 50}
+    entries["2025-01-02"] = {"title": "Second", "content": "b" * 50}
+    storage.save_entries()
+    assert storage.dead_bytes == 0
+
+    entries["2025-01-01"] = {"title": "First", "content": "edited"}
+    del entries["2025-01-02"]
+    storage.save_entries()
+    assert storage.dead_bytes > 0
+    assert "2025-01-02" not in storage.list_entries("user1")
+
+
+def test_compact_reclaims_space(storage):
+    storage.add_user("user1", "pass123")
+    entries = storage.list_entries("user1")
+    for i in range(5):
+        entries["2025-01-01"] = {"title": f"Version {i}", "content": "x" * 100}
+        storage.save_entries()
+    size_before = os.path.getsize(storage.data_filename)
+
+    reclaimed = storage.compact()
+    assert reclaimed > 0
+    assert storage.dead_bytes == 0
+    assert os.path.getsize(storage.data_filename) < size_before
+    assert storage.get_entry("user1", "2025-01-01")["title"] == "Version 4"
+
+
+def test_body_cache_is_safe_for_concurrent_readers():
+    cache = BodyCache(max_entries=1)
+    cache.put((0, 10), {"id": 1})
+    looked_up = threading.Event()
+
+    class SlowRecords(OrderedDict):
+        # Pause a reader between finding a record and moving it to the end
+        def get(self, key, default=None):
+            entry = super().get(key, default)
+            looked_up.set()
+            time.sleep(0.05)
+            return entry
+
+    cache.records = SlowRecords(cache.records)
+    results = []
+    reader = threading.Thread(target=lambda: results.append(cache.get((0, 10))))
+    reader.start()
+    looked_up.wait(1)
+    cache.put((10, 10), {"id": 2})  # evicts the record being read, unless it waits for the reader
+    reader.join()
+    assert results == [{"id": 1}]
+    assert list(cache.records) == [(10, 10)]
+
+
+def test_summaries_are_served_without_reading_bodies(tmp_path, monkeypatch):
+    path = str(tmp_path / "diary_index.json")
+    store = MmapDiaryStorage(filename=path)
+    store.add_user("user1", "pass123")
+    Diary(store).create_entry({"title": "Walk", "content": "A long   walk\nby the sea", "date": "2025-01-01"}, "user1")
+    Diary(store).create_entry({"title": "Rain", "content": "Wet", "date": "2025-01-02"}, "user1")
+    store.close()
+
+    reopened = MmapDiaryStorage(filename=path, body_cache_size=1)
+    reads = []
+    read_record = reopened.read_record
+    monkeypatch.setattr(reopened, "read_record", lambda *args: reads.append(args) or read_record(*args))
+    diary = Diary(reopened)
+    summary = diary.summaries_on("2025-01-01", "user1")[0]
+    assert (summary.title, summary.words, summary.preview) == ("Walk", 6, "A long walk by the sea")
+    assert diary.entry_counts("2025-01-01", "2025-01-31", "user1") == {"2025-01-01": 1, "2025-01-02": 1}
+    assert reads == []
+
+    assert diary.get_entry(1, "user1")["content"] == "A long   walk\nby the sea"
+    diary.get_entry(1, "user1")
+    assert (len(reads), reopened.bodies.hits) == (1, 1)
+    diary.get_entry(2, "user1")
+    diary.get_entry(1, "user1")
+    assert len(reads) == 3 and len(reopened.bodies.records) == 1
+    reopened.close()
+
+
+def test_opening_and_saving_an_entry_reads_only_its_body(tmp_path, metrics):
+    path = str(tmp_path / "diary_index.json")
+    store = MmapDiaryStorage(filename=path)
+    store.add_user("user1", "pass123")
+    diary = Diary(store)
+    for i in range(200):
+        diary.create_entry({"title": f"Entry {i}", "content": f"Walk number {i} along the river. " * 60,
+                            "date": f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}"}, "user1")
+    diary.related_entries(1, "user1")
+    diary.close()
+    body_size = len(store.get_entry("user1", "1")["content"])
+
+    # What the main window does on start and when a day is opened, edited and saved
+    metrics.reset()
+    diary = Diary(MmapDiaryStorage(filename=path))
+    diary.entry_counts("2025-01-01", "2025-01-31", "user1")
+    summary = diary.summaries_on("2025-01-01", "user1")[0]
+    entry = diary.get_entry(summary["id"], "user1")
+    diary.related_entries(entry["id"], "user1")
+    diary.complete_titles("entry 1", "user1")
+    diary.create_entry(dict(entry.to_dict(), content="Rain all day."), "user1")
+    diary.related_entries(entry["id"], "user1")
+    diary.create_entry({"title": "New", "content": "A new entry.", "date": "2025-01-01"}, "user1")
+    # Date and tag searches list summaries, with a preview instead of the body
+    results = diary.search("user1", date="01", date_type="month")
+    assert len(results) == 18 and results[-1].preview.startswith("Walk number")
+    assert len(diary.search_by_date("2025", "user1", "year")) == 201
+    assert diary.search("user1", tag_query="NOT travel")
+    assert metrics.counters["storage.bytes_read"] < 3 * body_size
+    diary.close()
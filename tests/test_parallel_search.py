@@ -0,0 +1,76 @@
+import os
+import pytest
+from diary import Diary
+from storage import DiaryStorage
+from mmap_storage import MmapDiaryStorage
+from parallel_search import ParallelSearcher, search_all_users
+
+
+@pytest.fixture(params=[DiaryStorage, MmapDiaryStorage])
+def store(request, tmp_path):
+    store = request.param(filename=str(tmp_path / "diary.json"))
+    store.add_user("ana", "pw")
+    store.add_user("bob", "pw")
+    diary = Diary(store)
+    diary.create_entry({"title": "Audit", "content": "Budget review", "date": "2024-03-01"}, "ana")
+    diary.create_entry({"title": "Trip", "content": "Budget for the trip", "date": "2023-07-09"}, "ana")
+    diary.create_entry({"title": "Budget", "content": "Numbers", "date": "2024-01-15"}, "bob")
+    diary.create_entry({"title": "Walk", "content": "Park", "date": "2024-03-01"}, "bob")
+    yield store
+    if hasattr(store, "close"):
+        store.close()
+
+
+def test_results_from_all_users_in_date_order(store):
+    results = search_all_users(store, "budget", workers=2)
+    assert [(r["date"], r["username"], r["title"]) for r in results] == [
+        ("2023-07-09", "ana", "Trip"),
+        ("2024-01-15", "bob", "Budget"),
+        ("2024-03-01", "ana", "Audit"),
+    ]
+
+
+def test_date_filters_and_user_selection(store):
+    with ParallelSearcher(store, workers=2, max_in_flight=1) as searcher:
+        assert [r["title"] for r in searcher.search(date="2024-03-01")] == ["Audit", "Walk"]
+        assert [r["title"] for r in searcher.search(date="2024", date_type="year", usernames=["bob"])] == ["Budget", "Walk"]
+        assert [r["title"] for r in searcher.search(date="03", date_type="month")] == ["Audit", "Walk"]
+        assert searcher.partitions(year="2023") == [("2023", "ana")]
+
+
+def test_workers_see_later_saves(store):
+    with ParallelSearcher(store, workers=1) as searcher:
+        assert len(list(searcher.search("park"))) == 1
+        Diary(store).create_entry({"title": "Park again", "content": "", "date": "2025-01-01"}, "ana")
+        results = list(searcher.search("park", include_content=True))
+        assert [r["title"] for r in results] == ["Walk", "Park again"]
+        assert "content" in results[0]
+
+
+def test_workers_read_one_user_without_writing(store):
+    reader = type(store)(filename=store.filename, read_only=True, usernames=["bob"])
+    assert list(reader.users) == ["bob"]
+    with pytest.raises(ValueError):
+        reader.add_user("cat", "pw")
+    if hasattr(reader, "close"):
+        reader.close()
+
+    # A damaged entry is left out of the results, and the file is neither quarantined nor rewritten
+    if isinstance(store, MmapDiaryStorage):
+        with open(store.data_filename, "r+b") as f:
+            data = f.read().replace(b"Budget review", b"Budget REVIEW")
+            f.seek(0)
+            f.write(data)
+        changed = store.data_filename
+    else:
+        with open(store.filename) as f:
+            text = f.read()
+        with open(store.filename, "w") as f:
+            f.write(text.replace("Budget review", "Budget REVIEW"))
+        changed = store.filename
+    with open(changed, "rb") as f:
+        before = f.read()
+    assert [r["title"] for r in search_all_users(store, "budget", workers=1)] == ["Trip", "Budget"]
+    with open(changed, "rb") as f:
+        assert f.read() == before
+    assert not os.path.exists(os.path.splitext(changed)[0] + ".quarantine")
@@ -0,0 +1,43 @@
+import os
+import pstats
+from profiling import Profiler
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_slow_actions_are_written_and_tallied(tmp_path):
+    profiler = Profiler(enabled=True, threshold_ms=0, folder=str(tmp_path))
+    outer_calls = []
+
+    @profiler.profiled("inner")
+    def inner():
+        return busy(20000)
+
+    @profiler.profiled("save")
+    def save():
+        outer_calls.append(1)
+        return inner()
+
+    assert save() == busy(20000)
+    assert [action for action, _, _ in profiler.captures] == ["save"]
+    path = profiler.captures[0][2]
+    assert os.path.exists(path) and pstats.Stats(path).total_calls > 0
+    assert any("busy" in label for label, _ in profiler.top_functions(50))
+
+    # A later session shows what this one saved
+    later = Profiler(folder=str(tmp_path))
+    session = later.last_session()
+    assert session["captures"][0]["action"] == "save"
+    assert "save" in later.report()
+
+
+def test_fast_or_disabled_actions_are_not_captured(tmp_path):
+    profiler = Profiler(enabled=True, threshold_ms=10000, folder=str(tmp_path))
+    profiler.profiled("quick")(busy)(10)
+    off = Profiler(enabled=False, threshold_ms=0, folder=str(tmp_path))
+    off.profiled("off")(busy)(10)
+    assert profiler.captures == [] and off.captures == []
+    assert os.listdir(tmp_path) == []
+    assert "no action" in profiler.report()
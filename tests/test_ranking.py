@@ -0,0 +1,46 @@
+from ranking import SearchIndex, make_snippet, mark_highlights
+
+
+ENTRIES = [
+    {"title": "Groceries", "content": "Bought bread and milk. The coffee was out.", "date": "2025-01-01"},
+    {"title": "Coffee tasting", "content": "Tried three kinds of coffee.", "date": "2025-01-02"},
+    {"title": "Rainy day", "content": "Coffee, coffee, coffee all afternoon.", "date": "2025-01-03"},
+    {"title": "Gym", "content": "Leg day.", "date": "2025-01-04"},
+]
+
+
+def test_title_matches_rank_first(diary):
+    results = diary.search_ranked("coffee", "user1")
+    assert [r["title"] for r in results] == ["Coffee tasting", "Rainy day", "Groceries"]
+    assert results[0]["score"] > results[1]["score"] > results[2]["score"]
+
+
+def test_query_words_match_prefixes_and_all_must_match(diary):
+    assert [r["title"] for r in diary.search_ranked("gro coff", "user1")] == ["Groceries"]
+    assert diary.search_ranked("coffee tea", "user1") == []
+
+
+def test_limit_and_candidates(diary):
+    assert len(diary.search_ranked("coffee", "user1", limit=2)) == 2
+    ids = diary.filter_ids("user1", date="2025-01-03")
+    assert [r["title"] for r in diary.search_ranked("coffee", "user1", candidates=ids)] == ["Rainy day"]
+
+
+def test_index_follows_edits_and_deletes():
+    index = SearchIndex()
+    index.add(1, "Walk", "A walk in the park")
+    index.add(2, "Park", "Picnic")
+    assert [entry_id for _, entry_id in index.score("park")] == [2, 1]
+    index.add(2, "Lunch", "Picnic")
+    index.remove(1)
+    assert index.score("park") == []
+    assert index.vocabulary == ["lunch", "picnic"]
+
+
+def test_snippet_centres_on_matches():
+    text = "filler " * 50 + "the coffee was strong and the coffee was hot " + "filler " * 50
+    snippet, spans = make_snippet(text, {"coffee"}, width=60)
+    assert len(snippet) <= 62
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert [snippet[s:e] for s, e in spans] == ["coffee", "coffee"]
+    assert "[coffee]" in mark_highlights(snippet, spans)
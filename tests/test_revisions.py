@@ -0,0 +1,71 @@
+import json
+from diary import Diary
+from storage import DiaryStorage
+from revisions import make_delta, apply_delta, RetentionPolicy
+
+
+def test_delta_round_trip():
+    old = "line one\nline two\nline three\n"
+    new = "line one\nline 2\nline three\nline four\n"
+    assert apply_delta(new, make_delta(new, old)) == old
+
+
+def test_delta_only_carries_changed_lines():
+    lines = [f"line number {i}\n" for i in range(500)]
+    old = "".join(lines)
+    lines[250] = "edited line\n"
+    new = "".join(lines)
+    delta = make_delta(new, old)
+    assert len(json.dumps(delta)) < 100
+
+
+def test_delta_of_a_one_word_edit_in_a_long_paragraph_is_small():
+    words = [f"word{i}" for i in range(2500)]
+    old = " ".join(words)
+    assert len(old) > 20000 and "\n" not in old
+    words[1200] = "changed"
+    new = " ".join(words)
+    delta = make_delta(new, old)
+    assert len(json.dumps(delta)) < 100
+    assert apply_delta(new, delta) == old
+    # Word-level and line-level changes mixed, with whitespace kept exactly
+    new = "  Intro line\n" + new.replace("word5 ", "word5\t\t") + "\nclosing words  "
+    assert apply_delta(new, make_delta(new, old)) == old
+    assert apply_delta(old, make_delta(old, new)) == new
+
+
+def test_list_diff_and_restore(diary):
+    entry_id = diary.create_entry({"title": "Day", "content": "first draft", "date": "2025-01-01"}, "user1")
+    diary.create_entry({"id": entry_id, "title": "Day", "content": "second draft", "date": "2025-01-01"}, "user1")
+
+    revisions = diary.list_revisions(entry_id, "user1")
+    assert [r["rev"] for r in revisions] == [1]
+    assert revisions[0]["fields"] == ["content"]
+    assert "-first draft" in diary.diff_revisions(entry_id, "user1", 1)
+
+    diary.restore_revision(entry_id, "user1", 1)
+    assert diary.get_entry(entry_id, "user1")["content"] == "first draft"
+    assert diary.get_revision(entry_id, "user1", 2)["content"] == "second draft"
+
+
+def test_deleted_entry_can_be_restored(diary):
+    entry_id = diary.create_entry({"title": "Gone", "content": "soon deleted", "date": "2025-01-02"}, "user1")
+    diary.delete_entry(entry_id, "user1")
+    assert diary.get_entry(entry_id, "user1") is None
+
+    diary.restore_revision(entry_id, "user1", 1)
+    assert diary.get_entry(entry_id, "user1")["content"] == "soon deleted"
+    assert diary.entries_on("2025-01-02", "user1")[0]["id"] == entry_id
+
+
+def test_retention_keeps_newest_revisions(tmp_path):
+    store = DiaryStorage(filename=str(tmp_path / "diary.json"))
+    store.add_user("user1", "pass123")
+    diary = Diary(store, retention=RetentionPolicy(max_revisions=3))
+    entry_id = None
+    for i in range(6):
+        entry_id = diary.create_entry({"id": entry_id, "title": "Day", "content": f"version {i}", "date": "2025-01-03"}, "user1")
+
+    revisions = diary.list_revisions(entry_id, "user1")
+    assert [r["rev"] for r in revisions] == [3, 4, 5]
+    assert diary.get_revision(entry_id, "user1", 3)["content"] == "version 2"
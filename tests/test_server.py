@@ -0,0 +1,121 @@
+import http.client
+import json
+import threading
+import pytest
+from diary import Diary
+from server import make_server
+
+
+@pytest.fixture
+def server(store):
+    server = make_server(Diary(store), port=0, max_workers=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class Client:
+    """Keep-alive JSON client for the tests"""
+
+    def __init__(self, server):
+        self.conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        self.token = None
+
+    def call(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read())
+
+
+def test_register_login_and_crud(server):
+    client = Client(server)
+    assert client.call("POST", "/register", {"username": "ana", "password": "pw"})[0] == 201
+    assert client.call("POST", "/register", {"username": "ana", "password": "pw"})[0] == 409
+    assert client.call("POST", "/login", {"username": "ana", "password": "bad"})[0] == 401
+    assert client.call("GET", "/entries")[0] == 401
+
+    client.token = client.call("POST", "/login", {"username": "ana", "password": "pw"})[1]["token"]
+    status, created = client.call("POST", "/entries", {"title": "Park", "content": "Walk in the park #outside", "date": "2025-05-01"})
+    assert status == 201
+    entry_id = created["id"]
+
+    assert client.call("PUT", f"/entries/{entry_id}", {"title": "Park", "content": "Run in the park", "date": "2025-05-01"})[0] == 200
+    status, entry = client.call("GET", f"/entries/{entry_id}")
+    assert entry["content"] == "Run in the park"
+    assert [e["id"] for e in client.call("GET", "/entries?date=2025-05-01")[1]["entries"]] == [entry_id]
+
+    assert client.call("DELETE", f"/entries/{entry_id}")[0] == 200
+    assert client.call("GET", f"/entries/{entry_id}")[0] == 404
+    assert client.call("PUT", f"/entries/{entry_id}", {"date": "2025-05-01"})[0] == 404
+
+
+def test_search_and_stats(server):
+    client = Client(server)
+    client.call("POST", "/register", {"username": "ana", "password": "pw"})
+    client.token = client.call("POST", "/login", {"username": "ana", "password": "pw"})[1]["token"]
+    client.call("POST", "/entries", {"title": "Coffee", "content": "Good coffee", "date": "2025-05-01", "tags": ["cafe"]})
+    client.call("POST", "/entries", {"title": "Tea", "content": "Green tea", "date": "2025-05-02"})
+
+    results = client.call("GET", "/search?q=coffee")[1]["results"]
+    assert [r["title"] for r in results] == ["Coffee"]
+    # The typo-tolerant table is built by the first fuzzy search (under the write lock), not during reads
+    search_index = server.RequestHandlerClass.service.diary.search_indexes["ana"]
+    assert search_index.fuzzy is None
+    assert [r["title"] for r in client.call("GET", "/search?q=cofee&fuzzy=1")[1]["results"]] == ["Coffee"]
+    assert search_index.fuzzy_ready()
+    assert [r["title"] for r in client.call("GET", "/search?tags=NOT%20cafe")[1]["results"]] == ["Tea"]
+    assert client.call("GET", "/search?tags=AND")[0] == 400
+
+    stats = client.call("GET", "/stats")[1]
+    assert stats["total_entries"] == 2 and stats["total_words"] == 4
+
+
+def test_concurrent_writes_get_distinct_ids(server):
+    setup = Client(server)
+    setup.call("POST", "/register", {"username": "ana", "password": "pw"})
+    token = setup.token = setup.call("POST", "/login", {"username": "ana", "password": "pw"})[1]["token"]
+
+    ids = []
+
+    def write(n):
+        client = Client(server)
+        client.token = token
+        for i in range(10):
+            ids.append(client.call("POST", "/entries", {"title": f"t{n}-{i}", "content": "x", "date": "2025-05-01"})[1]["id"])
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ids) == list(range(1, 41))
+    assert len(setup.call("GET", "/entries")[1]["entries"]) == 40
+
+
+def test_bad_content_length_is_rejected(server):
+    for value in ("abc", "-5"):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        conn.putrequest("POST", "/register")
+        conn.putheader("Content-Length", value)
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 400
+        assert "Content-Length" in json.loads(response.read())["error"]
+        conn.close()
+
+
+def test_idle_connection_gives_its_worker_back(store):
+    server = make_server(Diary(store), port=0, max_workers=1, idle_timeout=0.2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        idle = Client(server)
+        assert idle.call("GET", "/stats")[0] == 401  # the only worker now waits on this kept-alive connection
+        assert Client(server).call("GET", "/stats")[0] == 401
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,146 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from diary import Diary
+from storage import DiaryStorage
+from similar import RelatedIndex
+
+
+ENTRIES = [
+    {"title": "Hiking", "content": "Long hike up the mountain trail, great views.", "date": "2025-01-01"},
+    {"title": "Mountain trip", "content": "Another trail in the mountain, windy views.", "date": "2025-01-02"},
+    {"title": "Baking", "content": "Baked bread and a lemon cake.", "date": "2025-01-03"},
+    {"title": "Cake day", "content": "Lemon cake again, the bread was better.", "date": "2025-01-04"},
+]
+
+
+def test_most_similar_entry_comes_first(diary):
+    related = diary.related_entries(1, "user1", k=2)
+    assert [e["id"] for e in related] == [2]
+    assert 0 < related[0]["score"] <= 1
+    assert diary.related_entries(3, "user1")[0]["id"] == 4
+
+
+def test_related_follows_saves_and_deletes(diary):
+    diary.related_entries(1, "user1")
+    diary.create_entry({"title": "Trail run", "content": "Ran the mountain trail.", "date": "2025-01-05"}, "user1")
+    assert 5 in [e["id"] for e in diary.related_entries(1, "user1")]
+    diary.delete_entry(2, "user1")
+    assert [e["id"] for e in diary.related_entries(1, "user1")] == [5]
+
+
+def test_matches_dense_cosine():
+    index = RelatedIndex()
+    texts = ["a b c apple banana", "apple apple cherry", "banana cherry date", "date elder fig", "fig apple"]
+    for i, text in enumerate(texts, 1):
+        index.add(i, "", text)
+
+    terms = sorted(index.columns, key=index.columns.get)
+    idf = index.idf()
+    dense = np.zeros((len(texts), len(terms)))
+    for row, entry_id in enumerate(range(1, 6)):
+        columns, values = index.rows[entry_id]
+        dense[row, columns] = values * idf[columns]
+    dense /= np.linalg.norm(dense, axis=1, keepdims=True)
+    expected = dense @ dense[1]
+
+    for score, entry_id in index.similar(2, k=4):
+        assert score == pytest.approx(expected[entry_id - 1], rel=1e-5)
+
+
+def test_cache_file_is_reused_until_stale(diary, tmp_path, monkeypatch):
+    # Written when the diary is closed, not on every query or save
+    diary.related_entries(1, "user1")
+    diary.create_entry({"title": "Rest", "content": "Nothing planned.", "date": "2025-01-05"}, "user1")
+    path = str(tmp_path / "diary.related.user1.npz")
+    assert not os.path.exists(path)
+    diary.close()
+    assert os.path.exists(path)
+
+    # A new Diary on the same files loads the rows instead of rebuilding them
+    fresh = Diary(DiaryStorage(filename=str(tmp_path / "diary.json")))
+    monkeypatch.setattr(RelatedIndex, "from_entries", classmethod(lambda cls, entries: pytest.fail("rebuilt")))
+    assert [e["id"] for e in fresh.related_entries(1, "user1", k=1)] == [2]
+    monkeypatch.undo()
+
+    # An entry saved while the rows were not loaded makes the file stale
+    other = Diary(DiaryStorage(filename=str(tmp_path / "diary.json")))
+    other.create_entry({"title": "Mountain hike", "content": "Trail views from the mountain.", "date": "2025-01-06"}, "user1")
+    again = Diary(DiaryStorage(filename=str(tmp_path / "diary.json")))
+    assert 6 in [e["id"] for e in again.related_entries(1, "user1")]
+
+
+def test_related_ready_only_without_a_rebuild(diary, tmp_path, monkeypatch):
+    assert not diary.related_ready("user1")
+    diary.related_entries(1, "user1")
+    assert diary.related_ready("user1")
+    diary.close()
+
+    fresh = Diary(DiaryStorage(filename=str(tmp_path / "diary.json")))
+    monkeypatch.setattr(RelatedIndex, "from_entries", classmethod(lambda cls, entries: pytest.fail("rebuilt")))
+    assert fresh.related_ready("user1")
+    fresh.create_entry({"title": "Rest", "content": "Nothing planned.", "date": "2025-01-05"}, "user1")
+    assert fresh.related_ready("user1")
+
+
+def test_saves_append_rows_until_most_are_dead(monkeypatch):
+    texts = {i: f"word{i} word{i + 1} shared{i % 3} common" for i in range(1, 41)}
+    index = RelatedIndex()
+    for entry_id, text in texts.items():
+        index.add(entry_id, "", text)
+    scores_of = lambda index: {entry_id: round(score, 5) for score, entry_id in index.similar(1, k=50)}
+    index.similar(1)
+    rebuilds = []
+    rebuild = index._rebuild
+    monkeypatch.setattr(index, "_rebuild", lambda: rebuilds.append(1) or rebuild())
+
+    # Edits and new entries only append rows; the next query sees them
+    for entry_id in (2, 3, 41):
+        texts[entry_id] = f"common word1 fresh{entry_id}"
+        index.add(entry_id, "", texts[entry_id])
+    index.remove(4)
+    del texts[4]
+    expected = RelatedIndex()
+    for entry_id, text in texts.items():
+        expected.add(entry_id, "", text)
+    assert scores_of(index) == scores_of(expected)
+    assert rebuilds == [] and index.matrix()[0].tolist().count(-1) == 3
+
+    # Once dead rows outnumber live ones, the arrays are rebuilt from the live rows
+    for entry_id in range(5, 30):
+        index.remove(entry_id)
+        expected.remove(entry_id)
+    assert scores_of(index) == scores_of(expected)
+    assert rebuilds == [1] and -1 not in index.matrix()[0].tolist()
+
+
+def test_edits_after_loading_the_cache_file(tmp_path):
+    index = RelatedIndex()
+    texts = ["kiwi", "lime", "apple banana cherry date elder fig grape", "apple banana melon", "cherry date"]
+    for i, text in enumerate(texts, 1):
+        index.add(i, "", text)
+    index.save(str(tmp_path / "related.npz"))
+    loaded = RelatedIndex.load(str(tmp_path / "related.npz"), "")
+
+    # Loaded rows are views into the file's arrays; rebuilding the arrays moves rows left over them
+    for i in (1, 2, 4):
+        loaded.remove(i)
+        index.remove(i)
+    assert loaded.similar(3) == index.similar(3)
+    assert [row.tolist() for row in loaded.rows[3]] == [row.tolist() for row in index.rows[3]]
+
+
+def test_similar_usernames_get_their_own_cache_files(store, tmp_path):
+    for username in ("ann.lee", "ann_lee"):
+        store.add_user(username, "pw")
+    diary = Diary(store)
+    for username in ("ann.lee", "ann_lee"):
+        diary.create_entry({"title": "Walk", "content": f"Walk of {username}", "date": "2025-01-01"}, username)
+        diary.create_entry({"title": "Walk", "content": f"Walk of {username} again", "date": "2025-01-02"}, username)
+        diary.related_entries(1, username)
+    assert diary._related_cache_path("ann.lee") != diary._related_cache_path("ann_lee")
+    assert diary._related_cache_path("user1") == str(tmp_path / "diary.related.user1.npz")
+    diary.close()
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".npz")]) == 2
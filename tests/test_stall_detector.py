@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import logging
+import time
+from stall_detector import StallDetector
+
+
+class FakeLoop:
+    """Stands in for the Tk event loop: runs after() callbacks on the calling thread"""
+
+    def __init__(self):
+        self.queue = []
+        self.order = itertools.count()
+
+    def after(self, ms, callback):
+        heapq.heappush(self.queue, (time.monotonic() + ms / 1000, next(self.order), callback))
+
+    def run(self, seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            due, _, callback = self.queue[0]
+            if due > time.monotonic():
+                time.sleep(0.002)
+                continue
+            heapq.heappop(self.queue)
+            self.dispatch(callback)
+
+    def dispatch(self, callback):
+        callback()
+
+
+def slow_handler():
+    time.sleep(0.4)
+
+
+def test_stall_is_attributed_to_the_blocking_handler(caplog):
+    loop = FakeLoop()
+    detector = StallDetector(loop.after, interval_ms=20, threshold_ms=150,
+                             is_dispatcher=lambda frame: frame.f_code.co_name == "dispatch")
+    detector.start()
+    loop.after(50, slow_handler)
+    loop.after(60, lambda: None)
+    with caplog.at_level(logging.WARNING, logger="diary.stalls"):
+        loop.run(0.8)
+    detector.stop()
+
+    (handler, stats), = detector.worst()
+    assert handler == "slow_handler"
+    assert stats.count == 1 and 300 <= stats.max_ms < 1000
+    assert "slow_handler" in stats.last_stack
+    assert "slow_handler" in caplog.text
+    assert "slow_handler" in detector.report()
+
+
+def test_no_stalls_on_a_responsive_loop():
+    loop = FakeLoop()
+    detector = StallDetector(loop.after, interval_ms=20, threshold_ms=150)
+    detector.start()
+    loop.run(0.3)
+    detector.stop()
+    assert detector.worst() == []
+    assert "No event-loop stalls" in detector.report()
+
+
+def test_timing_decorators_are_not_named_as_the_handler():
+    from metrics import timed
+
+    @timed("test.decorated_handler")
+    def decorated_handler():
+        slow_handler()
+
+    loop = FakeLoop()
+    detector = StallDetector(loop.after, interval_ms=20, threshold_ms=150,
+                             is_dispatcher=lambda frame: frame.f_code.co_name == "dispatch")
+    detector.start()
+    loop.after(30, decorated_handler)
+    loop.run(0.6)
+    detector.stop()
+    assert detector.worst()[0][0].endswith("decorated_handler")
@@ -1,16 +1,14 @@
 import pytest
-import os
 import json
 from storage import DiaryStorage
 
-TEST_FILE = "test_diary.json"
+@pytest.fixture
+def test_file(tmp_path):
+    return str(tmp_path / "test_diary.json")
 
 @pytest.fixture
-def storage():
-    # make sure no leftover test file
-    if os.path.exists(TEST_FILE):
-        os.remove(TEST_FILE)
-    return DiaryStorage(filename=TEST_FILE)
+def storage(test_file):
+    return DiaryStorage(filename=test_file)
 
 def test_add_and_validate_user(storage):
     storage.add_user("user1", "pass123")
@@ -23,12 +21,26 @@ def test_list_entries_empty(storage):
     entries = storage.list_entries("user2")
     assert entries == {}
 
-def test_save_and_load(storage):
+def test_save_and_load(storage, test_file):
     storage.add_user("user3", "abc")
     storage.users["user3"]["entries"]["01-01-2025"] = {"title": "New Year", "content": "Start fresh"}
     storage.save_entries()
 
     # load a new storage object to check persistence
-    new_storage = DiaryStorage(filename=TEST_FILE)
+    new_storage = DiaryStorage(filename=test_file)
     assert "user3" in new_storage.users
     assert "01-01-2025" in new_storage.users["user3"]["entries"]
+
+
+def test_date_keyed_entries_are_upgraded_to_ids(test_file):
+    with open(test_file, "w") as f:
+        json.dump({"old": {"password": "pw", "entries": {
+            "2025-01-02": {"title": "Second", "content": "b", "date": "2025-01-02"},
+            "2025-01-01": {"title": "First", "content": "a", "date": "2025-01-01"}
+        }}}, f)
+
+    storage = DiaryStorage(filename=test_file)
+    entries = storage.list_entries("old")
+    assert entries["1"]["title"] == "First" and entries["1"]["id"] == 1
+    assert entries["2"]["title"] == "Second"
+    assert storage.users["old"]["next_id"] == 3
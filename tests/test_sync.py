@@ -0,0 +1,81 @@
+import pytest
+from diary import Diary
+from storage import DiaryStorage
+from sync import SyncEngine
+
+
+def open_diary(folder):
+    return Diary(DiaryStorage(filename=str(folder / "diary.json")))
+
+
+@pytest.fixture
+def replicas(tmp_path):
+    (tmp_path / "laptop").mkdir()
+    (tmp_path / "desktop").mkdir()
+    laptop = open_diary(tmp_path / "laptop")
+    laptop.store.add_user("user1", "pw")
+    for day in ("2025-01-01", "2025-01-02", "2025-01-03"):
+        laptop.create_entry({"title": f"Day {day}", "content": "Walk", "date": day}, "user1")
+    desktop = open_diary(tmp_path / "desktop")
+    SyncEngine(laptop, desktop).sync()
+    return laptop, desktop
+
+
+def titles(diary):
+    return sorted(e["title"] for e in diary.store.list_entries("user1").values())
+
+
+def test_first_sync_copies_users_and_entries(replicas, tmp_path):
+    laptop, desktop = replicas
+    assert titles(desktop) == titles(laptop)
+    assert desktop.store.validate_user("user1", "pw")
+    # What was synced is on disk, not only in memory
+    assert titles(open_diary(tmp_path / "desktop")) == titles(laptop)
+
+
+def test_only_changes_since_the_last_sync_are_exchanged(replicas):
+    laptop, desktop = replicas
+    assert SyncEngine(laptop, desktop).sync()["user1"] == {"sent": 0, "received": 0}
+
+    laptop.create_entry({"title": "New on laptop", "content": "", "date": "2025-01-04"}, "user1")
+    desktop.create_entry({"id": 1, "title": "Edited on desktop", "content": "", "date": "2025-01-01"}, "user1")
+    desktop.delete_entry(3, "user1")
+    assert SyncEngine(laptop, desktop).sync()["user1"] == {"sent": 1, "received": 2}
+    assert titles(laptop) == titles(desktop) == ["Day 2025-01-02", "Edited on desktop", "New on laptop"]
+    assert SyncEngine(desktop, laptop).sync()["user1"] == {"sent": 0, "received": 0}
+
+
+def test_concurrent_edits_resolve_the_same_way_on_both_sides(replicas):
+    laptop, desktop = replicas
+    laptop.create_entry({"id": 2, "title": "Laptop version", "content": "", "date": "2025-01-02"}, "user1")
+    desktop.create_entry({"id": 2, "title": "Desktop version", "content": "", "date": "2025-01-02"}, "user1")
+    laptop.delete_entry(1, "user1")
+    desktop.create_entry({"id": 1, "title": "Edited after the delete", "content": "", "date": "2025-01-01"}, "user1")
+    desktop.create_entry({"id": 1, "title": "Edited twice", "content": "", "date": "2025-01-01"}, "user1")
+    SyncEngine(laptop, desktop).sync()
+
+    assert titles(laptop) == titles(desktop)
+    assert "Edited twice" in titles(laptop)  # the later edit (higher clock) wins over the delete
+    winner = [t for t in titles(laptop) if t.endswith("version")]
+    assert len(winner) == 1
+    # The losing version is kept in the revision history of the side that had it
+    loser = "Desktop version" if winner == ["Laptop version"] else "Laptop version"
+    side = desktop if loser == "Desktop version" else laptop
+    revisions = [side.get_revision(2, "user1", rev["rev"]) for rev in side.list_revisions(2, "user1")]
+    assert loser in [rev["title"] for rev in revisions]
+
+
+def test_copied_diary_files_merge_without_duplicates(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    first = open_diary(tmp_path / "a")
+    first.store.add_user("user1", "pw")
+    first.create_entry({"title": "Shared", "content": "", "date": "2025-01-01"}, "user1")
+    (tmp_path / "b" / "diary.json").write_bytes((tmp_path / "a" / "diary.json").read_bytes())
+    second = open_diary(tmp_path / "b")
+    second.create_entry({"title": "Only on b", "content": "", "date": "2025-01-02"}, "user1")
+
+    SyncEngine(first, second).sync()
+    assert titles(first) == titles(second) == ["Only on b", "Shared"]
+    first_state, second_state = first.users_list["user1"]["sync"], second.users_list["user1"]["sync"]
+    assert first_state["replica"] != second_state["replica"]
@@ -0,0 +1,51 @@
+import pytest
+from tags import parse_hashtags, normalize_tags, TagIndex, TagQuery
+
+
+ENTRIES = [
+    {"title": "Office", "content": "Long day #work", "date": "2025-01-01", "tags": "Meetings"},
+    {"title": "Trip", "content": "Flew out #travel #work", "date": "2025-01-02"},
+    {"title": "Sick", "content": "Stayed home #sick", "date": "2025-02-01", "tags": ["work"]},
+    {"title": "Beach", "content": "Sun #travel", "date": "2025-02-02"},
+]
+
+
+def titles(results):
+    return [entry["title"] for entry in results]
+
+
+def test_parse_hashtags():
+    assert parse_hashtags("Went for a #Run, then #coffee. Not a tag: a#b", "#run again") == ["run", "coffee"]
+    assert normalize_tags(" Work, #home ,work") == ["work", "home"]
+
+
+def test_tag_query_operators():
+    index = TagIndex()
+    index.add(1, {"work"})
+    index.add(2, {"work", "travel"})
+    index.add(3, {"travel"})
+    index.add(4, set())
+    assert index.query("work AND travel") == {2}
+    assert index.query("work OR travel") == {1, 2, 3}
+    assert index.query("NOT work") == {3, 4}
+    assert index.query("(work OR travel) NOT travel") == {1}
+    with pytest.raises(ValueError):
+        TagQuery("work AND (travel")
+
+
+def test_search_combines_tags_keyword_and_date(diary):
+    assert titles(diary.search("user1", tag_query="work")) == ["Office", "Trip", "Sick"]
+    assert titles(diary.search("user1", tag_query="work NOT sick")) == ["Office", "Trip"]
+    assert titles(diary.search("user1", tag_query="travel", date="02", date_type="month")) == ["Beach"]
+    assert titles(diary.search("user1", keyword="flew", tag_query="travel OR meetings")) == ["Trip"]
+
+
+def test_tag_index_follows_edits_and_deletes(diary):
+    trip = diary.search("user1", tag_query="travel AND work")[0]
+    trip["content"] = "Flew out #travel"
+    diary.create_entry(trip, "user1")
+    assert titles(diary.search("user1", tag_query="travel AND work")) == []
+
+    diary.delete_entry(trip["id"], "user1")
+    assert titles(diary.search("user1", tag_query="travel")) == ["Beach"]
+    assert ("work", 2) in diary.tag_counts("user1")
@@ -0,0 +1,94 @@
+import random
+from diary import Diary
+from user_cache import CachedDiaryStorage, UserCache
+
+
+def make_store(tmp_path, users=40, entries=10, budget_users=6):
+    path = str(tmp_path / "diary_users.json")
+    store = CachedDiaryStorage(filename=path, budget_bytes=10 ** 9)
+    diary = Diary(store)
+    for u in range(users):
+        store.add_user(f"user{u}", "pw")
+        for i in range(entries):
+            diary.create_entry({"title": f"Entry {i}", "content": "word " * 50, "date": "2025-01-01"}, f"user{u}")
+    user_bytes = store.index["user0"]["bytes"]
+    return CachedDiaryStorage(filename=path, budget_bytes=int(user_bytes * budget_users * 1.05))
+
+
+def run_workload(store, weights, operations=2000, seed=7):
+    rng = random.Random(seed)
+    diary = Diary(store)
+    names = [f"user{u}" for u in range(len(weights))]
+    written = {}
+    for step in range(operations):
+        username = rng.choices(names, weights)[0]
+        if step % 10 == 0:
+            diary.create_entry({"title": "Later", "content": "more", "date": "2025-02-01"}, username)
+            written[username] = written.get(username, 0) + 1
+        else:
+            diary.store.list_entries(username)
+    return written
+
+
+def test_skewed_access_keeps_hot_users_within_budget(tmp_path):
+    store = make_store(tmp_path)
+    written = run_workload(store, [1 / (rank + 1) ** 1.5 for rank in range(40)])
+    stats = store.users.stats()
+    assert stats["evictions"] > 0
+    assert stats["used_bytes"] <= stats["budget_bytes"]
+    assert stats["loaded"] <= 6
+    assert stats["hit_rate"] > 0.6
+
+    # Compared by loads from disk: rebuilding an evicted user's indexes adds lookups that hit
+    uniform = make_store(tmp_path / "uniform")
+    run_workload(uniform, [1] * 40)
+    assert uniform.users.stats()["misses"] > 1.5 * stats["misses"]
+
+    # Every write made it to disk, including those of users evicted while dirty
+    reopened = CachedDiaryStorage(filename=store.filename)
+    for username, count in written.items():
+        assert len(reopened.list_entries(username)) == 10 + count
+
+
+def test_logins_and_user_lists_do_not_load_entries(tmp_path):
+    store = make_store(tmp_path, users=3, entries=1)
+    assert store.validate_user("user1", "pw") and not store.validate_user("user1", "nope")
+    assert "user2" in store.users and "nobody" not in store.users
+    assert list(store.users) == ["user0", "user1", "user2"]
+    assert store.users.stats()["loaded"] == 0
+
+
+def test_dirty_users_are_flushed_before_eviction():
+    flushed = []
+    cache = UserCache(load=lambda name: {"name": name}, flush=lambda name, record: flushed.append(name),
+                      names=["a", "b", "c"], budget_bytes=2, size_of=lambda name, record: 1)
+    cache["a"]
+    cache["b"]
+    cache.mark_dirty("a")
+    cache["c"]
+    assert flushed == ["a"]
+    assert not cache.is_loaded("a") and cache.evictions == 1
+    assert cache["a"] == {"name": "a"} and cache.misses == 4
+
+
+def test_evicting_a_user_drops_its_indexes(tmp_path):
+    store = make_store(tmp_path, users=4, entries=5, budget_users=2)
+    diary = Diary(store)
+    assert len(diary.search_ranked("word", "user0")) == 5 and diary.stats("user0").total_entries == 5
+    for username in ("user1", "user2", "user3"):
+        diary.entries_on("2025-01-01", username)
+    assert not store.users.is_loaded("user0")
+    assert "user0" not in diary.search_indexes and "user0" not in diary.writing_stats
+    assert "user0" not in diary.date_indexes and "user3" in diary.date_indexes
+    # Built again from the reloaded record when the user comes back
+    assert len(diary.search_ranked("word", "user0")) == 5
+
+
+def test_a_changed_user_is_measured_once_written(tmp_path):
+    store = make_store(tmp_path, users=2, entries=1)
+    diary = Diary(store)
+    diary.entries_on("2025-01-01", "user0")
+    before = store.users.sizes["user0"]
+    diary.create_entry({"title": "Long", "content": "word " * 2000, "date": "2025-01-02"}, "user0")
+    assert store.users.sizes["user0"] == store.index["user0"]["bytes"] > before + 10000
+    assert store.users.used_bytes == sum(store.users.sizes.values())
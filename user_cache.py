@@ -0,0 +1,248 @@
+# user_cache.py
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from entry import encode_entry
+from integrity import encode_checked, quarantine
+from metrics import METRICS, timed
+from migrations import SCHEMA_VERSION
+from storage import DiaryStorage, prepare_user
+
+
+class UserCache(MutableMapping):
+    """username -> user record, keeping only recently used users in memory.
+
+    Records are loaded with load(username) on first access and stay in an
+    LRU order. Once the loaded records together take more than budget_bytes,
+    the least recently used users are evicted, and a user marked dirty is
+    written with flush(username, record) first. The size of a record is
+    what size_of(username, record) reports (by default its JSON length), so
+    the budget is an estimate of the memory the records take, not an exact
+    figure. A changed record is measured again once it is written. The most
+    recently used user is never evicted, even if it alone is over the
+    budget. on_evict(username) is called after a user is evicted, so what
+    was built from the record can go with it.
+    """
+
+    def __init__(self, load, flush, names=(), budget_bytes=64 * 1024 * 1024, size_of=None, on_evict=None):
+        self.load = load
+        self.flush = flush
+        self.on_evict = on_evict
+        self.size_of = size_of or (lambda username, record: len(json.dumps(record, default=encode_entry)))
+        self.budget_bytes = budget_bytes
+        self.names = set(names)  # every known user, loaded or not
+        self.records = OrderedDict()  # loaded users, least recently used first
+        self.sizes = {}  # username -> estimated bytes of the loaded record
+        self.dirty = set()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def __getitem__(self, username):
+        with self._lock:
+            record = self.records.get(username)
+            if record is not None:
+                self.records.move_to_end(username)
+                self.hits += 1
+                return record
+            if username not in self.names:
+                raise KeyError(username)
+            self.misses += 1
+            record = self.load(username)
+            self._admit(username, record)
+            return record
+
+    def __setitem__(self, username, record):
+        with self._lock:
+            self.names.add(username)
+            self._admit(username, record)
+            self.dirty.add(username)
+
+    def __delitem__(self, username):
+        with self._lock:
+            if username not in self.names:
+                raise KeyError(username)
+            self.names.discard(username)
+            self.dirty.discard(username)
+            self.records.pop(username, None)
+            self.used_bytes -= self.sizes.pop(username, 0)
+
+    # Membership and iteration only look at the known names, so they never load a record
+    def __contains__(self, username):
+        return username in self.names
+
+    def __iter__(self):
+        return iter(sorted(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_loaded(self, username):
+        return username in self.records
+
+    def mark_dirty(self, username):
+        """Note that a loaded user changed: it is written before it can be evicted, and measured again then"""
+        with self._lock:
+            if username in self.records:
+                self.dirty.add(username)
+
+    def flush_user(self, username):
+        with self._lock:
+            if username in self.dirty:
+                self.flush(username, self.records[username])
+                self.dirty.discard(username)
+                self._measure(username)
+                self._evict()
+
+    def flush_all(self):
+        with self._lock:
+            for username in list(self.dirty):
+                self.flush_user(username)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "loaded": len(self.records),
+                "known": len(self.names),
+                "used_bytes": self.used_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _admit(self, username, record):
+        self.records[username] = record
+        self.records.move_to_end(username)
+        self._measure(username)
+        self._evict()
+
+    def _measure(self, username):
+        size = self.size_of(username, self.records[username])
+        self.used_bytes += size - self.sizes.get(username, 0)
+        self.sizes[username] = size
+
+    # Drop least recently used users until the loaded records fit the budget
+    def _evict(self):
+        while self.used_bytes > self.budget_bytes and len(self.records) > 1:
+            username, record = next(iter(self.records.items()))
+            if username in self.dirty:
+                self.flush(username, record)
+                self.dirty.discard(username)
+            del self.records[username]
+            self.used_bytes -= self.sizes.pop(username)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(username)
+
+
+class CachedDiaryStorage(DiaryStorage):
+    """Storage for hosts with many users: one JSON file per user, loaded through a UserCache.
+
+    The index file (filename) lists every user with their password and
+    the name of their file in the folder next to it, so logins and user
+    lists never load entries. A user's entries are read when first needed
+    and dropped again when the cache is over budget_bytes; save_user()
+    writes only that user's file. The index is rewritten on every save, so
+    its modification time follows the data (parallel search relies on it).
+    Callbacks given to add_evict_listener() hear which users were dropped.
+    """
+
+    def __init__(self, filename="diary_users.json", budget_bytes=64 * 1024 * 1024, read_only=False, usernames=None):
+        self.budget_bytes = budget_bytes
+        self.index = {}  # username -> {"password", "file", "bytes", "schema_version"}
+        self.evict_listeners = []
+        super().__init__(filename, read_only=read_only, usernames=usernames)
+
+    # callback(username) runs whenever a user's entries are dropped from memory
+    def add_evict_listener(self, callback):
+        self.evict_listeners.append(callback)
+
+    def _evicted(self, username):
+        for callback in self.evict_listeners:
+            callback(username)
+
+    # Folder holding the per-user files, e.g. diary_users.d
+    @property
+    def folder(self):
+        return os.path.splitext(self.filename)[0] + ".d"
+
+    def user_filename(self, username):
+        return os.path.join(self.folder, self.index[username]["file"])
+
+    def load_users(self):
+        self.index = {}
+        if os.path.exists(self.filename):
+            with open(self.filename, "r") as f:
+                self.index = json.load(f).get("users", {})
+        if self.usernames is not None:
+            self.index = {username: info for username, info in self.index.items() if username in self.usernames}
+        # A record is measured by the size of its file, which _write_user updates on every write
+        self.users = UserCache(self._load_user, self._write_user, self.index, self.budget_bytes,
+                               lambda username, record: self.index[username].get("bytes", 0), self._evicted)
+        return self.users
+
+    @timed("storage.load_user")
+    def _load_user(self, username):
+        with open(self.user_filename(username), "r") as f:
+            damaged = []
+            record = prepare_user(json.load(f), self.index[username].get("schema_version", 0), damaged)
+            if damaged and not self.read_only:
+                self.quarantine_folder = quarantine(self.user_filename(username), damaged)
+                self.damaged += [dict(part, path=[username] + part["path"]) for part in damaged]
+            METRICS.count("storage.bytes_read", f.tell())
+            return record
+
+    @timed("storage.save_user")
+    def _write_user(self, username, record):
+        if self.read_only:
+            raise ValueError(f"{self.filename} was opened read-only")
+        data = json.dumps(record, indent=4, default=encode_checked)
+        METRICS.count("storage.bytes_written", len(data))
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.user_filename(username)
+        with open(path + ".tmp", "w") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        self.index[username]["bytes"] = len(data)
+        self.index[username]["schema_version"] = SCHEMA_VERSION
+        self._write_index()
+
+    # The index is replaced atomically so a crash never leaves it half-written
+    def _write_index(self):
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump({"users": self.index}, f, indent=4)
+        os.replace(tmp_filename, self.filename)
+
+    # Writes every user changed since it was loaded
+    def save_entries(self, users=None):
+        self.users.flush_all()
+
+    def save_user(self, username):
+        self.users.mark_dirty(username)
+        self.users.flush_user(username)
+
+    def add_user(self, username, password):
+        if username in self.index:
+            return
+        safe_name = re.sub(r"[^\w-]", "_", username)
+        taken = {info["file"] for info in self.index.values()}
+        file_name, suffix = f"{safe_name}.json", 1
+        while file_name in taken:
+            suffix += 1
+            file_name = f"{safe_name}.{suffix}.json"
+        self.index[username] = {"password": password, "file": file_name, "bytes": 0}
+        self.users[username] = {"password": password, "entries": {}, "next_id": 1}
+        self.users.flush_user(username)
+
+    # Passwords are in the index, so a login doesn't load the user's entries
+    def validate_user(self, username, password):
+        return username in self.index and self.index[username]["password"] == password